@@ -59,6 +59,87 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 RAW_DATA_DIR = DATA_DIR / "raw"
 PROCESSED_DATA_DIR = DATA_DIR / "processed"
 
+# Индексация эмбеддингов
+EMBEDDINGS_BATCH_SIZE = int(os.environ.get("EMBEDDINGS_BATCH_SIZE", "50"))
+# "single" — один документ на продукт, "fields" — отдельные векторы для полей продукта
+EMBEDDINGS_MODE = os.environ.get("EMBEDDINGS_MODE", "single")
+EMBEDDING_FIELD_WEIGHTS = {
+    "identity": float(os.environ.get("EMBEDDING_WEIGHT_IDENTITY", "1.0")),
+    "visual": float(os.environ.get("EMBEDDING_WEIGHT_VISUAL", "0.8")),
+    "attributes": float(os.environ.get("EMBEDDING_WEIGHT_ATTRIBUTES", "0.6")),
+    "description": float(os.environ.get("EMBEDDING_WEIGHT_DESCRIPTION", "0.4")),
+}
+# LRU-кэш результатов векторного поиска (записей)
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "512"))
+
+# Граф похожих товаров (top-k соседей на продукт)
+SIMILAR_PRODUCTS_K = int(os.environ.get("SIMILAR_PRODUCTS_K", "12"))
+# Задержка (сек) записи графа похожих товаров после инкрементальных правок (0 — писать сразу)
+SIMILAR_PRODUCTS_SAVE_DELAY = float(os.environ.get("SIMILAR_PRODUCTS_SAVE_DELAY", "30"))
+
+# Консультант: пул потоков для ChromaDB/SQLite в async-пайплайне
+CONSULTANT_IO_WORKERS = int(os.environ.get("CONSULTANT_IO_WORKERS", "8"))
+# Нативный async-клиент Gemini (gRPC). С REST-транспортом вызовы идут через пул потоков
+GEMINI_ASYNC_CLIENT = os.environ.get("GEMINI_ASYNC_CLIENT", "false").lower() in {"1", "true", "yes", "y"}
+# Изображения товаров в контексте чата: общий дедлайн загрузки (сек) и кэш миниатюр
+CHAT_IMAGE_DEADLINE = float(os.environ.get("CHAT_IMAGE_DEADLINE", "2.5"))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get("THUMBNAIL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+THUMBNAIL_DISK_CACHE = os.environ.get("THUMBNAIL_DISK_CACHE", "true").lower() in {"1", "true", "yes", "y"}
+# Быстрый путь консультанта для запросов-артикулов/названий:
+# "llm" — без векторного поиска, но с генерацией (по умолчанию), "template" — ответ по шаблону без LLM, "off"
+QUERY_FAST_PATH = os.environ.get("QUERY_FAST_PATH", "llm").lower()
+# История чата: бюджет токенов несуммаризированной истории и число последних ходов, идущих в Gemini как есть
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_KEEP_TURNS = int(os.environ.get("HISTORY_KEEP_TURNS", "3"))
+# Семантический кэш ответов консультанта (по близости эмбеддингов запросов)
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "false").lower() in {"1", "true", "yes", "y"}
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95"))
+# Бюджет времени локального реранкера (мс)
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "15"))
+# Бюджет токенов на описание товаров в промпте консультанта
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "2500"))
+# Если поиск с извлеченными фильтрами вернул меньше товаров — повтор без них
+FILTER_MIN_RESULTS = int(os.environ.get("FILTER_MIN_RESULTS", "3"))
+# Пул живых Gemini-сессий чата (0 — отключить) и время простоя сессии (сек)
+CHAT_SESSION_POOL_SIZE = int(os.environ.get("CHAT_SESSION_POOL_SIZE", "256"))
+CHAT_SESSION_TTL = float(os.environ.get("CHAT_SESSION_TTL", "1800"))
+# Пользовательские изображения (чат, поиск по фото): длинная сторона и качество JPEG
+IMAGE_MAX_EDGE = int(os.environ.get("IMAGE_MAX_EDGE", "1536"))
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "85"))
+# Кэш Gemini-анализа фото для поиска по изображению (sha256 + dHash)
+VISION_CACHE_ENABLED = os.environ.get("VISION_CACHE_ENABLED", "true").lower() in {"1", "true", "yes", "y"}
+VISION_CACHE_MAX_ENTRIES = int(os.environ.get("VISION_CACHE_MAX_ENTRIES", "5000"))
+VISION_CACHE_MAX_AGE_DAYS = float(os.environ.get("VISION_CACHE_MAX_AGE_DAYS", "30"))
+# Максимальное расстояние Хэмминга dHash для почти одинаковых фото (0 — только точное совпадение)
+VISION_CACHE_MAX_DISTANCE = int(os.environ.get("VISION_CACHE_MAX_DISTANCE", "4"))
+# Локальный визуальный индекс в поиске по фото:
+# "blend" — смешивать с результатами анализа Gemini, "visual" — только индекс (без API), "off"
+VISUAL_SEARCH_MODE = os.environ.get("VISUAL_SEARCH_MODE", "blend").lower()
+VISUAL_BLEND_WEIGHT = float(os.environ.get("VISUAL_BLEND_WEIGHT", "0.3"))
+# Миниатюры текстур для визуального reranking в поиске по фото
+TEXTURE_THUMB_SIZE = int(os.environ.get("TEXTURE_THUMB_SIZE", "384"))
+TEXTURE_THUMB_CACHE_MAX_BYTES = int(os.environ.get("TEXTURE_THUMB_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Как часто (сек) проверять data/downloads на новые текстуры
+TEXTURE_INDEX_REFRESH = float(os.environ.get("TEXTURE_INDEX_REFRESH", "60"))
+# Поиск по фото: пул кандидатов векторного поиска, сколько из них сравнивать через Gemini,
+# время жизни и число токенов для постраничной выдачи
+IMAGE_SEARCH_CANDIDATES = int(os.environ.get("IMAGE_SEARCH_CANDIDATES", "60"))
+VISION_RERANK_POOL = int(os.environ.get("VISION_RERANK_POOL", "10"))
+IMAGE_SEARCH_TOKEN_TTL = float(os.environ.get("IMAGE_SEARCH_TOKEN_TTL", "1800"))
+IMAGE_SEARCH_TOKEN_MAX = int(os.environ.get("IMAGE_SEARCH_TOKEN_MAX", "500"))
+# Одновременных запросов к Gemini Vision на процесс и файлов в пакетном поиске по фото
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "4"))
+IMAGE_BATCH_MAX_FILES = int(os.environ.get("IMAGE_BATCH_MAX_FILES", "20"))
+# Коллекция векторов изображений товаров для поиска "фото -> товар" без анализа Gemini:
+# "off", "local" (детерминированный CPU-эмбеддер) или "vertex" (multimodalembedding@001)
+IMAGE_EMBEDDINGS_BACKEND = os.environ.get("IMAGE_EMBEDDINGS_BACKEND", "off").lower()
+VERTEX_PROJECT = os.environ.get("VERTEX_PROJECT", "")
+VERTEX_LOCATION = os.environ.get("VERTEX_LOCATION", "us-central1")
+# Токен доступа Vertex AI (если пуст — учетные данные google-auth по умолчанию)
+VERTEX_ACCESS_TOKEN = os.environ.get("VERTEX_ACCESS_TOKEN", "")
+
 # Создаём директории если не существуют
 for directory in [DATA_DIR, RAW_DATA_DIR, PROCESSED_DATA_DIR]:
     directory.mkdir(parents=True, exist_ok=True)
@@ -3,7 +3,7 @@
 import { useState, useRef, useEffect } from 'react';
 import { Send, X, MessageCircle, Sparkles, Loader2, Image as ImageIcon } from 'lucide-react';
 import { cn } from '@/lib/utils'; // Assuming standard shadcn/ui utils
-import { sendMessage, ChatMessage, Product } from './api';
+import { streamMessage, ChatMessage, Product } from './api';
 import Image from 'next/image';
 
 // --- Types ---
@@ -43,18 +43,35 @@ export function ChatWidget({ className }: ChatWidgetProps) {
         try {
             // Prepare history for API (exclude initial greeting if generic)
             const history = messages.slice(1);
-            const response = await sendMessage(userMsg.content, history);
-
-            const aiMsg: ChatMessage = {
-                role: 'assistant',
+            let streamed = '';
+            // Пустое сообщение ассистента, которое заполняется по мере прихода токенов
+            setMessages(prev => [...prev, { role: 'assistant', content: '' }]);
+            const updateLast = (patch: Partial<ChatMessage>) => setMessages(prev => {
+                const next = [...prev];
+                next[next.length - 1] = { ...next[next.length - 1], ...patch };
+                return next;
+            });
+
+            const response = await streamMessage(userMsg.content, history, {
+                onDelta: (text) => {
+                    streamed += text;
+                    setIsLoading(false);
+                    updateLast({ content: streamed });
+                },
+            });
+
+            updateLast({
                 content: response.answer,
                 products: response.products,
                 image: response.simulation_image
-            };
-            setMessages(prev => [...prev, aiMsg]);
+            });
         } catch (error) {
             console.error(error);
-            setMessages(prev => [...prev, { role: 'assistant', content: 'Прошу прощения, произошла ошибка. Пожалуйста, попробуйте еще раз.' }]);
+            const errorMsg: ChatMessage = { role: 'assistant', content: 'Прошу прощения, произошла ошибка. Пожалуйста, попробуйте еще раз.' };
+            setMessages(prev => {
+                const last = prev[prev.length - 1];
+                return last?.role === 'assistant' && !last.content ? [...prev.slice(0, -1), errorMsg] : [...prev, errorMsg];
+            });
         } finally {
             setIsLoading(false);
         }
@@ -85,7 +102,7 @@ export function ChatWidget({ className }: ChatWidgetProps) {
 
                     {/* Messages */}
                     <div className="flex-1 overflow-y-auto p-4 space-y-4 bg-[#F8F9FA]">
-                        {messages.map((msg, idx) => (
+                        {messages.map((msg, idx) => (msg.role === 'assistant' && !msg.content) ? null : (
                             <div key={idx} className={cn("flex flex-col max-w-[85%]", msg.role === 'user' ? "self-end items-end" : "self-start items-start")}>
                                 <div
                                     className={cn(
@@ -50,3 +50,62 @@ export async function sendMessage(query: string, history: ChatMessage[] = []): P
         throw error;
     }
 }
+
+export interface StreamHandlers {
+    onProducts?: (products: Product[]) => void;
+    onDelta?: (text: string) => void;
+}
+
+// Server-sent events: products -> delta* -> final
+export async function streamMessage(query: string, history: ChatMessage[] = [], handlers: StreamHandlers = {}): Promise<ChatResponse> {
+    const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            query,
+            history: history.map(h => ({ role: h.role, parts: [h.content] }))
+        }),
+    });
+
+    if (!response.ok || !response.body) {
+        throw new Error(`Error: ${response.statusText}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let final: ChatResponse | null = null;
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            if (!data) continue;
+            const payload = JSON.parse(data);
+
+            if (event === 'products') handlers.onProducts?.(payload.products || []);
+            else if (event === 'delta') handlers.onDelta?.(payload.text || '');
+            else if (event === 'final') final = payload;
+            else if (event === 'error') throw new Error(payload.detail || 'Stream error');
+        }
+    }
+
+    if (!final) {
+        throw new Error('Stream ended without final event');
+    }
+    return final;
+}
@@ -140,10 +140,12 @@ export const api = {
         return res.json();
     },
 
-    async getChatHistory(token?: string): Promise<Array<{ role: 'user' | 'assistant', content: string, products?: Product[] }>> {
+    async getChatHistory(token?: string, beforeId?: number, limit: number = 50): Promise<Array<{ id: number, role: 'user' | 'assistant', content: string, products?: Product[] }>> {
         const headers: HeadersInit = {};
         if (token) headers['Authorization'] = `Bearer ${token}`;
-        const res = await fetch(`${API_BASE_URL}/chat/history/`, { headers });
+        const params = new URLSearchParams({ limit: String(limit) });
+        if (beforeId !== undefined) params.set('before_id', String(beforeId));
+        const res = await fetch(`${API_BASE_URL}/chat/history/?${params}`, { headers });
         if (!res.ok) throw new Error('Failed to fetch chat history');
         return res.json();
     },
@@ -160,6 +162,29 @@ export const api = {
         return res.json();
     },
 
+    async searchByImagePage(file: File, limit: number = 30): Promise<{ products: Product[], searchToken: string | null, total: number }> {
+        const formData = new FormData();
+        formData.append('file', file);
+
+        const res = await fetch(`${API_BASE_URL}/search/?limit=${limit}`, {
+            method: 'POST',
+            body: formData
+        });
+        if (!res.ok) throw new Error('Image search failed');
+        return {
+            products: await res.json(),
+            searchToken: res.headers.get('X-Search-Token'),
+            total: Number(res.headers.get('X-Total-Count') || 0)
+        };
+    },
+
+    async getImageSearchPage(searchToken: string, offset: number, limit: number = 30): Promise<Product[]> {
+        const params = new URLSearchParams({ offset: String(offset), limit: String(limit) });
+        const res = await fetch(`${API_BASE_URL}/search/${encodeURIComponent(searchToken)}?${params}`);
+        if (!res.ok) throw new Error('Image search page expired');
+        return res.json();
+    },
+
     async getProjects(token?: string): Promise<Project[]> {
         const headers: HeadersInit = {};
         if (token) headers['Authorization'] = `Bearer ${token}`;
@@ -0,0 +1,37 @@
+import argparse
+import sys
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.settings import IMAGE_EMBEDDINGS_BACKEND
+from src.api.routes.products import get_catalog
+from src.ai.image_embeddings import ProductImageEmbeddings
+from rich.console import Console
+
+console = Console()
+
+
+def run_build(backend: str, force: bool = False, resume: bool = False, batch_size: int = None):
+    console.print(f"[bold blue]Индексация изображений товаров (backend={backend})...[/bold blue]")
+
+    catalog = get_catalog()
+    console.print(f"Загружено [green]{len(catalog)}[/green] товаров из всех источников.")
+
+    # Тот же батчевый индексатор с чекпоинтом, что и у текстовой коллекции
+    embeddings = ProductImageEmbeddings(backend)
+    embeddings.index_catalog(products_list=catalog, force_reindex=force, batch_size=batch_size, resume=resume)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backend", choices=["local", "vertex"],
+        default=IMAGE_EMBEDDINGS_BACKEND if IMAGE_EMBEDDINGS_BACKEND != "off" else "local"
+    )
+    parser.add_argument("--force", action="store_true", help="Пересоздать коллекцию")
+    parser.add_argument("--resume", action="store_true", help="Продолжить прерванную индексацию")
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+    run_build(args.backend, force=args.force, resume=args.resume, batch_size=args.batch_size)
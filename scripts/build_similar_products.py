@@ -0,0 +1,27 @@
+import argparse
+import sys
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.ai.embeddings import BrickEmbeddings
+from src.ai.similar_products import SimilarProducts
+from rich.console import Console
+
+console = Console()
+
+def run_build(k: int = None, batch_size: int = 256):
+    console.print("[bold blue]Построение графа похожих товаров...[/bold blue]")
+
+    # Векторы уже лежат в ChromaDB, обращений к API эмбеддингов нет
+    embeddings = BrickEmbeddings()
+    similar = SimilarProducts(k=k) if k else SimilarProducts()
+    similar.build(embeddings, batch_size=batch_size)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=None, help="Количество соседей на продукт")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+    run_build(k=args.k, batch_size=args.batch_size)
@@ -0,0 +1,63 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import requests
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.settings import DATA_DIR
+from src.ai.thumbnail_cache import ThumbnailCache
+from src.ai.visual_index import VisualIndex
+from rich.console import Console
+
+console = Console()
+
+
+def iter_images(catalog, thumbnails: ThumbnailCache, download: bool, max_textures: int):
+    """(slug, kind, загрузчик) для главного изображения и локальных текстур каждого товара"""
+    for product in catalog:
+        slug = product.get("slug")
+        if not slug:
+            continue
+
+        url = product.get("main_image") or (product.get("images") or [None])[0]
+        if url:
+            def load_main(url=url):
+                # Те же миниатюры, что у консультанта: после первого прогона без сети
+                data = thumbnails.get(url)
+                if data is None and download:
+                    resp = requests.get(url, timeout=15)
+                    resp.raise_for_status()
+                    data = thumbnails.make_thumbnail(resp.content)
+                    thumbnails.put(url, data)
+                return data
+            yield slug, "main", load_main
+
+        textures_dir = DATA_DIR / "downloads" / slug / "textures"
+        if max_textures and textures_dir.exists():
+            for path in sorted(textures_dir.glob("*.jpg"))[:max_textures]:
+                yield slug, "texture", (lambda path=path: thumbnails.make_thumbnail(path.read_bytes()))
+
+
+def run_build(workers: int = 8, download: bool = True, max_textures: int = 3):
+    console.print("[bold blue]Построение локального визуального индекса...[/bold blue]")
+
+    catalog_path = DATA_DIR / "processed" / "full_catalog.json"
+    with open(catalog_path, 'r', encoding='utf-8') as f:
+        catalog = json.load(f)
+
+    thumbnails = ThumbnailCache(64 * 1024 * 1024, disk_dir=DATA_DIR / "cache" / "thumbnails")
+    index = VisualIndex()
+    index.build(iter_images(catalog, thumbnails, download, max_textures), workers=workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--no-download", action="store_true", help="Только уже закэшированные главные изображения")
+    parser.add_argument("--max-textures", type=int, default=3, help="Текстур на товар (0 — только главное изображение)")
+    args = parser.parse_args()
+    run_build(workers=args.workers, download=not args.no_download, max_textures=args.max_textures)
@@ -1,4 +1,4 @@
-
+import argparse
 import sys
 from pathlib import Path
 
@@ -11,7 +11,7 @@ from rich.console import Console
 
 console = Console()
 
-def run_reindex():
+def run_reindex(resume: bool = False, batch_size: int = None):
     console.print("[bold blue]Начало полного переиндексирования каталога...[/bold blue]")
     
     # 1. Получаем объединенный каталог
@@ -22,10 +22,14 @@ def run_reindex():
     embeddings = BrickEmbeddings()
     
     # 3. Запускаем индексацию
-    # Force reindex to ensure absolute clean slate
-    embeddings.index_catalog(products_list=catalog, force_reindex=True)
+    # Force reindex to ensure absolute clean slate (resume continues an interrupted run)
+    embeddings.index_catalog(products_list=catalog, force_reindex=True, batch_size=batch_size, resume=resume)
     
     console.print("[bold green]✓ Переиндексация завершена успешно![/bold green]")
 
 if __name__ == "__main__":
-    run_reindex()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="Продолжить прерванную переиндексацию")
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+    run_reindex(resume=args.resume, batch_size=args.batch_size)
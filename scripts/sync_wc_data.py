@@ -1,14 +1,14 @@
 
 import requests
 from requests.auth import HTTPBasicAuth
-import json
 import sys
 import os
 import time
 
 # Add project root to path
 sys.path.append(os.getcwd())
-from config.settings import WC_CONSUMER_KEY, WC_CONSUMER_SECRET, WC_BASE_URL, DATA_DIR
+from config.settings import WC_CONSUMER_KEY, WC_CONSUMER_SECRET, WC_BASE_URL
+from src.api.services.woocommerce import WC_CATALOG_PATH, write_wc_catalog
 
 def sync_woocommerce_data():
     print("🚀 Starting WooCommerce Data Sync (Text Only)...")
@@ -63,14 +63,7 @@ def sync_woocommerce_data():
             if not data:
                 break
             
-            for p in data:
-                # Enrich with brand name immediately to save time later
-                p_brands = p.get('brands', []) 
-                # Depends on plugin, sometimes 'brands' is already populated with {id, name}
-                # If not, use brands_map if needed. usually plugin adds it.
-                
-                # Strip unnecessary fields to save space? Nah, keep it compatible.
-                all_products.append(p)
+            all_products.extend(data)
                 
             print(f"   Page {page}: {len(data)} items (Total: {len(all_products)})")
             
@@ -83,19 +76,11 @@ def sync_woocommerce_data():
             time.sleep(2) # retry?
             break
 
-    # 3. Save to file
-    output_file = DATA_DIR / "wc_full_cache.json"
-    
-    final_data = {
-        "updated_at": time.time(),
-        "brands_map": brands_map,
-        "products": all_products
-    }
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(final_data, f, ensure_ascii=False, indent=2)
+    # 3. Normalize once and save the canonical catalog (same format as catalog_sync)
+    # brands_map fills taxonomy names missing from product payloads
+    saved, errors = write_wc_catalog(all_products, brands_map=brands_map)
         
-    print(f"\n✅ Sync Complete! Saved {len(all_products)} products to {output_file}")
+    print(f"\n✅ Sync Complete! Saved {saved} products to {WC_CATALOG_PATH} (errors: {errors})")
     
 if __name__ == "__main__":
     sync_woocommerce_data()
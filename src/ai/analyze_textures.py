@@ -13,6 +13,7 @@ import sys
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from config.settings import GEMINI_API_KEY, DATA_DIR
+from src.ai.texture_index import pick_best_texture
 
 console = Console()
 genai.configure(api_key=GEMINI_API_KEY, transport="rest")
@@ -94,15 +95,8 @@ def analyze_textures(max_products: int = None, resume_from: int = 0):
             img_path = None
             
             if textures_dir.exists():
-                images = list(textures_dir.glob("*.jpg"))
-                if images:
-                    # Приоритет: WF, потом 01
-                    images.sort(key=lambda p: (
-                        0 if "WF" in p.name and "50mm" not in p.name else 1, 
-                        0 if "_01_" in p.name else 1,
-                        p.name
-                    ))
-                    img_path = images[0]
+                # Приоритет: WF, потом 01 (та же логика, что в поиске по фото)
+                img_path = pick_best_texture(textures_dir.glob("*.jpg"))
             
             # Если нет текстур, ишем скриншот-превью
             if not img_path:
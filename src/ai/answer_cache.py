@@ -0,0 +1,144 @@
+"""
+Семантический кэш ответов консультанта.
+
+Ключ — эмбеддинг запроса: новый запрос, косинусно близкий к закэшированному
+(в той же области: фильтр источников + версия каталога/индекса), получает
+сохраненный ответ со списком товаров без поиска и генерации.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# Запросы, которые явно продолжают разговор ("а подешевле?", "покажи его в белом"), не кэшируются
+_FOLLOW_UP_RE = re.compile(
+    r'(?i)\b(?:он|она|оно|они|его|её|ее|их|этот|эта|это|эти|этого|этой|такой же|такие же|'
+    r'тот|та|те|ещ[её]|подешевле|дешевле|дороже|побольше|поменьше|другой|другие|вариант[ыа]?|'
+    r'первый|второй|третий|it|this|that|these|those|cheaper|another|other)\b|^\s*(?:а|и|и ещ[её])\b'
+)
+
+
+def is_standalone_query(query: str) -> bool:
+    """Запрос понятен без истории разговора"""
+    return not _FOLLOW_UP_RE.search(query)
+
+
+class SemanticAnswerCache:
+    """LRU + TTL кэш ответов с поиском по косинусной близости эмбеддинга запроса"""
+
+    def __init__(self, maxsize: int, ttl: float, threshold: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        # scope -> OrderedDict(entry_id -> entry); матрица векторов области строится лениво
+        self._scopes: Dict[Hashable, "OrderedDict[int, Dict]"] = {}
+        self._matrices: Dict[Hashable, Tuple[List[int], np.ndarray]] = {}
+        self._size = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.similarity_sum = 0.0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _expire(self, now: float):
+        for scope in list(self._scopes):
+            entries = self._scopes[scope]
+            expired = [eid for eid, e in entries.items() if now - e["created"] > self.ttl]
+            for eid in expired:
+                del entries[eid]
+                self._size -= 1
+            if expired:
+                self._matrices.pop(scope, None)
+            if not entries:
+                del self._scopes[scope]
+
+    def _evict(self):
+        while self._size > self.maxsize:
+            # Самая старая запись среди областей
+            scope = min(self._scopes, key=lambda s: next(iter(self._scopes[s].values()))["last_used"])
+            self._scopes[scope].popitem(last=False)
+            self._matrices.pop(scope, None)
+            self._size -= 1
+            if not self._scopes[scope]:
+                del self._scopes[scope]
+
+    def get(self, vector, scope: Hashable) -> Optional[Dict]:
+        now = time.time()
+        query = self._normalize(vector)
+        with self._lock:
+            self._expire(now)
+            entries = self._scopes.get(scope)
+            if not entries:
+                self.misses += 1
+                return None
+            if scope not in self._matrices:
+                ids = list(entries)
+                self._matrices[scope] = (ids, np.vstack([entries[i]["vector"] for i in ids]))
+            ids, matrix = self._matrices[scope]
+            if matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            sims = matrix @ query
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            entry = entries[ids[best]]
+            entry["last_used"] = now
+            entries.move_to_end(ids[best])
+            self.hits += 1
+            self.similarity_sum += similarity
+            return {
+                "query": entry["query"],
+                "answer": entry["answer"],
+                "products": [dict(p) for p in entry["products"]],
+                "similarity": similarity
+            }
+
+    def put(self, vector, scope: Hashable, query: str, answer: str, products: List[Dict]):
+        now = time.time()
+        with self._lock:
+            entries = self._scopes.setdefault(scope, OrderedDict())
+            entries[self._next_id] = {
+                "vector": self._normalize(vector),
+                "query": query,
+                "answer": answer,
+                "products": [dict(p) for p in products],
+                "created": now,
+                "last_used": now
+            }
+            self._next_id += 1
+            self._size += 1
+            self._matrices.pop(scope, None)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+            self._matrices.clear()
+            self._size = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "avg_hit_similarity": round(self.similarity_sum / self.hits, 4) if self.hits else None
+            }
@@ -0,0 +1,81 @@
+"""
+Пул живых Gemini-сессий чата по пользователям.
+
+Сессия переиспользуется, пока версия истории в SQLite (последнее сообщение +
+граница summary) совпадает с той, на которой сессия закончила прошлый ход.
+После вытеснения, рестарта, очистки истории или обновления summary сессия
+собирается заново из хранилища.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+from rich.console import Console
+
+console = Console()
+
+
+class ChatSessionPool:
+    """LRU живых сессий с TTL простоя и ограничением числа записей"""
+
+    def __init__(self, maxsize: int, ttl: float, max_tokens: Optional[int] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Сессия, распухшая сверх лимита (summary не успевает), пересобирается
+        self.max_tokens = max_tokens
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def acquire(self, user_id: str, version: Hashable):
+        """
+        Забирает сессию пользователя из пула (на время хода она принадлежит вызывающему).
+        None — сессии нет, она устарела или история в хранилище изменилась.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.pop(user_id, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            if now - entry["last_used"] > self.ttl or entry["version"] != version:
+                self.stale += 1
+                return None
+            if self.max_tokens and entry["tokens"] > self.max_tokens:
+                self.stale += 1
+                return None
+            self.hits += 1
+            return entry["chat"], entry["tokens"]
+
+    def release(self, user_id: str, chat, version: Hashable, tokens: int):
+        """Возвращает сессию в пул с версией истории после сохраненного хода"""
+        now = time.time()
+        with self._lock:
+            self._sessions[user_id] = {"chat": chat, "version": version, "tokens": tokens, "last_used": now}
+            self._sessions.move_to_end(user_id)
+            expired = [u for u, e in self._sessions.items() if now - e["last_used"] > self.ttl]
+            for u in expired:
+                del self._sessions[u]
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses + self.stale
+            return {
+                "sessions": len(self._sessions),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "reuse_ratio": round(self.hits / total, 4) if total else 0.0
+            }
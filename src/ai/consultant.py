@@ -5,7 +5,7 @@ AI-консультант по дизайнерской мебели De-co-de
 
 import json
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Iterator, Tuple
 import google.generativeai as genai
 import PIL.Image
 from rich.console import Console
@@ -14,16 +14,46 @@ from rich.panel import Panel
 from rich.prompt import Prompt
 import sys
 import requests
-import io
-from functools import lru_cache
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, wait
+import httpx
 
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-from config.settings import GEMINI_API_KEY, DATA_DIR
+from config.settings import (
+    GEMINI_API_KEY, DATA_DIR, HTTPX_VERIFY_SSL, CONSULTANT_IO_WORKERS, GEMINI_ASYNC_CLIENT,
+    CHAT_IMAGE_DEADLINE, THUMBNAIL_CACHE_MAX_BYTES, THUMBNAIL_DISK_CACHE, QUERY_FAST_PATH,
+    HISTORY_TOKEN_BUDGET, HISTORY_KEEP_TURNS,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD,
+    RERANK_BUDGET_MS, CONTEXT_TOKEN_BUDGET, FILTER_MIN_RESULTS,
+    CHAT_SESSION_POOL_SIZE, CHAT_SESSION_TTL
+)
 from src.ai.embeddings import BrickEmbeddings
+from src.ai.thumbnail_cache import ThumbnailCache
+from src.ai.query_router import QueryRouter
+from src.ai.mention_matcher import MentionMatcher
+from src.ai.history_compactor import HistoryCompactor, estimate_tokens
+from src.ai.answer_cache import SemanticAnswerCache, is_standalone_query
+from src.ai.reranker import LocalReranker
+from src.ai.filter_extractor import FilterExtractor, QueryFilters, combine_where
+from src.ai.chat_sessions import ChatSessionPool
+from src.ai.image_preprocess import PreparedImage
+from src.ai.context_builder import ContextBuilder
 
 console = Console()
 
+# Ограниченный пул для блокирующих вызовов (ChromaDB, SQLite, PIL) из async-кода
+_io_executor = ThreadPoolExecutor(max_workers=CONSULTANT_IO_WORKERS, thread_name_prefix="consultant-io")
+
+
+async def _run_io(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(func, *args, **kwargs))
+
+# Загрузка изображений товаров в синхронном пайплайне
+_image_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="consultant-img")
+
 
 # Загружаем промпт из внешнего файла
 PROMPT_FILE = Path(__file__).parent.parent.parent / "config" / "consultant_prompt.txt"
@@ -55,7 +85,9 @@ class Consultant:
         self.catalog = {}
         self.slug_map = {}
         
+        catalog_version = None
         if catalog_path.exists():
+            catalog_version = catalog_path.stat().st_mtime_ns
             with open(catalog_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 self.catalog = {p['slug']: p for p in data if p.get('slug')}
@@ -83,9 +115,48 @@ class Consultant:
                              if len(first_word) > 2:
                                  self.slug_map[first_word] = p['slug']
         
+        # Контекст товаров для промпта с бюджетом токенов
+        self.context_builder = ContextBuilder(CONTEXT_TOKEN_BUDGET, catalog_version=catalog_version)
+        
+        # Фильтры запроса по словарям каталога (бренды, категории)
+        self.filter_extractor = FilterExtractor(self.catalog)
+        
+        # Локальный реранкер кандидатов векторного поиска
+        self.reranker = LocalReranker(budget_ms=RERANK_BUDGET_MS)
+        
+        # Автомат для поиска упоминаний товаров в ответах модели
+        self.mentions = MentionMatcher(
+            list(self.slug_map.items()) + [(slug, slug) for slug in self.catalog]
+        )
+        
+        # Быстрый путь для запросов-артикулов и названий
+        self.router = QueryRouter(self.catalog)
+        
+        # Семантический кэш ответов (opt-in)
+        self.answer_cache = SemanticAnswerCache(
+            ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD
+        ) if ANSWER_CACHE_ENABLED else None
+        
+        # Миниатюры изображений товаров (память + диск)
+        self.thumbnails = ThumbnailCache(
+            THUMBNAIL_CACHE_MAX_BYTES,
+            disk_dir=DATA_DIR / "cache" / "thumbnails" if THUMBNAIL_DISK_CACHE else None
+        )
+        
         # Инициализация хранилища истории
         from src.storage.chat_storage import ChatStorage
         self.storage = ChatStorage(DATA_DIR / "chat_history.db")
+        self.compactor = HistoryCompactor(
+            self.storage,
+            genai.GenerativeModel("gemini-3-flash-preview"),
+            token_budget=HISTORY_TOKEN_BUDGET,
+            keep_turns=HISTORY_KEEP_TURNS
+        )
+        
+        # Живые Gemini-сессии по пользователям (0 — собирать из истории каждый ход)
+        self.sessions = ChatSessionPool(
+            CHAT_SESSION_POOL_SIZE, CHAT_SESSION_TTL, max_tokens=HISTORY_TOKEN_BUDGET * 2
+        ) if CHAT_SESSION_POOL_SIZE > 0 else None
         
         console.print("[green]✓ Консультант инициализирован[/green]")
     
@@ -94,110 +165,124 @@ class Consultant:
         """Получить полную информацию о продукте"""
         return self.catalog.get(slug)
     
-    @lru_cache(maxsize=100)
     def _fetch_image(self, url: str) -> Optional[PIL.Image.Image]:
         """Fetch image from URL with caching"""
         if not url:
             return None
+        cached = self.thumbnails.get(url)
+        if cached:
+            return self.thumbnails.to_image(cached)
         try:
             # Add timeout to avoid hanging
-            resp = requests.get(url, timeout=5)
+            resp = requests.get(url, timeout=CHAT_IMAGE_DEADLINE)
             if resp.status_code == 200:
-                img = PIL.Image.open(io.BytesIO(resp.content))
-                img.thumbnail((512, 512)) # Resize to save tokens
-                return img
+                data = self.thumbnails.make_thumbnail(resp.content)
+                self.thumbnails.put(url, data)
+                return self.thumbnails.to_image(data)
         except Exception as e:
             console.print(f"[yellow]Failed to fetch image {url}: {e}[/yellow]")
         return None
 
-    
-    def _format_context(self, products: List[Dict]) -> str:
-        """Форматирует контекст из найденных продуктов"""
-        context_parts = []
-        
-        for p in products:
-            slug = p['slug']
-            details = self._get_product_details(slug)
-            
-            if not details:
-                continue
-            
-            part = f"## {details.get('title', details.get('name', slug))} (арт. {details.get('article', 'N/A')})\n"
-            
-            brand = details.get('brand')
-            if brand:
-                part += f"- Бренд: {brand}\n"
-            
-            price = details.get('price')
-            currency = details.get('currency', '')
-            if price:
-                part += f"- Цена: {price} {currency}\n"
-            
-            if details.get('description'):
-                desc = details['description'].replace('\n', ' ').strip()
-                if len(desc) > 300:
-                    desc = desc[:300] + "..."
-                part += f"- Описание: {desc}\n"
-            
-            # Параметры
-            params = details.get('parameters', {})
-            if params:
-                part += "- Характеристики:\n"
-                for k, v in params.items():
-                    if k != "Цена" and v:
-                        part += f"  - {k}: {v}\n"
-
-            context_parts.append(part)
-        
-        return "\n".join(context_parts)
+    def _fetch_images(self, targets: List[Tuple[Dict, str]]) -> List[Tuple[Dict, Optional[PIL.Image.Image]]]:
+        """
+        Параллельная загрузка изображений с общим дедлайном.
+        Не успевшие изображения пропускаются (загрузка дозаполнит кэш в фоне).
+        """
+        if not targets:
+            return []
+        futures = [_image_executor.submit(self._fetch_image, url) for _, url in targets]
+        done, _ = wait(futures, timeout=CHAT_IMAGE_DEADLINE)
+        result = []
+        for (details, url), future in zip(targets, futures):
+            if future in done:
+                result.append((details, future.result()))
+            else:
+                console.print(f"[yellow]Image deadline exceeded, skipping {url}[/yellow]")
+        return result
 
-    def _extract_filters(self, query: str) -> Optional[Dict]:
-        """Извлекает фильтры из запроса"""
-        # Пока возвращаем None, или можно добавить простую логику
+    async def _fetch_image_async(self, client: httpx.AsyncClient, url: str) -> Optional[PIL.Image.Image]:
+        """Асинхронная загрузка изображения; декодирование — в пуле потоков"""
+        if not url:
+            return None
+        cached = await _run_io(self.thumbnails.get, url)
+        if cached:
+            return self.thumbnails.to_image(cached)
+        try:
+            resp = await client.get(url)
+            if resp.status_code == 200:
+                data = await _run_io(self.thumbnails.make_thumbnail, resp.content)
+                await _run_io(self.thumbnails.put, url, data)
+                return self.thumbnails.to_image(data)
+        except Exception as e:
+            console.print(f"[yellow]Failed to fetch image {url}: {e}[/yellow]")
         return None
 
+    async def _fetch_images_async(self, targets: List[Tuple[Dict, str]]) -> List[Tuple[Dict, Optional[PIL.Image.Image]]]:
+        """Асинхронный вариант _fetch_images: общий дедлайн, опоздавшие загрузки отменяются"""
+        if not targets:
+            return []
+        timeout = httpx.Timeout(CHAT_IMAGE_DEADLINE, connect=min(3.0, CHAT_IMAGE_DEADLINE))
+        async with httpx.AsyncClient(follow_redirects=True, timeout=timeout, verify=HTTPX_VERIFY_SSL) as client:
+            tasks = [asyncio.ensure_future(self._fetch_image_async(client, url)) for _, url in targets]
+            done, pending = await asyncio.wait(tasks, timeout=CHAT_IMAGE_DEADLINE)
+            for task in pending:
+                task.cancel()
+        result = []
+        for (details, url), task in zip(targets, tasks):
+            if task in done:
+                result.append((details, task.result()))
+            else:
+                console.print(f"[yellow]Image deadline exceeded, skipping {url}[/yellow]")
+        return result
 
+    
+    def _format_context(self, products: List[Dict]) -> str:
+        """Форматирует контекст из найденных продуктов в пределах CONTEXT_TOKEN_BUDGET"""
+        return self.context_builder.build(products, self._get_product_details)
 
-    def _rerank_products(self, query: str, products: List[Dict]) -> List[Dict]:
+    def _extract_filters(self, query: str) -> QueryFilters:
+        """Извлекает фильтры из запроса (бренд, категория, цвет, материал, цена, размеры)"""
+        filters = self.filter_extractor.extract(query)
+        if not filters.empty:
+            console.print(
+                f"[dim]Filters ({filters.elapsed_ms:.2f} ms): brands={filters.brands} categories={filters.catalog_categories or sorted(filters.categories)} "
+                f"colors={sorted(filters.colors)} materials={sorted(filters.materials)} "
+                f"price=({filters.price_min}, {filters.price_max}) dims={filters.dimensions}[/dim]"
+            )
+        return filters
+
+    def _rerank_products(self, query: str, products: List[Dict], filters: Optional[QueryFilters] = None) -> List[Dict]:
         """
-        Rerank and filter products using LLM to ensure they match specific constraints (color, material, etc).
+        Rerank products locally (vector distance + lexical overlap + color/material/category/price constraints).
         """
         if not products:
             return []
-            
-        # console.print("[cyan]Running LLM Reranking...[/cyan]")
-        
-        print("[DEBUG] Reranking skipped to avoid hang. Returning top 5.")
-        return products[:5]
-        
-        # prompt = f"""User Query: "{query}"
-        # ...
-        # return products[:5] # Fallback to top 5
+        return self.reranker.rerank(query, products, top_n=5, parsed=self.reranker.parse_query(query, filters))
 
-    def answer(self, query: str, image_path: Optional[str] = None, user_id: str = "default", n_products: int = 5, sources: Optional[List[str]] = None) -> Dict:
-        """
-        Ответить на вопрос пользователя с учетом истории и (опционально) изображения
-        """
-        # 1. Загружаем историю
-        history = self.storage.get_history(user_id, limit=10)
-        
-        # 2. Ищем релевантные продукты
+    def _retrieve(self, query: str, sources: Optional[List[str]] = None, query_embedding: Optional[List[float]] = None) -> List[Dict]:
+        """Векторный поиск + обогащение деталями + rerank"""
         try:
             # Combine filters
-            where_filters = self._extract_filters(query) or {}
+            filters = self._extract_filters(query)
             
             # Add source filter if specified
+            source_clause = None
             if sources:
                 if len(sources) == 1:
-                    where_filters["source"] = sources[0]
+                    source_clause = {"source": sources[0]}
                 else:
-                    where_filters["source"] = {"$in": sources}
+                    source_clause = {"source": {"$in": sources}}
             
-            # If where_filters is empty, set to None
-            if not where_filters:
-                where_filters = None
+            where_filters = combine_where(filters.where_clauses + [source_clause])
+            # С фильтрами по метаданным кандидатов нужно меньше
+            n_results = 10 if filters.where_clauses else 20
+            relevant = self.embeddings.search(query, n_results=n_results, where=where_filters, query_embedding=query_embedding)
             
-            relevant = self.embeddings.search(query, n_results=20, where=where_filters)
+            # Слишком узкий фильтр (или индекс без brand/category/price) — ищем без него
+            if filters.where_clauses and len(relevant) < FILTER_MIN_RESULTS:
+                console.print(f"[dim]Filtered search returned {len(relevant)} products, retrying without extracted filters[/dim]")
+                self.filter_extractor.record_fallback()
+                relevant = self.embeddings.search(query, n_results=20, where=combine_where([source_clause]), query_embedding=query_embedding)
             console.print(f"[dim]Search returned {len(relevant)} raw products (sources={sources})[/dim]")
             
             # Enrich relevant products with details locally first for reranking
@@ -208,7 +293,7 @@ class Consultant:
                         r['details'] = details
             
             # Rerank to get top 5 best matches
-            relevant = self._rerank_products(query, relevant)
+            relevant = self._rerank_products(query, relevant, filters)
         except Exception as e:
             console.print(f"[yellow]Embedding search failed (ignoring): {e}[/yellow]")
             relevant = []
@@ -219,10 +304,26 @@ class Consultant:
                  details = self._get_product_details(r['slug'])
                  if details:
                      r['details'] = details
+        return relevant
+
+    @staticmethod
+    def _image_targets(relevant: List[Dict]) -> List[Tuple[Dict, str]]:
+        """(details, image_url) для продуктов, чьи изображения идут в контекст"""
+        targets = []
+        # Берем топ-3 продукта, чтобы не перегружать контекст
+        for p in relevant[:3]:
+            details = p.get('details', {})
+            image_url = details.get('main_image') or (details.get('images', [])[0] if details.get('images') else None)
+            if image_url:
+                targets.append((details, image_url))
+        return targets
 
+    def _build_message(self, query: str, relevant: List[Dict], image: Optional[PreparedImage] = None, product_images: Optional[List[Tuple[Dict, Optional[PIL.Image.Image]]]] = None):
+        """
+        Формирует сообщение для модели: текст с контекстом + изображения. Возвращает (content, text_part)
+        product_images — уже загруженные изображения (details, img); если None, загружаются здесь
+        """
         context = self._format_context(relevant)
-        
-        # 3. Формируем сообщение для модели
         current_message_content = []
         
         # Текстовая часть запроса
@@ -236,48 +337,31 @@ class Consultant:
 {context}
 """
         current_message_content.append(text_part)
-        print("DEBUG: Prompt sent to LLM:\n" + text_part[:1000] + "...")
 
         # Добавляем изображения продуктов для визуального контекста
-        # Берем топ-3 продукта, чтобы не перегружать контекст
+        if product_images is None:
+            product_images = self._fetch_images(self._image_targets(relevant))
+        
         products_with_images = 0
-        for p in relevant[:3]:
-            details = p.get('details', {})
-            image_url = details.get('main_image') or (details.get('images', [])[0] if details.get('images') else None)
-            
-            if image_url:
-                img = self._fetch_image(image_url)
-                if img:
-                    current_message_content.append(f"\nИзображение для товара {details.get('name')} (Арт. {details.get('article')}):")
-                    current_message_content.append(img)
-                    products_with_images += 1
+        for details, img in product_images:
+            if img:
+                current_message_content.append(f"\nИзображение для товара {details.get('name')} (Арт. {details.get('article')}):")
+                current_message_content.append(img)
+                products_with_images += 1
         
         if products_with_images > 0:
             current_message_content.append("\nВАЖНО: Я предоставил изображения некоторых товаров. Используй их чтобы отвечать на вопросы о внешнем виде, цветах, стиле и форме.")
 
-        image_instruction = ""
-        if image_path:
+        if image:
             image_instruction = "\nПОЛЬЗОВАТЕЛЬ ЗАГРУЗИЛ СВОЕ ФОТО. Проанализируй его в контексте вопроса о мебели/интерьере.\n"
             current_message_content.append(image_instruction)
-            try:
-                img = PIL.Image.open(image_path)
-                current_message_content.append(img)
-            except Exception as e:
-                console.print(f"[red]Error loading user image: {e}[/red]")
-        
-        # 4. Запускаем чат
-        chat = self.chat_model.start_chat(history=history or [])
-        
-        try:
-            response = chat.send_message(current_message_content)
-            response_text = response.text
-        except Exception as e:
-            console.print(f"[red]Chat Error: {e}[/red]")
-            # Retry text only if multimodal failed
-            response = chat.send_message(text_part)
-            response_text = response.text
+            # Уже подготовленный JPEG уходит как есть, без повторного кодирования из PIL
+            current_message_content.append(image.to_part())
         
-        # --- UI Control ---
+        return current_message_content, text_part
+
+    def _resolve_recommendations(self, response_text: str, relevant: List[Dict]):
+        """Разбирает ответ модели: убирает служебные теги и находит рекомендованные товары"""
         import re
         recommended_slugs = []
         
@@ -342,38 +426,10 @@ class Consultant:
                     except Exception:
                         pass
 
-        # 3. Text Extraction Fallback (Safety Net): Find "арт. XXX" in text
-        if not recommended_slugs:
-            # Find all (арт. XXX) or (art. XXX) patterns, optionally with Reference: prefix
-            art_matches = re.findall(r'(?i)(?:арт\.?|art\.?)\s*(?:Reference:?)?\s*([a-z0-9\-\.\s]+?)(?:\)|,|\s{2}|$)', response_text)
-            seen_slugs = set()
-            for art in art_matches:
-                art_lower = art.lower().strip().rstrip('.')
-                # Build possible keys to check
-                possible_keys = [art_lower]
-                if art_lower.startswith('reference:'):
-                    clean = art_lower.replace('reference:', '').strip()
-                    possible_keys.append(clean)
-                    possible_keys.append('reference: ' + clean)
-                # Also try full catalog article matching
-                possible_keys.append('reference: ' + art_lower)
-                
-                for key in possible_keys:
-                    if key in self.slug_map:
-                        slug = self.slug_map[key]
-                        if slug not in seen_slugs:
-                            recommended_slugs.append(slug)
-                            seen_slugs.add(slug)
-                        break
-        
-        # 4. Name-based fallback: Find product names mentioned in text
+        # 3. Fallback: упоминания товаров каталога в тексте (названия, артикулы, slug)
         if not recommended_slugs:
-            for p in relevant[:5]:  # Check top 5 search results
-                details = p.get('details', {})
-                name = details.get('name', '')
-                if name and name.lower() in response_text.lower():
-                    recommended_slugs.append(p['slug'])
-
+            recommended_slugs = self.mentions.slugs(response_text)
+        
         clean_response = clean_response.strip()
         
         final_products = []
@@ -403,23 +459,284 @@ class Consultant:
                  # Return top matches only (limit to 3 to be focused)
                  final_products = high_relevance_products[:3]
              else:
-                 # If nothing is highly relevant, return nothing (better than garbage)
-                 # or return top 1 if it's kinda close?
-                 # Let's return nothing to encourage AI to say "I don't know" or "Not found",
-                 # unless strict mode is off. But user complained about wrong 3 products.
-                 # So returning empty is safer.
+                 # If nothing is highly relevant, return nothing (better than garbage).
+                 # User complained about wrong 3 products, so returning empty is safer.
                  final_products = []
         
+        return clean_response, final_products
+
+    def _load_history(self, user_id: str) -> List[Dict]:
+        """История для Gemini: summary старых ходов + последние ходы (только role/parts)"""
+        return self.compactor.history_for_model(user_id)
+
+    def _open_chat(self, user_id: str) -> Tuple[Any, Tuple, int]:
+        """
+        Чат-сессия для хода: живая из пула, если история в SQLite с прошлого хода
+        не менялась, иначе новая из истории.
+        Возвращает (chat, версия истории, ~токенов истории в сессии).
+        """
+        version = self.storage.history_version(user_id) if self.sessions is not None else None
+        if version is not None:
+            reused = self.sessions.acquire(user_id, version)
+            if reused:
+                chat, tokens = reused
+                console.print(f"[dim]Chat session reused for {user_id} (~{tokens} tokens)[/dim]")
+                return chat, version, tokens
+        history = self._load_history(user_id)
+        tokens = sum(estimate_tokens(" ".join(h["parts"])) for h in history)
+        return self.chat_model.start_chat(history=history or []), version, tokens
+
+    def _close_chat(self, user_id: str, chat, version: Optional[Tuple], tokens: int, query: str, response_text: str, last_id: Optional[int]):
+        """Возвращает сессию в пул после сохранения хода"""
+        if self.sessions is None or version is None or last_id is None:
+            return
+        try:
+            history = chat.history
+            # В сессии, как и в SQLite, остается только текст вопроса:
+            # без контекста товаров и изображений
+            history[-2] = {"role": "user", "parts": [query]}
+            chat.history = history
+        except Exception as e:
+            console.print(f"[yellow]Chat session not reusable: {e}[/yellow]")
+            return
+        tokens += estimate_tokens(query) + estimate_tokens(response_text)
+        # Summary могло обновиться в фоне — тогда версия не совпадет и сессия пересоберется
+        self.sessions.release(user_id, chat, (last_id, version[1]), tokens)
+
+    def _save_turn(self, user_id: str, query: str, response_text: str, final_products: List[Dict]) -> Optional[int]:
         # Extract slugs for persistence
         product_slugs = [p.get('slug') for p in final_products if p.get('slug')]
         
-        self.storage.add_message(user_id, "user", query)
-        self.storage.add_message(user_id, "model", response_text, product_slugs=product_slugs)
+        # Вопрос и ответ пишутся одной транзакцией
+        last_id = self.storage.add_turn(user_id, [
+            ("user", query, None, estimate_tokens(query)),
+            ("model", response_text, product_slugs, estimate_tokens(response_text))
+        ])
+        # Сворачивание старой истории — в фоне, ответ уже готов
+        self.compactor.schedule_refresh(user_id)
+        return last_id
+
+    def _route(self, query: str, image: Optional[PreparedImage] = None, sources: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Быстрый путь: запрос целиком совпадает с артикулом/названием/slug товара.
+        Возвращает карточку товара в формате результатов поиска или None.
+        """
+        match = None
+        if QUERY_FAST_PATH != "off" and not image:
+            match = self.router.match(query)
+            if match:
+                details = self._get_product_details(match.slug)
+                if not details or (sources and details.get('source') not in sources):
+                    match = None
+        
+        route = match.route if match else "llm"
+        self.router.record(route)
+        console.print(f"[dim]Query route: {route}{f' -> {match.slug}' if match else ''}[/dim]")
+        if not match:
+            return None
+        return {"slug": match.slug, "details": self._get_product_details(match.slug), "distance": 0.0}
+
+    @staticmethod
+    def _template_answer(product: Dict) -> str:
+        details = product.get('details', {})
+        name = details.get('title') or details.get('name') or product['slug']
+        text = f"Нашёл товар по вашему запросу: **{name}**"
+        if details.get('article'):
+            text += f" (арт. {details['article']})"
+        text += "."
+        if details.get('brand'):
+            text += f"\n- Бренд: {details['brand']}"
+        if details.get('price'):
+            text += f"\n- Цена: {details['price']} {details.get('currency', '')}".rstrip()
+        text += "\n\nПодробности — в карточке товара. Если нужно, подберу похожие варианты."
+        return text
+
+    def _answer_from_template(self, query: str, user_id: str, product: Dict) -> Dict:
+        """Ответ без LLM для быстрого пути"""
+        answer = self._template_answer(product)
+        self._save_turn(user_id, query, answer, [product])
+        return {"answer": answer, "products": [product]}
+
+    def _cached_answer(self, query: str, image: Optional[PreparedImage], user_id: str, sources: Optional[List[str]]) -> Tuple[Optional[Dict], Optional[List[float]]]:
+        """
+        Семантический кэш ответов (ANSWER_CACHE_ENABLED).
+        Возвращает (ответ из кэша или None, эмбеддинг запроса для повторного использования в поиске).
+        """
+        if self.answer_cache is None or image or not is_standalone_query(query):
+            return None, None
+        try:
+            vector = self.embeddings.embed_query(query)
+        except Exception as e:
+            console.print(f"[yellow]Answer cache: query embedding failed: {e}[/yellow]")
+            return None, None
+        
+        hit = self.answer_cache.get(vector, (tuple(sorted(sources or [])), self.embeddings.index_version))
+        if not hit:
+            return None, vector
+        console.print(f"[dim]Answer cache hit ({hit['similarity']:.3f}): '{hit['query']}'[/dim]")
+        self._save_turn(user_id, query, hit["answer"], hit["products"])
+        return {"answer": hit["answer"], "products": hit["products"]}, vector
+
+    def _remember_answer(self, query: str, vector: Optional[List[float]], sources: Optional[List[str]], history_tokens: int, result: Dict):
+        # Кэшируются только ответы, сгенерированные без истории разговора
+        if vector is None or history_tokens:
+            return
+        self.answer_cache.put(
+            vector, (tuple(sorted(sources or [])), self.embeddings.index_version),
+            query, result["answer"], result["products"]
+        )
+
+    def _shortcut(self, query: str, image: Optional[PreparedImage], user_id: str, sources: Optional[List[str]]) -> Tuple[Optional[Dict], Optional[Dict], Optional[List[float]]]:
+        """
+        Этапы до генерации: быстрый путь по артикулу/названию и семантический кэш ответов.
+        Возвращает (готовый ответ или None, карточка быстрого пути, эмбеддинг запроса для поиска).
+        """
+        fast = self._route(query, image, sources)
+        if fast and QUERY_FAST_PATH == "template":
+            return self._answer_from_template(query, user_id, fast), fast, None
+        
+        vector = None
+        if not fast:
+            cached, vector = self._cached_answer(query, image, user_id, sources)
+            if cached:
+                return cached, None, vector
+        return None, fast, vector
+
+    def _relevant(self, query: str, sources: Optional[List[str]], fast: Optional[Dict], vector: Optional[List[float]]) -> List[Dict]:
+        return [fast] if fast else self._retrieve(query, sources, query_embedding=vector)
+
+    def _finish_turn(self, query: str, user_id: str, sources: Optional[List[str]], vector: Optional[List[float]], chat, version: Optional[Tuple], history_tokens: int, response_text: str, relevant: List[Dict]) -> Dict:
+        """Разбор ответа, сохранение хода, возврат сессии в пул и кэш ответа"""
+        clean_response, final_products = self._resolve_recommendations(response_text, relevant)
+        last_id = self._save_turn(user_id, query, response_text, final_products)
+        self._close_chat(user_id, chat, version, history_tokens, query, response_text, last_id)
         
-        return {
+        result = {
             "answer": clean_response,
             "products": final_products
         }
+        self._remember_answer(query, vector, sources, history_tokens, result)
+        return result
+
+    def answer(self, query: str, image: Optional[PreparedImage] = None, user_id: str = "default", n_products: int = 5, sources: Optional[List[str]] = None) -> Dict:
+        """
+        Ответить на вопрос пользователя с учетом истории и (опционально) изображения.
+        Синхронная обертка над answer_async (CLI, скрипты).
+        """
+        return asyncio.run(self.answer_async(query, image, user_id, n_products, sources))
+
+    async def _send_message_async(self, chat, content) -> str:
+        if GEMINI_ASYNC_CLIENT:
+            response = await chat.send_message_async(content)
+        else:
+            # REST-транспорт (нужен для SOCKS прокси) не поддерживает async-клиент:
+            # блокирующий вызов уходит в ограниченный пул потоков, event loop свободен
+            response = await _run_io(chat.send_message, content)
+        return response.text
+
+    async def answer_async(self, query: str, image: Optional[PreparedImage] = None, user_id: str = "default", n_products: int = 5, sources: Optional[List[str]] = None) -> Dict:
+        """
+        Асинхронный ответ: не блокирует event loop.
+        История и (поиск -> загрузка изображений) выполняются параллельно.
+        """
+        early, fast, vector = await _run_io(self._shortcut, query, image, user_id, sources)
+        if early:
+            return early
+        
+        async def retrieve_and_prefetch():
+            relevant = await _run_io(self._relevant, query, sources, fast, vector)
+            product_images = await self._fetch_images_async(self._image_targets(relevant))
+            return relevant, product_images
+
+        (chat, version, history_tokens), (relevant, product_images) = await asyncio.gather(
+            _run_io(self._open_chat, user_id),
+            retrieve_and_prefetch()
+        )
+        
+        # Сборка контекста и промпта — в пуле, event loop свободен
+        current_message_content, text_part = await _run_io(
+            self._build_message, query, relevant, image, product_images
+        )
+        
+        try:
+            response_text = await self._send_message_async(chat, current_message_content)
+        except Exception as e:
+            console.print(f"[red]Chat Error: {e}[/red]")
+            # Retry text only if multimodal failed
+            response_text = await self._send_message_async(chat, text_part)
+        
+        return await _run_io(
+            self._finish_turn, query, user_id, sources, vector, chat, version, history_tokens, response_text, relevant
+        )
+
+    @staticmethod
+    def _visible_text(text: str) -> str:
+        """
+        Часть ответа, которую можно стримить пользователю: обрезается на служебных
+        блоках ([[RECOMMENDED_SLUGS]], JSON) и на незавершенном начале такого блока.
+        """
+        markers = ("[[", "```json", '{"recommended_slugs"')
+        cut = len(text)
+        for marker in markers:
+            idx = text.find(marker)
+            if idx != -1:
+                cut = min(cut, idx)
+            # Маркер может прийти разрезанным между чанками
+            for i in range(len(marker) - 1, 0, -1):
+                if text.endswith(marker[:i]):
+                    cut = min(cut, len(text) - i)
+                    break
+        return text[:cut]
+
+    def answer_stream(self, query: str, image: Optional[PreparedImage] = None, user_id: str = "default", sources: Optional[List[str]] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Потоковый ответ: генератор событий (event, data)
+        - "products": найденные кандидаты, сразу после поиска
+        - "delta": очередной фрагмент текста ответа
+        - "final": очищенный ответ и рекомендованные товары (как в answer())
+        """
+        early, fast, vector = self._shortcut(query, image, user_id, sources)
+        if early:
+            yield "products", {"products": early["products"]}
+            yield "delta", {"text": early["answer"]}
+            yield "final", early
+            return
+        
+        chat, version, history_tokens = self._open_chat(user_id)
+        relevant = self._relevant(query, sources, fast, vector)
+        yield "products", {"products": relevant}
+        
+        current_message_content, text_part = self._build_message(query, relevant, image)
+        # Оборванный стрим оставляет сессию в неконсистентном состоянии — для повтора нужна копия истории
+        base_history = list(chat.history)
+        
+        response_text = ""
+        emitted = 0
+        try:
+            for chunk in chat.send_message(current_message_content, stream=True):
+                try:
+                    response_text += chunk.text
+                except ValueError:
+                    # Чанк без текста (например, только метаданные)
+                    continue
+                visible = self._visible_text(response_text)
+                if len(visible) > emitted:
+                    yield "delta", {"text": visible[emitted:]}
+                    emitted = len(visible)
+        except Exception as e:
+            console.print(f"[red]Chat Stream Error: {e}[/red]")
+            if emitted:
+                raise
+            # Retry text only if multimodal failed (nothing was streamed yet)
+            chat = self.chat_model.start_chat(history=base_history)
+            response_text = chat.send_message(text_part).text
+            visible = self._visible_text(response_text)
+            if visible:
+                yield "delta", {"text": visible}
+        
+        yield "final", self._finish_turn(
+            query, user_id, sources, vector, chat, version, history_tokens, response_text, relevant
+        )
 
     def search_products(self, query: str, n_results: int = 5) -> List[Dict]:
         """Поиск продуктов по запросу"""
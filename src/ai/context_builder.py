@@ -0,0 +1,160 @@
+"""
+Сборка контекста товаров для промпта консультанта с бюджетом токенов.
+
+- бюджет делится между товарами по рангу релевантности (1/(rank+1)), неиспользованный
+  остаток переходит к следующему товару;
+- у вариантов одной модели (бренд + базовое название) повторяющиеся характеристики
+  не дублируются;
+- отрендеренные и оцененные в токенах фрагменты товара кэшируются на версию каталога.
+"""
+
+import re
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from src.ai.history_compactor import estimate_tokens
+
+_VARIANT_SPLIT_RE = re.compile(r'\s+[-–—(,/]\s*|\s+\(')
+
+
+class ContextBuilder:
+    """Упаковка описаний товаров в заданный бюджет токенов"""
+
+    # Доля бюджета товара, отводимая под описание (остальное — характеристики)
+    DESCRIPTION_SHARE = 0.4
+
+    def __init__(self, token_budget: int, catalog_version: Hashable = None, max_cached: int = 5000):
+        self.token_budget = token_budget
+        self.catalog_version = catalog_version
+        self.max_cached = max_cached
+        self._snippets: Dict[Tuple[str, Hashable], Dict] = {}
+        self._lock = threading.Lock()
+
+    def set_catalog_version(self, version: Hashable):
+        with self._lock:
+            if version != self.catalog_version:
+                self.catalog_version = version
+                self._snippets.clear()
+
+    @staticmethod
+    def model_key(details: Dict) -> Tuple[str, str]:
+        """Ключ модели для вариантов: бренд + название до разделителя варианта"""
+        name = str(details.get('name') or details.get('title') or '')
+        base = _VARIANT_SPLIT_RE.split(name, maxsplit=1)[0]
+        return (str(details.get('brand') or '').lower(), base.lower().strip())
+
+    def _render(self, slug: str, details: Dict) -> Dict:
+        """Отрендеренный фрагмент товара с оценкой токенов по частям"""
+        header = f"## {details.get('title', details.get('name', slug))} (арт. {details.get('article', 'N/A')})\n"
+        brand = details.get('brand')
+        if brand:
+            header += f"- Бренд: {brand}\n"
+        price = details.get('price')
+        currency = details.get('currency', '')
+        if price:
+            header += f"- Цена: {price} {currency}\n"
+
+        description = ""
+        if details.get('description'):
+            description = details['description'].replace('\n', ' ').strip()
+
+        attributes = []
+        params = {**(details.get('parameters') or {}), **(details.get('attributes') or {})}
+        for k, v in params.items():
+            if k != "Цена" and v:
+                line = f"  - {k}: {v}\n"
+                attributes.append((k, str(v), line, estimate_tokens(line)))
+
+        return {
+            "header": header,
+            "header_tokens": estimate_tokens(header),
+            "description": description,
+            "description_tokens": estimate_tokens(description) if description else 0,
+            "attributes": attributes,
+            "model_key": self.model_key(details),
+        }
+
+    def snippet(self, slug: str, details: Dict) -> Dict:
+        key = (slug, self.catalog_version)
+        with self._lock:
+            cached = self._snippets.get(key)
+        if cached is not None:
+            return cached
+        rendered = self._render(slug, details)
+        with self._lock:
+            if len(self._snippets) >= self.max_cached:
+                self._snippets.clear()
+            self._snippets[key] = rendered
+        return rendered
+
+    @staticmethod
+    def _truncate(text: str, tokens: int) -> str:
+        # estimate_tokens: ~3 символа на токен
+        max_chars = max(0, tokens * 3)
+        if len(text) <= max_chars:
+            return text
+        cut = text[:max_chars].rsplit(' ', 1)[0]
+        return cut + "..."
+
+    def build(self, products: List[Dict], get_details: Callable[[str], Optional[Dict]]) -> str:
+        items = []
+        for p in products:
+            details = p.get('details') or get_details(p['slug'])
+            if details:
+                items.append((p['slug'], details))
+        if not items:
+            return ""
+
+        weights = [1.0 / (rank + 1) for rank in range(len(items))]
+        weight_left = sum(weights)
+        budget_left = self.token_budget
+        # model_key -> {(k, v)} уже показанных характеристик и название первого варианта
+        shown: Dict[Tuple[str, str], Dict] = {}
+        parts = []
+
+        for (slug, details), weight in zip(items, weights):
+            snip = self.snippet(slug, details)
+            share = budget_left * weight / weight_left
+            weight_left -= weight
+
+            part = snip["header"]
+            used = snip["header_tokens"]
+
+            if snip["description"]:
+                desc_budget = int(max(0, share - used) * self.DESCRIPTION_SHARE)
+                if desc_budget > 0:
+                    desc = self._truncate(snip["description"], desc_budget) if snip["description_tokens"] > desc_budget else snip["description"]
+                    if desc:
+                        line = f"- Описание: {desc}\n"
+                        part += line
+                        used += estimate_tokens(line)
+
+            group = shown.setdefault(snip["model_key"], {"pairs": set(), "keys": set(), "name": details.get('name') or slug})
+            # Сначала то, чем вариант отличается от уже показанных (тот же ключ, другое значение)
+            attributes = sorted(
+                snip["attributes"],
+                key=lambda a: 0 if a[0] in group["keys"] and (a[0], a[1]) not in group["pairs"] else 1
+            )
+            lines = []
+            skipped = 0
+            for k, v, line, tokens in attributes:
+                if (k, v) in group["pairs"]:
+                    skipped += 1
+                    continue
+                if used + tokens > share:
+                    break
+                lines.append(line)
+                group["pairs"].add((k, v))
+                group["keys"].add(k)
+                used += tokens
+            if lines:
+                part += "- Характеристики:\n" + "".join(lines)
+            if skipped:
+                note = f"- Остальные характеристики как у {group['name']}\n"
+                part += note
+                used += estimate_tokens(note)
+
+            parts.append(part)
+            budget_left = max(0, budget_left - used)
+
+        return "\n".join(parts)
@@ -3,7 +3,11 @@
 Использует Google text-embedding-004 + ChromaDB
 """
 
+import hashlib
 import json
+import os
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Optional
 import chromadb
@@ -15,10 +19,24 @@ import time
 from chromadb import Documents, EmbeddingFunction, Embeddings
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-from config.settings import GEMINI_API_KEY, DATA_DIR
+from config.settings import GEMINI_API_KEY, DATA_DIR, EMBEDDINGS_BATCH_SIZE, EMBEDDINGS_MODE, EMBEDDING_FIELD_WEIGHTS, SEARCH_CACHE_SIZE
+from src.ai.partitions import SourcePartitions
+from src.ai.index_checkpoint import IndexCheckpoint
+from src.ai.search_cache import SearchResultCache
+from src.ai.filter_extractor import parse_price
 
 console = Console()
 
+COLLECTION_NAME = "designer_furniture_v1"
+FIELDS_COLLECTION_NAME = "designer_furniture_fields_v1"
+
+# Чанки продукта в режиме mode="fields"
+PRODUCT_FIELDS = ["identity", "visual", "description", "attributes"]
+
+class EmbeddingError(RuntimeError):
+    """Не удалось получить эмбеддинги (сеть, прокси, ответ API)"""
+
+
 class ProxiedGeminiEmbeddingFunction(EmbeddingFunction):
     """Custom Embedding Function using REST API directly to support SOCKS proxy"""
     def __init__(self, api_key: str, model_name: str = "models/text-embedding-004"):
@@ -27,6 +45,14 @@ class ProxiedGeminiEmbeddingFunction(EmbeddingFunction):
         self.url = f"https://generativelanguage.googleapis.com/v1beta/{model_name}:embedContent?key={api_key}"
 
     def __call__(self, input: Documents) -> Embeddings:
+        return self.embed(input)
+
+    def embed(self, input: Documents, strict: bool = False) -> Embeddings:
+        """
+        Батчевый запрос эмбеддингов.
+        strict=True: вместо нулевых векторов бросает EmbeddingError (для индексации,
+        чтобы сбой попал в чекпоинт, а не в индекс).
+        """
         if not input:
             return []
             
@@ -44,57 +70,93 @@ class ProxiedGeminiEmbeddingFunction(EmbeddingFunction):
         
         try:
             response = requests.post(url, json=payload, timeout=60)
-            if response.ok:
-                data = response.json()
-                embeddings = []
-                for emb_data in data.get('embeddings', []):
-                    values = emb_data.get('values', [])
-                    if len(values) == 768:
-                        embeddings.append(values)
-                    elif len(values) == 3072:
-                        # Output from gemini-embedding-001 can be 3072 (even if docs say 768 sometimes)
-                        embeddings.append(values)
-                    else:
-                        print(f"Warning: Unexpected embedding dimension: {len(values)}")
-                        # Try to pad or truncate if desperate, but better to skip or just append and let chroma error
-                        # For now, let's just append and hope for the best or provide a zero vector of correct size if we knew it
-                        # But since we support 768 and 3072, let's just append zeros of 3072 as fallback if it's neither?
-                        # Actually safer to append 3072 zeros if we are moving to that model.
-                        embeddings.append([0.0]*3072)
-                
-                # If for some reason lengths don't match, pad
-                while len(embeddings) < len(input):
-                    embeddings.append([0.0]*3072)
-                return embeddings
-            else:
-                print(f"Error batch embedding: {response.text}", file=sys.stderr)
-                return [[0.0]*3072 for _ in input]
         except Exception as e:
+            if strict:
+                raise EmbeddingError(f"Exception batch embedding: {e}") from e
             print(f"Exception batch embedding: {e}", file=sys.stderr)
             return [[0.0]*3072 for _ in input]
+        
+        if not response.ok:
+            if strict:
+                raise EmbeddingError(f"Error batch embedding: HTTP {response.status_code} {response.text[:200]}")
+            print(f"Error batch embedding: {response.text}", file=sys.stderr)
+            return [[0.0]*3072 for _ in input]
+        
+        data = response.json()
+        embeddings = []
+        for emb_data in data.get('embeddings', []):
+            values = emb_data.get('values', [])
+            if len(values) == 768:
+                embeddings.append(values)
+            elif len(values) == 3072:
+                # Output from gemini-embedding-001 can be 3072 (even if docs say 768 sometimes)
+                embeddings.append(values)
+            else:
+                if strict:
+                    raise EmbeddingError(f"Unexpected embedding dimension: {len(values)}")
+                print(f"Warning: Unexpected embedding dimension: {len(values)}")
+                # Safer to append 3072 zeros if we are moving to that model.
+                embeddings.append([0.0]*3072)
+        
+        if len(embeddings) < len(input):
+            if strict:
+                raise EmbeddingError(f"Got {len(embeddings)} embeddings for {len(input)} texts")
+            # If for some reason lengths don't match, pad
+            while len(embeddings) < len(input):
+                embeddings.append([0.0]*3072)
+        return embeddings
 
 class BrickEmbeddings:
     """Класс для работы с эмбеддингами продуктов"""
     
-    def __init__(self, persist_directory: Optional[str] = None):
+    # Общие для всех экземпляров процесса (API, консультант, поиск по фото работают с одной коллекцией)
+    _index_versions: Dict[str, int] = {}
+    _search_caches: Dict[str, SearchResultCache] = {}
+    
+    def __init__(
+        self,
+        persist_directory: Optional[str] = None,
+        mode: Optional[str] = None,
+        field_weights: Optional[Dict[str, float]] = None,
+        collection_name: Optional[str] = None,
+        embedding_fn: Optional[EmbeddingFunction] = None
+    ):
         if persist_directory is None:
             persist_directory = str(DATA_DIR / "embeddings")
         
+        # "single": один документ на продукт; "fields": отдельный вектор на каждое поле
+        self.mode = mode or EMBEDDINGS_MODE
+        if self.mode not in ("single", "fields"):
+            raise ValueError(f"Unknown embeddings mode: {self.mode}")
+        self.collection_name = collection_name or (FIELDS_COLLECTION_NAME if self.mode == "fields" else COLLECTION_NAME)
+        self.field_weights = field_weights or EMBEDDING_FIELD_WEIGHTS
+        
         self.client = chromadb.PersistentClient(path=persist_directory)
         
         # Используем Custom embedding function для поддержки Proxy
-        self.embedding_fn = ProxiedGeminiEmbeddingFunction(
+        self.embedding_fn = embedding_fn or ProxiedGeminiEmbeddingFunction(
             api_key=GEMINI_API_KEY,
             model_name="models/gemini-embedding-001"
         )
         
         # Получаем или создаем коллекцию
         self.collection = self.client.get_or_create_collection(
-            name="designer_furniture_v1",
+            name=self.collection_name,
             embedding_function=self.embedding_fn,
             metadata={"hnsw:space": "cosine"}
         )
         
+        self.checkpoint_path = Path(persist_directory) / f"{self.collection_name}_index_checkpoint.json"
+        
+        # Карта source -> slugs (партиции по источникам)
+        self.partitions = SourcePartitions(Path(persist_directory) / f"{self.collection_name}_sources.json")
+        self._index_key = str(self.partitions.path.resolve())
+        # Вложенность batch_index_changes() в текущем потоке
+        self._batch = threading.local()
+        self.search_cache = BrickEmbeddings._search_caches.setdefault(self._index_key, SearchResultCache(SEARCH_CACHE_SIZE))
+        if not self.partitions.loaded:
+            self._rebuild_partitions()
+        
         # Загружаем анализ текстур если есть
         texture_path = DATA_DIR / "processed" / "texture_analysis.json"
         if texture_path.exists():
@@ -105,9 +167,121 @@ class BrickEmbeddings:
             
         console.print("[green]✓ ChromaDB инициализирован[/green]")
         console.print(f"  Путь: {persist_directory}")
-        console.print(f"  Коллекция: {self.collection.name}")
+        console.print(f"  Коллекция: {self.collection.name} (mode={self.mode})")
         console.print(f"  Документов: {self.collection.count()}")
     
+    @property
+    def index_version(self):
+        """
+        Версия индекса для кэша поиска: счетчик изменений в процессе + mtime файла партиций
+        (файл переписывается при каждом изменении, в т.ч. из скриптов в других процессах).
+        """
+        try:
+            mtime = os.stat(self.partitions.path).st_mtime_ns
+        except OSError:
+            mtime = 0
+        return (BrickEmbeddings._index_versions.get(self._index_key, 0), mtime)
+    
+    def _commit_index_change(self):
+        """Сохраняет карту партиций и инвалидирует кэш поиска (внутри batch_index_changes — один раз в конце)"""
+        if getattr(self._batch, "depth", 0):
+            self._batch.pending = True
+            return
+        self.partitions.save()
+        BrickEmbeddings._index_versions[self._index_key] = BrickEmbeddings._index_versions.get(self._index_key, 0) + 1
+    
+    @contextmanager
+    def batch_index_changes(self):
+        """Серия изменений индекса (импорт): одна запись карты партиций и одна смена версии в конце"""
+        depth = getattr(self._batch, "depth", 0)
+        self._batch.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._batch.depth = depth
+            if depth == 0 and getattr(self._batch, "pending", False):
+                self._batch.pending = False
+                self._commit_index_change()
+    
+    def cache_stats(self) -> Dict:
+        return {**self.search_cache.stats(), "index_version": BrickEmbeddings._index_versions.get(self._index_key, 0)}
+    
+    def _rebuild_partitions(self):
+        """Однократно строит карту source -> ids из метаданных коллекции"""
+        try:
+            results = self.collection.get(include=["metadatas"])
+            self.partitions.rebuild(results['metadatas'] or [], results['ids'] or [])
+            self._commit_index_change()
+            console.print(f"[dim]Source partitions rebuilt: {len(self.partitions)} ids[/dim]")
+        except Exception as e:
+            console.print(f"[red]Error rebuilding source partitions: {e}[/red]")
+    
+    def _product_metadata(self, product: Dict) -> Dict:
+        metadata = {
+            "slug": product.get('slug'),
+            "name": product.get('name', ''),
+            "article": product.get('article', ''),
+            "source": product.get('source', 'unknown')
+        }
+        # Поля для where-фильтров консультанта (ChromaDB не хранит None)
+        if product.get('brand'):
+            metadata["brand"] = str(product['brand'])
+        if product.get('category'):
+            metadata["category"] = str(product['category'])
+        price = parse_price(product.get('price') or (product.get('parameters') or {}).get('Цена'))
+        if price is not None:
+            metadata["price"] = price
+        return metadata
+    
+    def _vector_ids(self, slugs: List[str]) -> List[str]:
+        """ids векторов продукта в коллекции (в режиме fields — по одному на поле)"""
+        if self.mode == "fields":
+            return [f"{slug}::{field}" for slug in slugs for field in PRODUCT_FIELDS]
+        return list(slugs)
+    
+    def _product_to_chunks(self, product: Dict) -> Dict[str, str]:
+        """Разбивает продукт на короткие поля, чтобы длинное описание не забивало остальные"""
+        slug = product.get('slug')
+        chunks = {}
+        
+        identity = [f"Название: {product.get('name', 'N/A')}"]
+        if product.get('brand'):
+            identity.append(f"Бренд: {product['brand']}")
+        if product.get('article'):
+            identity.append(f"Артикул: {product['article']}")
+        chunks["identity"] = "\n".join(identity)
+        
+        visual = []
+        color = product.get('color') or {}
+        if color.get('base_color'):
+            visual.append(f"Цвет: {color['base_color']}")
+        if product.get('texture'):
+            visual.append(f"Текстура: {product['texture']}")
+        tex = self.texture_analysis.get(slug) or {}
+        if tex.get('texture_description'):
+            visual.append(f"Визуальное описание: {tex['texture_description']}")
+        if tex.get('style_tags'):
+            visual.append(f"Стиль: {', '.join(tex['style_tags'])}")
+        if tex.get('visual_features'):
+            visual.append(f"Особенности: {tex['visual_features']}")
+        if product.get('visual_description'):
+            visual.append(f"Визуальное описание: {product['visual_description']}")
+        chunks["visual"] = "\n".join(visual)
+        
+        chunks["description"] = (product.get('description') or '').strip()
+        
+        attributes = []
+        if product.get('category'):
+            attributes.append(f"Категория: {product['category']}")
+        params = product.get('attributes') or product.get('parameters') or {}
+        if isinstance(params, dict):
+            for k, v in params.items():
+                if k != "Цена" and v:
+                    attributes.append(f"{k}: {v}")
+        chunks["attributes"] = "\n".join(attributes)
+        
+        return chunks
+    
     def _product_to_text(self, product: Dict) -> str:
         slug = product.get('slug')
         parts = []
@@ -151,65 +325,170 @@ class BrickEmbeddings:
         if not slug:
             return
             
-        text = self._product_to_text(product)
-        metadata = {
-            "slug": slug,
-            "name": product.get('name', ''),
-            "article": product.get('article', ''),
-            "source": product.get('source', 'unknown')
-        }
+        self._upsert_products([product])
+
+    def _upsert_products(self, products: List[Dict], strict: bool = False):
+        """
+        Upsert батча продуктов и обновление карты партиций.
+        strict=True: эмбеддинги считаются заранее и ошибка API пробрасывается наружу.
+        """
+        if self.mode == "fields":
+            self._upsert_product_fields(products, strict=strict)
+        else:
+            ids = [p['slug'] for p in products]
+            documents = [self._product_to_text(p) for p in products]
+            metadatas = [self._product_metadata(p) for p in products]
+            self._upsert_rows(ids, documents, metadatas, strict=strict)
         
-        self.collection.upsert(
-            ids=[slug],
-            documents=[text],
-            metadatas=[metadata]
-        )
+        for p in products:
+            self.partitions.add(p.get('source', 'unknown'), [p['slug']])
+        self._commit_index_change()
+    
+    def _upsert_rows(self, ids: List[str], documents: List[str], metadatas: List[Dict], strict: bool = False):
+        if not ids:
+            return
+        if strict:
+            self.collection.upsert(
+                ids=ids,
+                embeddings=self.embedding_fn.embed(documents, strict=True),
+                documents=documents,
+                metadatas=metadatas
+            )
+        else:
+            self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas)
+    
+    def _upsert_product_fields(self, products: List[Dict], strict: bool = False):
+        """
+        Режим fields: эмбеддинг пересчитывается только для чанков, текст которых изменился
+        (сравнение по text_hash в метаданных). Пустые поля удаляются из индекса.
+        """
+        all_ids = self._vector_ids([p['slug'] for p in products])
+        existing = self.collection.get(ids=all_ids, include=["metadatas"])
+        existing_meta = dict(zip(existing['ids'], existing['metadatas']))
+        
+        embed_ids, embed_docs, embed_metas = [], [], []
+        update_ids, update_metas = [], []
+        delete_ids = []
+        
+        for product in products:
+            base_meta = self._product_metadata(product)
+            for field, text in self._product_to_chunks(product).items():
+                chunk_id = f"{product['slug']}::{field}"
+                if not text:
+                    if chunk_id in existing_meta:
+                        delete_ids.append(chunk_id)
+                    continue
+                
+                meta = {**base_meta, "field": field, "text_hash": hashlib.sha1(text.encode("utf-8")).hexdigest()}
+                old_meta = existing_meta.get(chunk_id)
+                if old_meta is None or old_meta.get("text_hash") != meta["text_hash"]:
+                    embed_ids.append(chunk_id)
+                    embed_docs.append(text)
+                    embed_metas.append(meta)
+                elif old_meta != meta:
+                    # Текст тот же, поменялись только метаданные (например source)
+                    update_ids.append(chunk_id)
+                    update_metas.append(meta)
+        
+        self._upsert_rows(embed_ids, embed_docs, embed_metas, strict=strict)
+        if update_ids:
+            self.collection.update(ids=update_ids, metadatas=update_metas)
+        if delete_ids:
+            self.collection.delete(ids=delete_ids)
 
     def delete_product(self, slug: str):
         """Delete a single product from index."""
         if not slug:
             return
         try:
-            self.collection.delete(ids=[slug])
+            self.collection.delete(ids=self._vector_ids([slug]))
+            self.partitions.discard([slug])
+            self._commit_index_change()
         except Exception as e:
             print(f"Error deleting embedding for {slug}: {e}")
     
+    def _delete_ids(self, ids: List[str], batch_size: int = 500):
+        for i in range(0, len(ids), batch_size):
+            self.collection.delete(ids=ids[i:i+batch_size])
+    
     def delete_by_source(self, source: str):
         """Delete all products from a specific source."""
         try:
-            # Get all items with this source
-            results = self.collection.get(
-                where={"source": source},
-                include=[]
-            )
-            if results and results['ids']:
-                console.print(f"[yellow]Deleting {len(results['ids'])} products from source '{source}'...[/yellow]")
-                self.collection.delete(ids=results['ids'])
-                console.print(f"[green]✓ Deleted {len(results['ids'])} products[/green]")
+            ids = sorted(self.partitions.ids_for(source))
+            if ids:
+                console.print(f"[yellow]Deleting {len(ids)} products from source '{source}'...[/yellow]")
+                self._delete_ids(self._vector_ids(ids))
+                self.partitions.drop(source)
+                self._commit_index_change()
+                console.print(f"[green]✓ Deleted {len(ids)} products[/green]")
             else:
                 console.print(f"[dim]No products found for source '{source}'[/dim]")
         except Exception as e:
             console.print(f"[red]Error deleting by source {source}: {e}[/red]")
     
-    def sync_products(self, products: List[Dict], source: str):
-        """Sync products from an external source (delete old, add new)."""
-        console.print(f"[blue]Syncing {len(products)} products from source '{source}'...[/blue]")
+    def rename_source(self, old_source: str, new_source: str, batch_size: int = 500):
+        """Rename a source: only metadata of its partition is updated, no re-embedding."""
+        slugs = sorted(self.partitions.ids_for(old_source))
+        if not slugs:
+            console.print(f"[dim]No products found for source '{old_source}'[/dim]")
+            return
         
-        # First delete all existing products from this source
-        self.delete_by_source(source)
+        ids = self._vector_ids(slugs)
+        for i in range(0, len(ids), batch_size):
+            batch = self.collection.get(ids=ids[i:i+batch_size], include=["metadatas"])
+            metadatas = []
+            for meta in batch['metadatas']:
+                meta = dict(meta or {})
+                meta['source'] = new_source
+                metadatas.append(meta)
+            if batch['ids']:
+                self.collection.update(ids=batch['ids'], metadatas=metadatas)
         
-        # Then add all new products
-        batch_size = 50
-        for i in range(0, len(products), batch_size):
-            batch = products[i:i+batch_size]
-            for p in batch:
+        self.partitions.rename(old_source, new_source)
+        self._commit_index_change()
+        console.print(f"[green]✓ Renamed source '{old_source}' -> '{new_source}' ({len(slugs)} products)[/green]")
+    
+    def sync_products(self, products: List[Dict], source: str, batch_size: int = 50):
+        """Sync products from an external source: only this source's partition is touched."""
+        console.print(f"[blue]Syncing {len(products)} products from source '{source}'...[/blue]")
+        
+        unique = {}
+        for p in products:
+            if p.get('slug') and p['slug'] not in unique:
                 p['source'] = source  # Ensure source is set
-                self.index_product(p)
-            console.print(f"  Indexed {min(i+batch_size, len(products))}/{len(products)}...")
+                unique[p['slug']] = p
+        products = list(unique.values())
         
-        console.print(f"[green]✓ Synced {len(products)} products from '{source}'[/green]")
+        with self.batch_index_changes():
+            # Remove products that disappeared from this source
+            stale_ids = sorted(self.partitions.ids_for(source) - set(unique))
+            if stale_ids:
+                self._delete_ids(self._vector_ids(stale_ids))
+                self.partitions.discard(stale_ids)
+            
+            for i in range(0, len(products), batch_size):
+                self._upsert_products(products[i:i+batch_size])
+                console.print(f"  Indexed {min(i+batch_size, len(products))}/{len(products)}...")
+            
+            self._commit_index_change()
+        console.print(f"[green]✓ Synced {len(products)} products from '{source}' (removed {len(stale_ids)})[/green]")
     
-    def index_catalog(self, catalog_path: Optional[Path] = None, force_reindex: bool = False, products_list: Optional[List[Dict]] = None):
+    def index_catalog(
+        self,
+        catalog_path: Optional[Path] = None,
+        force_reindex: bool = False,
+        products_list: Optional[List[Dict]] = None,
+        batch_size: Optional[int] = None,
+        resume: bool = False,
+        checkpoint_path: Optional[Path] = None
+    ):
+        """
+        Индексация каталога батчами с чекпоинтом.
+        
+        Прогресс (завершенные батчи, упавшие slug'и с ошибкой) пишется в файл после
+        каждого батча. resume=True продолжает прерванный запуск с тем же каталогом и
+        batch_size: завершенные батчи пропускаются, упавшие повторяются.
+        """
         if products_list is not None:
             catalog = products_list
         else:
@@ -219,21 +498,48 @@ class BrickEmbeddings:
             with open(catalog_path, 'r', encoding='utf-8') as f:
                 catalog = json.load(f)
         
-        if force_reindex:
-            console.print("[yellow]Очистка и пересоздание коллекции...[/yellow]")
-            try:
-                self.client.delete_collection("designer_furniture_v1")
-                time.sleep(1)
-            except Exception:
-                pass
-            
-            self.collection = self.client.get_or_create_collection(
-                name="designer_furniture_v1",
-                embedding_function=self.embedding_fn,
-                metadata={"hnsw:space": "cosine"}
+        batch_size = batch_size or EMBEDDINGS_BATCH_SIZE
+        
+        # Dedup catalog to avoid DuplicateIDError
+        unique_catalog = {}
+        for p in catalog:
+            s = p.get('slug')
+            if s and s not in unique_catalog:
+                unique_catalog[s] = p
+        catalog = list(unique_catalog.values())
+        batches = [catalog[i:i+batch_size] for i in range(0, len(catalog), batch_size)]
+        
+        checkpoint = IndexCheckpoint(checkpoint_path or self.checkpoint_path)
+        fingerprint = IndexCheckpoint.make_fingerprint(unique_catalog.keys(), batch_size, force_reindex)
+        
+        if resume and checkpoint.load() and checkpoint.can_resume(fingerprint):
+            console.print(
+                f"[cyan]Продолжаем индексацию: {len(checkpoint.completed_batches)}/{len(batches)} батчей готово, "
+                f"{len(checkpoint.failed)} упавших slug'ов[/cyan]"
             )
+        else:
+            if resume:
+                console.print("[yellow]Нет подходящего чекпоинта, начинаем заново[/yellow]")
+            checkpoint.start(fingerprint, batch_size, len(batches), force_reindex)
+            
+            if force_reindex:
+                console.print("[yellow]Очистка и пересоздание коллекции...[/yellow]")
+                try:
+                    self.client.delete_collection(self.collection_name)
+                    time.sleep(1)
+                except Exception:
+                    pass
+                
+                self.collection = self.client.get_or_create_collection(
+                    name=self.collection_name,
+                    embedding_function=self.embedding_fn,
+                    metadata={"hnsw:space": "cosine"}
+                )
+                self.partitions.clear()
+                self._commit_index_change()
         
-        existing_ids = set(self.collection.get()['ids'])
+        # Локальный набор ids вместо выгрузки всех ids коллекции
+        existing_ids = self.partitions.all_ids()
         indexed = 0
         skipped = 0
         
@@ -246,68 +552,67 @@ class BrickEmbeddings:
         ) as progress:
             task = progress.add_task("[cyan]Индексация...", total=len(catalog))
             
-            batch_size = 50
-            batch_ids = []
-            batch_docs = []
-            batch_metas = []
-
-            # Dedup catalog to avoid DuplicateIDError
-            unique_catalog = {}
-            for p in catalog:
-                s = p.get('slug')
-                if s and s not in unique_catalog:
-                    unique_catalog[s] = p
-            catalog = list(unique_catalog.values())
-
-            for product in catalog:
-                slug = product.get('slug')
-                if not slug:
-                    progress.advance(task)
+            for batch_index, batch in enumerate(batches):
+                if batch_index in checkpoint.completed_batches:
+                    skipped += len(batch)
+                    progress.advance(task, len(batch))
                     continue
                 
-                if slug in existing_ids and not force_reindex:
-                    skipped += 1
-                    progress.advance(task)
-                    continue
+                todo = [p for p in batch if force_reindex or p['slug'] not in existing_ids]
+                skipped += len(batch) - len(todo)
                 
-                text = self._product_to_text(product)
-                metadata = {
-                    "slug": slug,
-                    "name": product.get('name', ''),
-                    "article": product.get('article', ''),
-                    "source": product.get('source', 'unknown')
-                }
+                if todo:
+                    progress.update(task, description=f"[cyan]{todo[0]['slug']}")
+                    try:
+                        self._upsert_products(todo, strict=True)
+                        indexed += len(todo)
+                        checkpoint.mark_done(batch_index, [p['slug'] for p in todo])
+                    except Exception as e:
+                        console.print(f"[red]Батч {batch_index} не проиндексирован: {e}[/red]")
+                        checkpoint.mark_failed([p['slug'] for p in todo], str(e))
+                else:
+                    checkpoint.mark_done(batch_index, [])
                 
-                batch_ids.append(slug)
-                batch_docs.append(text)
-                batch_metas.append(metadata)
+                checkpoint.save()
+                progress.advance(task, len(batch))
+        
+        checkpoint.finish()
+        
+        console.print(
+            f"\n[bold green]✓ Готово![/bold green] Проиндексировано: {indexed}, пропущено: {skipped}, "
+            f"ошибок: {len(checkpoint.failed)}. Всего: {self.collection.count()}"
+        )
+        if checkpoint.failed:
+            console.print(f"[yellow]Упавшие slug'и сохранены в {checkpoint.path}, повторите с --resume[/yellow]")
 
-                if len(batch_ids) >= batch_size:
-                    self.collection.upsert(
-                        ids=batch_ids,
-                        documents=batch_docs,
-                        metadatas=batch_metas
-                    )
-                    indexed += len(batch_ids)
-                    batch_ids, batch_docs, batch_metas = [], [], []
-                
-                progress.update(task, description=f"[cyan]{slug}")
-                progress.advance(task)
+    def embed_query(self, query: str) -> List[float]:
+        """Эмбеддинг запроса (бросает EmbeddingError вместо нулевого вектора)"""
+        return self.embedding_fn.embed([query], strict=True)[0]
 
-            # Final batch
-            if batch_ids:
-                self.collection.upsert(
-                    ids=batch_ids,
-                    documents=batch_docs,
-                    metadatas=batch_metas
-                )
-                indexed += len(batch_ids)
+    @staticmethod
+    def _query_args(query: str, query_embedding: Optional[List[float]]) -> Dict:
+        # Уже посчитанный эмбеддинг запроса не запрашиваем у API повторно
+        if query_embedding is not None:
+            return {"query_embeddings": [query_embedding]}
+        return {"query_texts": [query]}
+
+    def search(self, query: str, n_results: int = 5, where: Optional[Dict] = None, query_embedding: Optional[List[float]] = None) -> List[Dict]:
+        key = SearchResultCache.make_key(query, where, n_results, (self.mode, self.index_version))
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        if self.mode == "fields":
+            products = self._search_fields(query, n_results=n_results, where=where, query_embedding=query_embedding)
+        else:
+            products = self._search_single(query, n_results=n_results, where=where, query_embedding=query_embedding)
         
-        console.print(f"\n[bold green]✓ Готово![/bold green] Всего: {self.collection.count()}")
+        self.search_cache.put(key, products)
+        return products
 
-    def search(self, query: str, n_results: int = 5, where: Optional[Dict] = None) -> List[Dict]:
+    def _search_single(self, query: str, n_results: int = 5, where: Optional[Dict] = None, query_embedding: Optional[List[float]] = None) -> List[Dict]:
         results = self.collection.query(
-            query_texts=[query],
+            **self._query_args(query, query_embedding),
             n_results=n_results,
             where=where,
             include=["documents", "metadatas", "distances"]
@@ -322,17 +627,70 @@ class BrickEmbeddings:
                 })
         return products
 
+    def _search_fields(self, query: str, n_results: int = 5, where: Optional[Dict] = None, query_embedding: Optional[List[float]] = None) -> List[Dict]:
+        """
+        Поиск по чанкам с агрегацией по slug:
+        score = sum(w_f * sim_f) / sum(w_f), где для поля, не попавшего в выдачу,
+        sim_f берется как минимальная найденная похожесть этого поля (нижняя граница).
+        distance = 1 - score, чтобы пороги по distance продолжали работать.
+        """
+        results = self.collection.query(
+            **self._query_args(query, query_embedding),
+            n_results=n_results * len(PRODUCT_FIELDS) * 2,
+            where=where,
+            include=["metadatas", "distances"]
+        )
+        if not results['ids'] or not results['ids'][0]:
+            return []
+        
+        field_sims: Dict[str, Dict[str, float]] = {}
+        field_floor: Dict[str, float] = {}
+        metadata_by_slug: Dict[str, Dict] = {}
+        
+        for meta, dist in zip(results['metadatas'][0], results['distances'][0]):
+            slug = meta.get('slug')
+            field = meta.get('field')
+            if not slug or field not in PRODUCT_FIELDS:
+                continue
+            sim = 1.0 - dist
+            sims = field_sims.setdefault(slug, {})
+            sims[field] = max(sims.get(field, sim), sim)
+            field_floor[field] = min(field_floor.get(field, sim), sim)
+            if slug not in metadata_by_slug:
+                metadata_by_slug[slug] = {k: v for k, v in meta.items() if k not in ("field", "text_hash")}
+        
+        total_weight = sum(self.field_weights.get(f, 0.0) for f in PRODUCT_FIELDS) or 1.0
+        scored = []
+        for slug, sims in field_sims.items():
+            score = 0.0
+            for field in PRODUCT_FIELDS:
+                sim = sims.get(field, field_floor.get(field, 0.0))
+                score += self.field_weights.get(field, 0.0) * sim
+            score /= total_weight
+            scored.append({
+                "slug": slug,
+                "metadata": metadata_by_slug[slug],
+                "distance": 1.0 - score,
+                "field_scores": sims
+            })
+        
+        scored.sort(key=lambda r: r['distance'])
+        return scored[:n_results]
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--force", action="store_true")
+    parser.add_argument("--resume", action="store_true", help="Продолжить прерванную индексацию по чекпоинту")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--mode", choices=["single", "fields"], default=None)
     parser.add_argument("--search", type=str)
     args = parser.parse_args()
     
-    embeddings = BrickEmbeddings()
+    embeddings = BrickEmbeddings(mode=args.mode)
     if args.search:
         results = embeddings.search(args.search)
         for r in results:
             print(f"- {r['metadata']['name']} ({r['slug']}) dist: {r['distance']:.4f}")
     else:
-        embeddings.index_catalog(force_reindex=args.force)
+        embeddings.index_catalog(force_reindex=args.force, batch_size=args.batch_size, resume=args.resume)
@@ -0,0 +1,350 @@
+"""
+Локальное извлечение структурированных фильтров из запроса консультанта.
+
+Словари брендов и категорий строятся по каталогу, цвета/материалы/типы мебели —
+по встроенным словарям, цены и размеры — регулярными выражениями. Результат:
+where-условие для ChromaDB (по метаданным brand/category/price) и числовые
+ограничения для реранкера.
+"""
+
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?')
+
+# Словари ограничений: каноническое значение -> основы слов (RU/EN)
+COLOR_TERMS = {
+    "white": ["бел", "white", "молочн", "айвори", "ivory"],
+    "black": ["черн", "чёрн", "black"],
+    "gray": ["сер", "графит", "gray", "grey", "anthracite", "антрацит"],
+    "beige": ["беж", "песочн", "beige", "sand", "крем", "cream"],
+    "brown": ["коричн", "шоколад", "brown", "chocolate", "коньяч"],
+    "green": ["зелен", "зелён", "олив", "green", "olive"],
+    "blue": ["син", "голуб", "blue", "navy"],
+    "red": ["красн", "бордо", "терракот", "red", "bordeaux", "terracotta"],
+    "yellow": ["желт", "жёлт", "горчич", "yellow", "mustard"],
+    "pink": ["розов", "pink"],
+    "orange": ["оранж", "orange"],
+}
+MATERIAL_TERMS = {
+    "wood": ["дерев", "дуб", "орех", "ясен", "шпон", "wood", "oak", "walnut", "ash", "veneer"],
+    "metal": ["метал", "стал", "латун", "алюмин", "хром", "metal", "steel", "brass", "aluminium", "aluminum", "chrome"],
+    "glass": ["стекл", "glass"],
+    "leather": ["кож", "leather"],
+    "fabric": ["ткан", "текстил", "букле", "велюр", "бархат", "fabric", "textile", "boucle", "velvet"],
+    "marble": ["мрамор", "marble"],
+    "stone": ["камен", "травертин", "stone", "travertine"],
+    "plastic": ["пластик", "plastic", "polypropylene"],
+    "rattan": ["ротанг", "плетен", "rattan", "wicker"],
+}
+CATEGORY_TERMS = {
+    "sofa": ["диван", "софа", "sofa", "couch"],
+    "armchair": ["кресл", "armchair", "lounge"],
+    "chair": ["стул", "chair", "табурет", "stool"],
+    "table": ["стол", "столик", "table"],
+    "lamp": ["светильн", "ламп", "люстр", "торшер", "lamp", "pendant", "chandelier", "sconce"],
+    "bed": ["кроват", "bed"],
+    "storage": ["шкаф", "комод", "тумб", "буфет", "cabinet", "sideboard", "dresser"],
+    "shelf": ["стеллаж", "полк", "shelf", "bookcase"],
+    "mirror": ["зеркал", "mirror"],
+    "rug": ["ковер", "ковёр", "rug", "carpet"],
+}
+
+CONSTRAINT_DICTS = {"color": COLOR_TERMS, "material": MATERIAL_TERMS, "category": CATEGORY_TERMS}
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+# Окончания (от длинных к коротким), которые снимаются перед сравнением основ
+_ENDINGS = (
+    "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими",
+    "ые", "ый", "ая", "ое", "ой", "ий", "ие", "яя", "ее", "ья", "ье", "ьи",
+    "ов", "ев", "ей", "ам", "ям", "ах", "ях", "ом", "ем", "ым", "им",
+    "ы", "и", "а", "я", "о", "е", "у", "ю", "ь", "s",
+)
+
+
+def stem(word: str, length: int = 5) -> str:
+    """Грубая основа слова: без окончания (основа не короче 3 букв), не длиннее length"""
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            word = word[:-len(ending)]
+            break
+    return word[:length]
+
+
+def match_terms(tokens: Set[str], terms: Dict[str, List[str]]) -> Set[str]:
+    """Канонические значения, основы которых встречаются среди токенов"""
+    found = set()
+    for value, prefixes in terms.items():
+        for prefix in prefixes:
+            if any(t.startswith(prefix) for t in tokens):
+                found.add(value)
+                break
+    return found
+
+
+def parse_price(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = _NUMBER_RE.search(str(value).replace(" ", ""))
+    return float(m.group(0).replace(",", ".")) if m else None
+
+
+# "до 2000 евро", "от 500", "не дороже 3 тыс" (но не "до 200 см", "до 3 мест", "до 5 лет")
+_PRICE_RANGE_RE = re.compile(
+    r'(?i)\b(до|от|не дороже|дешевле|under|below|up to|from)\s*(\d[\d\s]*?)\s*(k\b|к\b|тыс\w*)?\s*(евро|eur\w*|€|руб\w*|₽)?'
+    r'(?!\s*\d)(?!\s*(?:см|мм|м\b|cm|mm|m\b|мест|шт|человек|чел\b|персон|гост|лет|год|месяц|недел|дн|час|seat|person|people|pcs|piece|year))'
+)
+
+# Число без валюты и "тыс" считается ценой, только если похоже на цену
+_MIN_BARE_PRICE = 100
+
+
+def parse_price_constraint(query: str) -> Tuple[Optional[float], Optional[float]]:
+    """(min, max) цены из фраз "до 2000", "от 500", "не дороже 3000" """
+    low = high = None
+    for word, number, thousands, currency in _PRICE_RANGE_RE.findall(query):
+        amount = float(number.replace(" ", ""))
+        if thousands:
+            amount *= 1000
+        elif not currency and amount < _MIN_BARE_PRICE:
+            continue
+        if word.lower() in ("от", "from"):
+            low = amount
+        else:
+            high = amount
+    return low, high
+
+
+_AXES = {
+    "width": ("ширин", "width", "w"),
+    "length": ("длин", "length", "l"),
+    "height": ("высот", "height", "h"),
+    "depth": ("глубин", "depth", "d"),
+    "diameter": ("диаметр", "diameter", "ø"),
+}
+_UNIT_TO_CM = {"мм": 0.1, "mm": 0.1, "см": 1.0, "cm": 1.0, "м": 100.0, "m": 100.0}
+
+# "шириной до 200 см", "высота от 75", "диаметр 120 см"
+_DIM_RE = re.compile(
+    r'(?i)(ширин\w*|длин\w*|высот\w*|глубин\w*|диаметр\w*|width|length|height|depth|diameter)\s*'
+    r'(до|не более|от|не менее|max|min)?\s*(\d+(?:[.,]\d+)?)\s*(мм|см|м|mm|cm|m)?\b'
+)
+# "200x90 см", "200 х 90 х 80"
+_DIM_TRIPLE_RE = re.compile(r'(?i)\b(\d+(?:[.,]\d+)?)\s*[xх×*]\s*(\d+(?:[.,]\d+)?)(?:\s*[xх×*]\s*(\d+(?:[.,]\d+)?))?\s*(мм|см|м|mm|cm|m)?\b')
+# Допуск для точного размера из "200x90"
+_DIM_TOLERANCE = 0.1
+
+
+def _axis_of(word: str) -> Optional[str]:
+    word = word.lower()
+    for axis, prefixes in _AXES.items():
+        if any(word.startswith(p) for p in prefixes if len(p) > 1):
+            return axis
+    return None
+
+
+def _to_cm(value: str, unit: Optional[str]) -> float:
+    return float(value.replace(",", ".")) * _UNIT_TO_CM.get((unit or "см").lower(), 1.0)
+
+
+def parse_dimensions(query: str) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """axis -> (min_cm, max_cm)"""
+    dims: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+    for word, op, value, unit in _DIM_RE.findall(query):
+        axis = _axis_of(word)
+        if not axis:
+            continue
+        cm = _to_cm(value, unit)
+        op = op.lower()
+        if op in ("до", "не более", "max"):
+            dims[axis] = (dims.get(axis, (None, None))[0], cm)
+        elif op in ("от", "не менее", "min"):
+            dims[axis] = (cm, dims.get(axis, (None, None))[1])
+        else:
+            dims[axis] = (cm * (1 - _DIM_TOLERANCE), cm * (1 + _DIM_TOLERANCE))
+    match = _DIM_TRIPLE_RE.search(query)
+    if match:
+        first, second, third, unit = match.groups()
+        for axis, value in zip(("length", "width", "height"), (first, second, third)):
+            if value and axis not in dims:
+                cm = _to_cm(value, unit)
+                dims[axis] = (cm * (1 - _DIM_TOLERANCE), cm * (1 + _DIM_TOLERANCE))
+    return dims
+
+
+# "L: 200 x W: 90 x H: 80" (WooCommerce) и отдельные характеристики "Ширина: 90 см"
+_WC_DIM_RE = re.compile(r'(?i)\b([LWHD])\s*:\s*(\d+(?:[.,]\d+)?)')
+_WC_AXES = {"l": "length", "w": "width", "h": "height", "d": "depth"}
+_VALUE_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*(мм|см|м|mm|cm|m)?\b', re.IGNORECASE)
+
+
+def parse_product_dimensions(attributes: Dict) -> Dict[str, float]:
+    """Размеры товара в см из характеристик"""
+    dims: Dict[str, float] = {}
+    for key, value in attributes.items():
+        if not value:
+            continue
+        text = str(value)
+        if "размер" in key.lower():
+            for letter, number in _WC_DIM_RE.findall(text):
+                dims.setdefault(_WC_AXES[letter.lower()], float(number.replace(",", ".")))
+            continue
+        axis = _axis_of(key)
+        if axis:
+            m = _VALUE_RE.search(text)
+            if m:
+                dims.setdefault(axis, _to_cm(m.group(1), m.group(2)))
+    return dims
+
+
+@dataclass
+class QueryFilters:
+    """Ограничения, извлеченные из запроса"""
+    colors: Set[str] = field(default_factory=set)
+    materials: Set[str] = field(default_factory=set)
+    categories: Set[str] = field(default_factory=set)  # канонические типы мебели (CATEGORY_TERMS)
+    brands: List[str] = field(default_factory=list)  # названия брендов каталога
+    catalog_categories: List[str] = field(default_factory=list)  # названия категорий каталога
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    dimensions: Dict[str, Tuple[Optional[float], Optional[float]]] = field(default_factory=dict)
+    where_clauses: List[Dict] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    @property
+    def empty(self) -> bool:
+        return not (self.colors or self.materials or self.categories or self.brands or self.catalog_categories
+                    or self.price_min is not None or self.price_max is not None or self.dimensions)
+
+
+def extract_constraints(query: str) -> QueryFilters:
+    """Ограничения без словарей каталога (цвет, материал, тип, цена, размеры)"""
+    tokens = set(tokenize(query))
+    low, high = parse_price_constraint(query)
+    return QueryFilters(
+        colors=match_terms(tokens, COLOR_TERMS),
+        materials=match_terms(tokens, MATERIAL_TERMS),
+        categories=match_terms(tokens, CATEGORY_TERMS),
+        price_min=low,
+        price_max=high,
+        dimensions=parse_dimensions(query),
+    )
+
+
+def combine_where(clauses: List[Dict]) -> Optional[Dict]:
+    """Список условий -> where для ChromaDB"""
+    clauses = [c for c in clauses if c]
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+class FilterExtractor:
+    """Извлечение фильтров по словарям каталога + статистика срабатываний"""
+
+    # Максимальная длина основы слова категории ("обеденные столы" и "обеденный стол" -> "обеде", "стол")
+    STEM_LENGTH = 5
+
+    def __init__(self, catalog: Dict[str, Dict]):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {
+            "queries": 0, "with_filters": 0, "brand": 0, "category": 0, "color": 0,
+            "material": 0, "price": 0, "dimensions": 0, "fallbacks": 0, "total_ms": 0.0
+        }
+        self.rebuild(catalog)
+
+    def rebuild(self, catalog: Dict[str, Dict]):
+        # Бренд -> как записан в каталоге; только бренды из 3+ символов
+        self.brands: Dict[str, str] = {}
+        categories: Set[str] = set()
+        for p in catalog.values():
+            brand = str(p.get('brand') or '').strip()
+            if len(brand) >= 3:
+                self.brands.setdefault(" ".join(tokenize(brand)), brand)
+            category = str(p.get('category') or '').strip()
+            if category:
+                categories.add(category)
+        self._brand_re = None
+        if self.brands:
+            alternatives = sorted(self.brands, key=len, reverse=True)
+            self._brand_re = re.compile(r'(?<!\w)(' + "|".join(re.escape(b) for b in alternatives) + r')(?!\w)')
+        # Категория каталога -> основы её слов
+        self.categories: List[Tuple[str, Set[str]]] = [
+            (c, self._stems(tokenize(c))) for c in sorted(categories)
+        ]
+
+    def _stems(self, tokens: List[str]) -> Set[str]:
+        """Одно правило для слов категорий и запроса: слова от 4 букв, без окончаний"""
+        return {stem(t, self.STEM_LENGTH) for t in tokens if len(t) >= 4}
+
+    def _match_categories(self, tokens: List[str]) -> List[str]:
+        stems = self._stems(tokens)
+        return [c for c, c_stems in self.categories if c_stems and c_stems <= stems]
+
+    def extract(self, query: str) -> QueryFilters:
+        started = time.perf_counter()
+        filters = extract_constraints(query)
+        normalized = " ".join(tokenize(query))
+
+        if self._brand_re:
+            filters.brands = sorted({self.brands[m] for m in self._brand_re.findall(normalized)})
+        filters.catalog_categories = self._match_categories(normalized.split())
+
+        if filters.brands:
+            filters.where_clauses.append(
+                {"brand": filters.brands[0]} if len(filters.brands) == 1 else {"brand": {"$in": filters.brands}}
+            )
+        if filters.catalog_categories:
+            cats = filters.catalog_categories
+            filters.where_clauses.append({"category": cats[0]} if len(cats) == 1 else {"category": {"$in": cats}})
+        if filters.price_max is not None:
+            filters.where_clauses.append({"price": {"$lte": filters.price_max}})
+        if filters.price_min is not None:
+            filters.where_clauses.append({"price": {"$gte": filters.price_min}})
+
+        filters.elapsed_ms = (time.perf_counter() - started) * 1000
+        self._record(filters)
+        return filters
+
+    def _record(self, filters: QueryFilters):
+        with self._lock:
+            c = self.counters
+            c["queries"] += 1
+            c["total_ms"] += filters.elapsed_ms
+            if not filters.empty:
+                c["with_filters"] += 1
+            c["brand"] += bool(filters.brands)
+            c["category"] += bool(filters.catalog_categories or filters.categories)
+            c["color"] += bool(filters.colors)
+            c["material"] += bool(filters.materials)
+            c["price"] += filters.price_min is not None or filters.price_max is not None
+            c["dimensions"] += bool(filters.dimensions)
+
+    def record_fallback(self):
+        with self._lock:
+            self.counters["fallbacks"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            c = dict(self.counters)
+        queries = c.pop("queries")
+        total_ms = c.pop("total_ms")
+        return {
+            "queries": queries,
+            "avg_ms": round(total_ms / queries, 3) if queries else 0.0,
+            "hit_rates": {k: round(v / queries, 4) if queries else 0.0 for k, v in c.items()},
+            "brands": len(self.brands),
+            "categories": len(self.categories)
+        }
@@ -0,0 +1,140 @@
+"""
+Компактизация истории чата.
+
+В Gemini уходит: краткое содержание старой части разговора + последние N ходов.
+Когда несуммаризированная история превышает бюджет токенов, старые ходы
+сворачиваются в сохраненное summary в фоне, уже после отправки ответа.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from rich.console import Console
+
+console = Console()
+
+SUMMARY_PROMPT = """Ты ведешь заметки по диалогу консультанта по дизайнерской мебели с клиентом.
+Обнови краткое содержание разговора с учетом новых сообщений.
+Сохрани: что ищет клиент (тип мебели, стиль, цвета, материалы, размеры, бюджет), упомянутые и
+рекомендованные товары (названия, артикулы), принятые решения и открытые вопросы.
+Пиши кратко, по-русски, списком, не более 200 слов.
+
+Текущее краткое содержание:
+{summary}
+
+Новые сообщения:
+{transcript}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (~3 символа на токен для смешанного RU/EN текста)"""
+    return len(text) // 3 + 1
+
+
+class HistoryCompactor:
+    """Сборка истории для модели и фоновое обновление summary"""
+
+    # Сколько несуммаризированных сообщений читать за раз
+    MAX_UNSUMMARIZED = 200
+
+    def __init__(self, storage, model, token_budget: int, keep_turns: int):
+        self.storage = storage
+        self.model = model
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _tokens(item: Dict) -> int:
+        return item.get("token_count") or estimate_tokens(" ".join(item["parts"]))
+
+    def _unsummarized(self, user_id: str):
+        summary = self.storage.get_summary(user_id)
+        after_id = summary["last_message_id"] if summary else None
+        messages = self.storage.get_history(user_id, limit=self.MAX_UNSUMMARIZED, after_id=after_id)
+        return summary, messages
+
+    def _tail(self, messages: List[Dict]) -> List[Dict]:
+        """Последние keep_turns ходов + более ранние сообщения, пока укладываемся в бюджет"""
+        keep = self.keep_turns * 2
+        tail = messages[-keep:] if keep else []
+        used = sum(self._tokens(m) for m in tail)
+        for item in reversed(messages[:len(messages) - len(tail)]):
+            used += self._tokens(item)
+            if used > self.token_budget:
+                break
+            tail.insert(0, item)
+        # История для Gemini начинается с реплики пользователя
+        while tail and tail[0]["role"] != "user":
+            tail.pop(0)
+        return tail
+
+    def history_for_model(self, user_id: str) -> List[Dict]:
+        summary, messages = self._unsummarized(user_id)
+        history = []
+        if summary:
+            history.append({"role": "user", "parts": [f"Краткое содержание нашего предыдущего разговора:\n{summary['summary']}"]})
+            history.append({"role": "model", "parts": ["Хорошо, учту это в ответах."]})
+        history.extend({"role": m["role"], "parts": m["parts"]} for m in self._tail(messages))
+
+        tokens = sum(estimate_tokens(" ".join(h["parts"])) for h in history)
+        console.print(f"[dim]History for model: {len(history)} messages, ~{tokens} tokens (summary: {'yes' if summary else 'no'})[/dim]")
+        return history
+
+    def _needs_compaction(self, messages: List[Dict]) -> bool:
+        if len(messages) <= self.keep_turns * 2:
+            return False
+        return sum(self._tokens(m) for m in messages) > self.token_budget
+
+    @staticmethod
+    def _transcript(messages: List[Dict]) -> str:
+        lines = []
+        for m in messages:
+            who = "Клиент" if m["role"] == "user" else "Консультант"
+            line = f"{who}: {' '.join(m['parts'])}"
+            if m.get("product_slugs"):
+                line += f" [товары: {', '.join(m['product_slugs'])}]"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def refresh(self, user_id: str) -> bool:
+        """Сворачивает в summary все несуммаризированные ходы, кроме последних keep_turns"""
+        summary, messages = self._unsummarized(user_id)
+        if not self._needs_compaction(messages):
+            return False
+        fold = messages[:len(messages) - self.keep_turns * 2]
+        # Сворачиваем только целые ходы (заканчиваются ответом модели)
+        while fold and fold[-1]["role"] != "model":
+            fold.pop()
+        if not fold:
+            return False
+
+        prompt = SUMMARY_PROMPT.format(
+            summary=summary["summary"] if summary else "(пусто)",
+            transcript=self._transcript(fold)
+        )
+        text = self.model.generate_content(prompt).text.strip()
+        self.storage.save_summary(user_id, text, fold[-1]["id"], estimate_tokens(text))
+        console.print(f"[dim]History summary updated for {user_id}: folded {len(fold)} messages[/dim]")
+        return True
+
+    def _refresh_safe(self, user_id: str):
+        try:
+            self.refresh(user_id)
+        except Exception as e:
+            console.print(f"[yellow]History summary failed for {user_id}: {e}[/yellow]")
+        finally:
+            with self._lock:
+                self._inflight.discard(user_id)
+
+    def schedule_refresh(self, user_id: str):
+        """Фоновое обновление summary (не более одного на пользователя одновременно)"""
+        with self._lock:
+            if user_id in self._inflight:
+                return
+            self._inflight.add(user_id)
+        self._executor.submit(self._refresh_safe, user_id)
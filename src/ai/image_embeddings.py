@@ -0,0 +1,195 @@
+"""
+Векторы изображений товаров для прямого поиска "фото -> товар".
+
+Отдельная коллекция ChromaDB с эмбеддингами main_image каждого товара
+(наполняется оффлайн: scripts/build_image_index.py). Поиск по фото
+запрашивает ее эмбеддингом загруженного изображения, без текстового
+анализа Gemini.
+
+Бэкенды:
+- "local": детерминированный CPU-эмбеддер на дескрипторах визуального
+  индекса (Lab-гистограмма + pHash + текстура), без сети — для тестов и
+  офлайн-режима;
+- "vertex": Vertex AI multimodalembedding@001 (REST).
+"""
+
+import base64
+import io
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import PIL.Image
+import requests
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from rich.console import Console
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config.settings import DATA_DIR, VERTEX_PROJECT, VERTEX_LOCATION, VERTEX_ACCESS_TOKEN
+from src.ai.embeddings import BrickEmbeddings, EmbeddingError
+from src.ai.image_preprocess import PreparedImage
+from src.ai.thumbnail_cache import ThumbnailCache
+from src.ai.visual_index import describe, W_HIST, W_PHASH, W_TEXTURE
+
+console = Console()
+
+IMAGE_COLLECTION_NAME = "designer_furniture_images_{backend}_v1"
+
+
+def _load_bytes(item: Union[bytes, str]) -> bytes:
+    """Байты изображения: bytes как есть, строка — путь к файлу или URL"""
+    if isinstance(item, bytes):
+        return item
+    if item.startswith("http"):
+        resp = requests.get(item, timeout=15)
+        resp.raise_for_status()
+        return resp.content
+    return Path(item).read_bytes()
+
+
+class LocalImageEmbeddingFunction(EmbeddingFunction):
+    """Детерминированный локальный эмбеддер изображений (одинаковая картинка -> одинаковый вектор)"""
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self.embed_images([_load_bytes(i) for i in input])
+
+    def embed_images(self, images: List[bytes], strict: bool = False) -> Embeddings:
+        vectors = []
+        for content in images:
+            try:
+                img = PIL.Image.open(io.BytesIO(content))
+                img.load()
+                hist, bits, texture = describe(img)
+            except Exception as e:
+                # Нулевой вектор для битой картинки бессмыслен и в нестрогом режиме
+                raise EmbeddingError(f"Cannot describe image: {e}") from e
+            # Гистограмма и pHash (±1/8) единичной нормы, веса как в визуальном индексе
+            phash = (bits.astype(np.float32) * 2 - 1) / np.sqrt(len(bits))
+            vec = np.concatenate([W_HIST * hist, W_PHASH * phash, W_TEXTURE * texture])
+            vectors.append((vec / (np.linalg.norm(vec) or 1.0)).tolist())
+        return vectors
+
+
+class VertexMultimodalEmbeddingFunction(EmbeddingFunction):
+    """Vertex AI multimodal embeddings через REST (работает через тот же прокси, что и requests)"""
+
+    def __init__(self, project: str, location: str = "us-central1", model_name: str = "multimodalembedding@001", dimension: int = 1408):
+        if not project:
+            raise ValueError("VERTEX_PROJECT is required for the vertex image embeddings backend")
+        self.dimension = dimension
+        self.url = (
+            f"https://{location}-aiplatform.googleapis.com/v1/projects/{project}/locations/{location}"
+            f"/publishers/google/models/{model_name}:predict"
+        )
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self.embed_images([_load_bytes(i) for i in input])
+
+    @staticmethod
+    def _access_token() -> str:
+        if VERTEX_ACCESS_TOKEN:
+            return VERTEX_ACCESS_TOKEN
+        try:
+            import google.auth
+            import google.auth.transport.requests
+        except ImportError:
+            raise EmbeddingError("Set VERTEX_ACCESS_TOKEN or install google-auth for Vertex AI embeddings")
+        credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+        credentials.refresh(google.auth.transport.requests.Request())
+        return credentials.token
+
+    def embed_images(self, images: List[bytes], strict: bool = False) -> Embeddings:
+        headers = {"Authorization": f"Bearer {self._access_token()}"}
+        vectors = []
+        # Модель принимает одно изображение на instance
+        for content in images:
+            payload = {
+                "instances": [{"image": {"bytesBase64Encoded": base64.b64encode(content).decode()}}],
+                "parameters": {"dimension": self.dimension}
+            }
+            try:
+                response = requests.post(self.url, json=payload, headers=headers, timeout=60)
+                response.raise_for_status()
+                vectors.append(response.json()["predictions"][0]["imageEmbedding"])
+            except Exception as e:
+                if strict:
+                    raise EmbeddingError(f"Vertex image embedding failed: {e}") from e
+                print(f"Vertex image embedding failed: {e}", file=sys.stderr)
+                vectors.append([0.0] * self.dimension)
+        return vectors
+
+
+def make_image_embedding_fn(backend: str) -> EmbeddingFunction:
+    if backend == "local":
+        return LocalImageEmbeddingFunction()
+    if backend == "vertex":
+        return VertexMultimodalEmbeddingFunction(VERTEX_PROJECT, VERTEX_LOCATION)
+    raise ValueError(f"Unknown image embeddings backend: {backend}")
+
+
+class ProductImageEmbeddings(BrickEmbeddings):
+    """Коллекция векторов главных изображений товаров (та же инфраструктура индексации и партиций)"""
+
+    def __init__(self, backend: str = "local", persist_directory: Optional[str] = None, thumbnails: Optional[ThumbnailCache] = None):
+        self.backend = backend
+        # Те же миниатюры, что у консультанта и визуального индекса
+        self.thumbnails = thumbnails or ThumbnailCache(64 * 1024 * 1024, disk_dir=DATA_DIR / "cache" / "thumbnails")
+        super().__init__(
+            persist_directory=persist_directory,
+            mode="single",
+            collection_name=IMAGE_COLLECTION_NAME.format(backend=backend),
+            embedding_fn=make_image_embedding_fn(backend)
+        )
+
+    @staticmethod
+    def _image_url(product: Dict) -> Optional[str]:
+        return product.get('main_image') or (product.get('images') or [None])[0]
+
+    def _fetch_image(self, url: str) -> Optional[bytes]:
+        data = self.thumbnails.get(url)
+        if data is None:
+            resp = requests.get(url, timeout=15)
+            resp.raise_for_status()
+            data = self.thumbnails.make_thumbnail(resp.content)
+            self.thumbnails.put(url, data)
+        return data
+
+    def _upsert_products(self, products: List[Dict], strict: bool = False):
+        """Эмбеддинги изображений считаются здесь (коллекция не хранит текстовые документы)"""
+        ids, images, documents, metadatas = [], [], [], []
+        for p in products:
+            url = self._image_url(p)
+            if not url:
+                continue
+            try:
+                images.append(self._fetch_image(url))
+            except Exception as e:
+                if strict:
+                    raise EmbeddingError(f"Cannot fetch image for {p['slug']}: {e}") from e
+                console.print(f"[yellow]Skip {p['slug']}: {e}[/yellow]")
+                continue
+            ids.append(p['slug'])
+            documents.append(url)
+            metadatas.append({**self._product_metadata(p), "image_url": url})
+
+        if ids:
+            self.collection.upsert(
+                ids=ids,
+                embeddings=self.embedding_fn.embed_images(images, strict=strict),
+                documents=documents,
+                metadatas=metadatas
+            )
+            indexed = set(ids)
+            for p in products:
+                if p['slug'] in indexed:
+                    self.partitions.add(p.get('source', 'unknown'), [p['slug']])
+            self._commit_index_change()
+
+    def search_image(self, image: PreparedImage, n_results: int = 10, where: Optional[Dict] = None) -> List[Dict]:
+        """Ближайшие товары по эмбеддингу загруженного изображения"""
+        vector = self.embedding_fn.embed_images([image.data], strict=True)[0]
+        return self._search_single("", n_results=n_results, where=where, query_embedding=vector)
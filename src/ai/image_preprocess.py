@@ -0,0 +1,151 @@
+"""
+Единая подготовка пользовательских изображений (чат и поиск по фото).
+
+Изображение декодируется один раз: поворот по EXIF, приведение к RGB,
+уменьшение до IMAGE_MAX_EDGE и одно JPEG-кодирование. Полученный payload
+переиспользуется всеми вызовами Gemini без временных файлов на диске.
+"""
+
+import base64
+import binascii
+import hashlib
+import io
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import PIL.Image
+import PIL.ImageOps
+
+from config.settings import IMAGE_MAX_EDGE, IMAGE_JPEG_QUALITY
+
+
+@dataclass
+class PreparedImage:
+    """Нормализованное изображение: JPEG-байты + размеры"""
+    data: bytes
+    width: int
+    height: int
+    mime_type: str = "image/jpeg"
+    _b64: Optional[str] = field(default=None, repr=False)
+    _sha256: Optional[str] = field(default=None, repr=False)
+    _dhash: Optional[int] = field(default=None, repr=False)
+
+    @property
+    def b64(self) -> str:
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self.data).decode()
+        return self._b64
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+
+    @property
+    def dhash(self) -> int:
+        """64-битный разностный хэш: почти одинаковые фото отличаются на несколько бит"""
+        if self._dhash is None:
+            self._dhash = dhash(self.to_pil())
+        return self._dhash
+
+    def to_part(self) -> Dict:
+        """Часть сообщения для Gemini (base64 кодируется один раз на изображение)"""
+        return {"mime_type": self.mime_type, "data": self.b64}
+
+    def to_pil(self) -> PIL.Image.Image:
+        return PIL.Image.open(io.BytesIO(self.data))
+
+
+def dhash(img: PIL.Image.Image, size: int = 8) -> int:
+    """Difference hash: сравнение соседних пикселей уменьшенного серого изображения"""
+    gray = img.convert("L").resize((size + 1, size), PIL.Image.LANCZOS)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def decode_base64_image(source: str) -> bytes:
+    """base64 или data URL -> сырые байты (единственный формат строки изображения из запросов)"""
+    if "base64," in source:
+        source = source.split("base64,", 1)[1]
+    try:
+        return base64.b64decode(source, validate=False)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Invalid base64 image: {e}")
+
+
+def read_image_source(source: Union[bytes, str, Path]) -> bytes:
+    """
+    bytes, путь к файлу, base64 или data URL -> сырые байты.
+    Только для скриптов и внутренних вызовов: строка из запроса не должна попадать сюда,
+    иначе клиент сможет прочитать файл сервера.
+    """
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, Path):
+        return source.read_bytes()
+    if "base64," not in source and len(source) < 1024 and Path(source).exists():
+        return Path(source).read_bytes()
+    return decode_base64_image(source)
+
+
+def prepare_base64_image(source: str, max_edge: int = IMAGE_MAX_EDGE, quality: int = IMAGE_JPEG_QUALITY) -> PreparedImage:
+    """Изображение из запроса (base64 или data URL)"""
+    return prepare_image(decode_base64_image(source), max_edge=max_edge, quality=quality)
+
+
+def load_image(source: Union[bytes, str, Path, PreparedImage], max_edge: int = IMAGE_MAX_EDGE, quality: int = IMAGE_JPEG_QUALITY) -> PreparedImage:
+    """Изображение для скриптов и внутренних вызовов (в том числе путь к файлу)"""
+    if isinstance(source, PreparedImage):
+        return source
+    return prepare_image(read_image_source(source), max_edge=max_edge, quality=quality)
+
+
+def prepare_image(source: Union[bytes, PreparedImage], max_edge: int = IMAGE_MAX_EDGE, quality: int = IMAGE_JPEG_QUALITY) -> PreparedImage:
+    """
+    Декодирует изображение один раз и приводит к JPEG не больше max_edge по длинной стороне.
+    Принимает только байты (загрузки и внутренние вызовы); строки из запросов — через
+    prepare_base64_image, пути к файлам — через load_image.
+    Уже подходящий JPEG без EXIF-поворота не перекодируется.
+    Raises ValueError, если это не изображение.
+    """
+    if isinstance(source, PreparedImage):
+        return source
+    if not isinstance(source, bytes):
+        raise TypeError("prepare_image accepts bytes; use prepare_base64_image or load_image")
+    raw = source
+    try:
+        img = PIL.Image.open(io.BytesIO(raw))
+        img.load()
+    except Exception as e:
+        raise ValueError(f"Cannot decode image: {e}")
+
+    orientation = img.getexif().get(0x0112, 1)
+    if img.format == "JPEG" and img.mode == "RGB" and orientation == 1 and max(img.size) <= max_edge:
+        return PreparedImage(data=raw, width=img.width, height=img.height)
+
+    img = PIL.ImageOps.exif_transpose(img)
+    if img.mode in ("RGBA", "LA", "P"):
+        # Прозрачность -> белый фон (JPEG без альфа-канала)
+        img = img.convert("RGBA")
+        background = PIL.Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((max_edge, max_edge))
+
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality)
+    return PreparedImage(data=out.getvalue(), width=img.width, height=img.height)
@@ -2,8 +2,8 @@
 Поиск кирпича по изображению
 Использует Gemini Vision для анализа + ChromaDB для поиска похожих
 """
-import base64
 import json
+import threading
 from pathlib import Path
 from typing import List, Dict, Optional, Union
 import google.generativeai as genai
@@ -11,8 +11,21 @@ from rich.console import Console
 import sys
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-from config.settings import GEMINI_API_KEY, DATA_DIR
+from config.settings import (
+    GEMINI_API_KEY, DATA_DIR,
+    VISION_CACHE_ENABLED, VISION_CACHE_MAX_ENTRIES, VISION_CACHE_MAX_AGE_DAYS, VISION_CACHE_MAX_DISTANCE,
+    VISUAL_SEARCH_MODE, VISUAL_BLEND_WEIGHT,
+    TEXTURE_THUMB_SIZE, TEXTURE_THUMB_CACHE_MAX_BYTES, TEXTURE_INDEX_REFRESH,
+    IMAGE_SEARCH_CANDIDATES, VISION_RERANK_POOL, GEMINI_MAX_CONCURRENCY,
+    IMAGE_EMBEDDINGS_BACKEND
+)
 from src.ai.embeddings import BrickEmbeddings
+from src.ai.image_embeddings import ProductImageEmbeddings
+from src.ai.image_preprocess import PreparedImage, load_image
+from src.ai.vision_cache import VisionAnalysisCache
+from src.ai.visual_index import VisualIndex
+from src.ai.texture_index import TextureIndex
+from src.ai.thumbnail_cache import ThumbnailCache
 
 console = Console()
 genai.configure(api_key=GEMINI_API_KEY, transport="rest")
@@ -20,6 +33,14 @@ genai.configure(api_key=GEMINI_API_KEY, transport="rest")
 # Модель для анализа изображений
 vision_model = genai.GenerativeModel("gemini-3-flash-preview")
 
+# Общий лимит одновременных запросов к Gemini Vision (пакетный поиск гоняет пайплайны параллельно)
+_gemini_slots = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+
+
+def _generate(content):
+    with _gemini_slots:
+        return vision_model.generate_content(content)
+
 ANALYSIS_PROMPT = """Проанализируй изображение предмета мебели или света и опиши его характеристики для поиска в каталоге.
 
 Опиши:
@@ -50,40 +71,60 @@ class ImageSearch:
         with open(catalog_path, 'r', encoding='utf-8') as f:
             self.catalog = {p['slug']: p for p in json.load(f) if p.get('slug')}
         
+        # Локальный визуальный индекс (scripts/build_visual_index.py)
+        self.visual_index = VisualIndex() if VISUAL_SEARCH_MODE != "off" else None
+        
+        # Векторы изображений товаров (scripts/build_image_index.py): фото -> товар без анализа Gemini
+        self.image_vectors = None
+        if IMAGE_EMBEDDINGS_BACKEND != "off":
+            try:
+                self.image_vectors = ProductImageEmbeddings(IMAGE_EMBEDDINGS_BACKEND)
+            except Exception as e:
+                console.print(f"[yellow]Image embeddings disabled: {e}[/yellow]")
+        
+        # Лучшие текстуры товаров и их миниатюры для reranking
+        self.textures = TextureIndex(
+            DATA_DIR / "downloads",
+            ThumbnailCache(
+                TEXTURE_THUMB_CACHE_MAX_BYTES,
+                disk_dir=DATA_DIR / "cache" / "texture_thumbnails",
+                size=TEXTURE_THUMB_SIZE
+            ),
+            refresh_interval=TEXTURE_INDEX_REFRESH
+        )
+        
+        # Кэш анализа повторно загружаемых фото (sha256 + dHash)
+        self.analysis_cache = VisionAnalysisCache(
+            DATA_DIR / "vision_cache.db",
+            max_entries=VISION_CACHE_MAX_ENTRIES,
+            max_age=VISION_CACHE_MAX_AGE_DAYS * 86400,
+            max_distance=VISION_CACHE_MAX_DISTANCE
+        ) if VISION_CACHE_ENABLED else None
+        
         console.print("[green]✓ ImageSearch инициализирован[/green]")
     
-    def analyze_image(self, image_data: Union[bytes, str, Path]) -> Dict:
+    def analyze_image(self, image_data: Union[bytes, str, Path, PreparedImage]) -> Dict:
         """
         Анализирует изображение кирпича
         
         Args:
-            image_data: bytes изображения, путь к файлу или base64 строка
+            image_data: подготовленное изображение, bytes, путь к файлу или base64 строка
             
         Returns:
             Словарь с анализом (цвет, текстура, стиль)
         """
-        # Подготовка изображения
-        if isinstance(image_data, (str, Path)):
-            path = Path(image_data)
-            if path.exists():
-                with open(path, 'rb') as f:
-                    image_bytes = f.read()
-            else:
-                # Предполагаем base64
-                image_bytes = base64.b64decode(image_data)
-        else:
-            image_bytes = image_data
+        image = load_image(image_data)
+        
+        if self.analysis_cache is not None:
+            cached = self.analysis_cache.get(image)
+            if cached is not None:
+                console.print(f"[dim]Vision analysis cache hit: {image.sha256[:12]}[/dim]")
+                return cached
         
         # Запрос к Gemini Vision
-        content = [
-            ANALYSIS_PROMPT,
-            {
-                "mime_type": "image/jpeg",
-                "data": base64.b64encode(image_bytes).decode()
-            }
-        ]
+        content = [ANALYSIS_PROMPT, image.to_part()]
         
-        response = vision_model.generate_content(content)
+        response = _generate(content)
         text = response.text
         
         # Парсим JSON из ответа
@@ -92,21 +133,43 @@ class ImageSearch:
         elif "```" in text:
             text = text.split("```")[1].split("```")[0]
         
-        return json.loads(text.strip())
+        analysis = json.loads(text.strip())
+        if self.analysis_cache is not None:
+            self.analysis_cache.put(image, analysis)
+        return analysis
     
-    def search_by_image(self, image_data: Union[bytes, str, Path], n_results: int = 5) -> List[Dict]:
+    def search_by_image(self, image_data: Union[bytes, str, Path, PreparedImage], n_results: Optional[int] = 5, candidates: int = IMAGE_SEARCH_CANDIDATES) -> List[Dict]:
         """
         Поиск похожих кирпичей по изображению
         
         Args:
-            image_data: Изображение (bytes, путь или base64)
-            n_results: Количество результатов
+            image_data: Изображение (PreparedImage, bytes, путь или base64)
+            n_results: Количество результатов (None — весь ранжированный пул кандидатов)
+            candidates: Размер пула кандидатов векторного поиска
             
         Returns:
             Список найденных продуктов с метаданными
         """
-        # Анализируем изображение
-        analysis = self.analyze_image(image_data)
+        # Декодируем и уменьшаем один раз: тот же payload уходит в анализ и в reranking
+        image = load_image(image_data)
+        
+        # Мгновенные визуальные соседи из локального индекса (без API)
+        visual = self._visual_neighbours(image, max(50, candidates))
+        if VISUAL_SEARCH_MODE == "visual" and visual:
+            return [
+                {**v, 'distance': 1 - v['visual_score'], 'product': self.catalog.get(v['slug'], {}), 'analysis': None}
+                for v in visual[:n_results]
+            ]
+        
+        # Прямой поиск по векторам изображений: без генерации текстового анализа
+        by_image = self._image_vector_candidates(image, candidates)
+        if by_image:
+            detailed_results = self._blend_visual(by_image, visual, None)
+            top = self.rerank_candidates(image, detailed_results[:VISION_RERANK_POOL])
+            detailed_results = top + detailed_results[VISION_RERANK_POOL:]
+            return detailed_results if n_results is None else detailed_results[:n_results]
+        
+        analysis = self.analyze_image(image)
         
         # Формируем поисковый запрос
         search_query = analysis.get('search_query', '')
@@ -114,8 +177,8 @@ class ImageSearch:
             # Формируем из компонентов
             search_query = f"{analysis.get('color_description', '')} {analysis.get('texture_description', '')}"
         
-        # Ищем в ChromaDB (Топ-10 для Reranking)
-        results = self.embeddings.search(search_query, n_results=10)
+        # Ищем в ChromaDB (весь пул кандидатов; Vision Reranking — только по верхним)
+        results = self.embeddings.search(search_query, n_results=candidates)
         
         # Добавляем детали продуктов
         detailed_results = []
@@ -126,42 +189,78 @@ class ImageSearch:
                 'product': product,
                 'analysis': analysis
             })
+        detailed_results = self._blend_visual(detailed_results, visual, analysis)
             
         # RERANKING
-        # Если есть байты изображения, запускаем Reranking
-        if isinstance(image_data, bytes):
-            detailed_results = self.rerank_candidates(image_data, detailed_results)
-        elif isinstance(image_data, (str, Path)):
-            p = Path(image_data)
-            if p.exists():
-                with open(image_data, "rb") as f:
-                    detailed_results = self.rerank_candidates(f.read(), detailed_results)
+        top = self.rerank_candidates(image, detailed_results[:VISION_RERANK_POOL])
+        detailed_results = top + detailed_results[VISION_RERANK_POOL:]
 
         # Обрезаем до начального запроса n_results (обычно 5)
-        return detailed_results[:n_results]
+        return detailed_results if n_results is None else detailed_results[:n_results]
     
-    def _get_best_texture_image(self, slug: str) -> Optional[Path]:
-        """Ищет лучшее изображение текстуры для продукта"""
-        textures_dir = DATA_DIR / "downloads" / slug / "textures"
-        if not textures_dir.exists():
-            return None
-            
-        # Ищем все jpg
-        images = list(textures_dir.glob("*.jpg"))
-        if not images:
-            return None
-            
-        # Приоритет: WF, потом 01
-        # Сортируем так, чтобы WF были первыми, и по имени
-        images.sort(key=lambda p: (
-            0 if "WF" in p.name and "50mm" not in p.name else 1, 
-            0 if "_01_" in p.name else 1,
-            p.name
-        ))
+    def _image_vector_candidates(self, image: PreparedImage, n: int) -> List[Dict]:
+        """Кандидаты из коллекции векторов изображений ([] — коллекция пуста или недоступна)"""
+        if self.image_vectors is None or not self.image_vectors.collection.count():
+            return []
+        try:
+            results = self.image_vectors.search_image(image, n_results=n)
+        except Exception as e:
+            console.print(f"[yellow]Image vector search failed, falling back to analysis: {e}[/yellow]")
+            return []
+        return [
+            {**r, 'product': self.catalog[r['slug']], 'analysis': None}
+            for r in results if r['slug'] in self.catalog
+        ]
+
+    def _visual_neighbours(self, image: PreparedImage, n: int = 50) -> List[Dict]:
+        if self.visual_index is None or not len(self.visual_index):
+            return []
+        try:
+            return self.visual_index.search(image.to_pil(), n_results=n)
+        except Exception as e:
+            console.print(f"[yellow]Visual index search failed: {e}[/yellow]")
+            return []
+
+    def _blend_visual(self, results: List[Dict], visual: List[Dict], analysis: Optional[Dict], extra: int = 5) -> List[Dict]:
+        """
+        Смешивает текстовую похожесть (1 - distance) с визуальной:
+        score = (1 - w) * text + w * visual. Лучшие визуальные соседи, не найденные
+        по тексту, добавляются кандидатами.
+        """
+        if not visual:
+            return results
+        w = VISUAL_BLEND_WEIGHT
+        visual_scores = {v['slug']: v['visual_score'] for v in visual}
+        # Товары вне визуального top-N получают худший балл из найденных
+        visual_floor = min(visual_scores.values())
+        text_floor = min((1 - r['distance'] for r in results), default=0.0)
         
-        return images[0]
+        seen = set()
+        for r in results:
+            r['visual_score'] = visual_scores.get(r['slug'], visual_floor)
+            r['blended_score'] = round((1 - w) * (1 - r['distance']) + w * r['visual_score'], 4)
+            seen.add(r['slug'])
+        for v in visual:
+            if extra <= 0:
+                break
+            if v['slug'] in seen or v['slug'] not in self.catalog:
+                continue
+            results.append({
+                **v,
+                'distance': 1 - v['visual_score'],
+                'blended_score': round((1 - w) * text_floor + w * v['visual_score'], 4),
+                'product': self.catalog[v['slug']],
+                'analysis': analysis
+            })
+            extra -= 1
+        results.sort(key=lambda r: -r['blended_score'])
+        return results
 
-    def rerank_candidates(self, user_image_bytes: bytes, candidates: List[Dict]) -> List[Dict]:
+    def _get_best_texture_image(self, slug: str) -> Optional[Path]:
+        """Лучшее изображение текстуры для продукта (из индекса, без сканирования папки)"""
+        return self.textures.best(slug)
+
+    def rerank_candidates(self, user_image: PreparedImage, candidates: List[Dict]) -> List[Dict]:
         """
         Переранжирование кандидатов с помощью Gemini Vision
         Сравнивает фото пользователя с фото кандидатов
@@ -172,20 +271,13 @@ class ImageSearch:
         candidate_images = []
         candidates_map = {}
         
-        for i, cand in enumerate(candidates):
-            slug = cand['slug']
-            img_path = self._get_best_texture_image(slug)
-            
-            # Если нет распакованной текстуры, пропускаем или берем main_imag (которого у нас нет локально кроме как в json url)
-            # Но у нас есть URL, можно было бы скачать, но это долго.
-            # Если нет текстуры, пропускаем участие в визуальном сравнении (оставляем как есть)
-            if img_path:
-                candidates_map[i] = cand
-                with open(img_path, "rb") as f:
-                    candidate_images.append({
-                        "mime_type": "image/jpeg",
-                        "data": base64.b64encode(f.read()).decode()
-                    })
+        for cand in candidates:
+            # Готовая миниатюра лучшей текстуры из кэша индекса.
+            # Если нет распакованной текстуры, товар не участвует в визуальном сравнении (остается как есть)
+            part = self.textures.part(cand['slug'])
+            if part:
+                candidates_map[len(candidate_images)] = cand
+                candidate_images.append(part)
         
         if not candidate_images:
             console.print("[yellow]Нет локальных текстур для сравнения. Пропускаем Reranking.[/yellow]")
@@ -201,15 +293,12 @@ class ImageSearch:
         
         content = [prompt]
         # 1. Фото пользователя
-        content.append({
-            "mime_type": "image/jpeg",
-            "data": base64.b64encode(user_image_bytes).decode()
-        })
+        content.append(user_image.to_part())
         # 2. Фото кандидатов
         content.extend(candidate_images)
         
         try:
-            response = vision_model.generate_content(content)
+            response = _generate(content)
             text = response.text
             if "```json" in text:
                 text = text.split("```json")[1].split("```")[0]
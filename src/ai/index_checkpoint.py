@@ -0,0 +1,106 @@
+"""
+Чекпоинт задачи индексации каталога.
+
+Хранит завершенные батчи и упавшие slug'и с ошибкой, чтобы прерванную
+индексацию (обрыв прокси, рестарт процесса) можно было продолжить с места
+остановки через --resume.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+
+class IndexCheckpoint:
+    """Файл прогресса для BrickEmbeddings.index_catalog"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.fingerprint = ""
+        self.batch_size = 0
+        self.total_batches = 0
+        self.force_reindex = False
+        self.completed_batches = set()
+        self.failed: Dict[str, str] = {}
+        self.status = "new"
+        self.started_at = 0.0
+        self.updated_at = 0.0
+
+    @staticmethod
+    def make_fingerprint(slugs: Iterable[str], batch_size: int, force_reindex: bool) -> str:
+        """Отпечаток каталога + параметров: чекпоинт валиден только для того же разбиения на батчи"""
+        h = hashlib.sha256()
+        h.update(f"{batch_size}:{int(force_reindex)}".encode())
+        for slug in slugs:
+            h.update(b"\0")
+            h.update(slug.encode("utf-8"))
+        return h.hexdigest()
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error reading index checkpoint {self.path}: {e}")
+            return False
+        self.fingerprint = data.get("fingerprint", "")
+        self.batch_size = data.get("batch_size", 0)
+        self.total_batches = data.get("total_batches", 0)
+        self.force_reindex = data.get("force_reindex", False)
+        self.completed_batches = set(data.get("completed_batches", []))
+        self.failed = data.get("failed", {})
+        self.status = data.get("status", "running")
+        self.started_at = data.get("started_at", 0.0)
+        self.updated_at = data.get("updated_at", 0.0)
+        return True
+
+    def can_resume(self, fingerprint: str) -> bool:
+        return self.status == "running" and self.fingerprint == fingerprint
+
+    def start(self, fingerprint: str, batch_size: int, total_batches: int, force_reindex: bool):
+        self.fingerprint = fingerprint
+        self.batch_size = batch_size
+        self.total_batches = total_batches
+        self.force_reindex = force_reindex
+        self.completed_batches = set()
+        self.failed = {}
+        self.status = "running"
+        self.started_at = time.time()
+        self.save()
+
+    def mark_done(self, batch_index: int, slugs: List[str]):
+        self.completed_batches.add(batch_index)
+        for slug in slugs:
+            self.failed.pop(slug, None)
+
+    def mark_failed(self, slugs: List[str], error: str):
+        for slug in slugs:
+            self.failed[slug] = error
+
+    def finish(self):
+        self.status = "completed" if not self.failed else "running"
+        self.save()
+
+    def save(self):
+        self.updated_at = time.time()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "fingerprint": self.fingerprint,
+            "batch_size": self.batch_size,
+            "total_batches": self.total_batches,
+            "force_reindex": self.force_reindex,
+            "completed_batches": sorted(self.completed_batches),
+            "failed": self.failed,
+            "status": self.status,
+            "started_at": self.started_at,
+            "updated_at": self.updated_at
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,116 @@
+"""
+Поиск упоминаний товаров каталога в тексте ответа (автомат Ахо-Корасик).
+
+Автомат строится один раз на версию каталога по нормализованным названиям,
+артикулам и slug; ответ модели просматривается за один линейный проход,
+из пересекающихся совпадений выбирается самое левое и самое длинное.
+"""
+
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+_SPACE_RE = re.compile(r'\s+')
+# Короткие числовые коды ("637") считаются упоминанием только после "арт."/"art"/"reference"
+_CODE_CONTEXT_RE = re.compile(r'(?:арт|art|ref|reference|артикул)[\w.:№#\s-]{0,4}$')
+
+
+class MentionMatcher:
+    """Словарный автомат ключ -> slug"""
+
+    def __init__(self, keys: Iterable[Tuple[str, str]], min_length: int = 3):
+        self.min_length = min_length
+        # Узлы бора: переходы, суффиксная ссылка, (длина ключа, slug) для ключей, оканчивающихся в узле
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, str]]] = [[]]
+        self._size = 0
+        for key, slug in keys:
+            self._insert(key, slug)
+        self._build_links()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return _SPACE_RE.sub(" ", text.lower())
+
+    def _insert(self, key: str, slug: str):
+        key = self.normalize(key).strip()
+        if len(key) < self.min_length:
+            return
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        # Для одинаковых ключей остается первый slug
+        if not any(length == len(key) for length, _ in self._out[node]):
+            self._out[node].append((len(key), slug))
+            self._size += 1
+
+    def _build_links(self):
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                # Выходы суффиксной ссылки тоже заканчиваются в этом узле
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _is_boundary(text: str, start: int, end: int) -> bool:
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not before.isalnum() and not after.isalnum()
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """Все непересекающиеся упоминания (start, end, slug), leftmost-longest"""
+        text = self.normalize(text)
+        matches = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, slug in self._out[node]:
+                start = i + 1 - length
+                if not self._is_boundary(text, start, i + 1):
+                    continue
+                key = text[start:i + 1]
+                if key.isdigit() and len(key) < 6 and not _CODE_CONTEXT_RE.search(text[max(0, start - 16):start]):
+                    continue
+                matches.append((start, i + 1, slug))
+
+        # Самое левое, при равном начале — самое длинное; пересечения отбрасываются
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        result = []
+        last_end = -1
+        for start, end, slug in matches:
+            if start >= last_end:
+                result.append((start, end, slug))
+                last_end = end
+        return result
+
+    def slugs(self, text: str) -> List[str]:
+        """Упомянутые slug в порядке появления, без повторов"""
+        seen = set()
+        result = []
+        for _, _, slug in self.find(text):
+            if slug not in seen:
+                seen.add(slug)
+                result.append(slug)
+        return result
@@ -0,0 +1,105 @@
+"""
+Карта source -> ids для векторного индекса.
+
+Хранится рядом с ChromaDB, чтобы удаление, переименование и пересинхронизация
+одного источника работали только с его документами, без сканирования метаданных
+всей коллекции.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+
+class SourcePartitions:
+    """Поддерживаемая на диске карта source -> set(ids)"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._by_source: Dict[str, Set[str]] = {}
+        self._source_of: Dict[str, str] = {}
+        self.loaded = self._load()
+
+    def _load(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error reading source partitions {self.path}: {e}")
+            return False
+        for source, ids in data.get("sources", {}).items():
+            self._by_source[source] = set(ids)
+            for _id in ids:
+                self._source_of[_id] = source
+        return True
+
+    def save(self):
+        """Атомарно сохраняет карту на диск"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"sources": {s: sorted(ids) for s, ids in self._by_source.items() if ids}}
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def rebuild(self, metadatas: Iterable[Dict], ids: Iterable[str]):
+        """Пересобирает карту из метаданных коллекции (однократная миграция)"""
+        self.clear()
+        for _id, meta in zip(ids, metadatas):
+            meta = meta or {}
+            # В режиме fields id вектора — "<slug>::<field>", в карте храним slug
+            self.add(meta.get("source", "unknown"), [meta.get("slug") or _id])
+
+    def clear(self):
+        self._by_source = {}
+        self._source_of = {}
+
+    def add(self, source: str, ids: Iterable[str]):
+        """Добавляет ids в партицию source (перенося их из прежней партиции)"""
+        bucket = self._by_source.setdefault(source, set())
+        for _id in ids:
+            previous = self._source_of.get(_id)
+            if previous is not None and previous != source:
+                self._by_source.get(previous, set()).discard(_id)
+            bucket.add(_id)
+            self._source_of[_id] = source
+
+    def discard(self, ids: Iterable[str]):
+        for _id in ids:
+            source = self._source_of.pop(_id, None)
+            if source is not None:
+                self._by_source.get(source, set()).discard(_id)
+
+    def drop(self, source: str) -> List[str]:
+        """Удаляет партицию и возвращает её ids"""
+        ids = self._by_source.pop(source, set())
+        for _id in ids:
+            self._source_of.pop(_id, None)
+        return sorted(ids)
+
+    def rename(self, old_source: str, new_source: str) -> List[str]:
+        """Переносит все ids из old_source в new_source"""
+        ids = self.drop(old_source)
+        self.add(new_source, ids)
+        return ids
+
+    def ids_for(self, source: str) -> Set[str]:
+        return set(self._by_source.get(source, set()))
+
+    def source_of(self, _id: str) -> Optional[str]:
+        return self._source_of.get(_id)
+
+    def sources(self) -> List[str]:
+        return sorted(s for s, ids in self._by_source.items() if ids)
+
+    def all_ids(self) -> Set[str]:
+        return set(self._source_of)
+
+    def __contains__(self, _id: str) -> bool:
+        return _id in self._source_of
+
+    def __len__(self) -> int:
+        return len(self._source_of)
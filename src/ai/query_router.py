@@ -0,0 +1,115 @@
+"""
+Маршрутизация запросов консультанта.
+
+Запросы, которые целиком являются артикулом, названием или slug товара,
+обслуживаются напрямую по каталогу — без эмбеддинга запроса, векторного
+поиска и (опционально) без генерации LLM.
+"""
+
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional, Set
+
+# Служебные слова, которыми пользователи обрамляют артикул
+_PREFIX_RE = re.compile(r'^(?:арт(?:икул)?|art(?:icle)?|sku|reference|ref|код)\b[\s.:№#-]*', re.IGNORECASE)
+_PUNCT_RE = re.compile(r'[«»"\'`!?,;()\[\]]+')
+
+
+@dataclass
+class RouteMatch:
+    slug: str
+    route: str  # "article" | "name" | "slug"
+    key: str
+
+
+class QueryRouter:
+    """Точное/нормализованное совпадение запроса с каталогом"""
+
+    def __init__(self, catalog: Dict[str, Dict], min_length: int = 3):
+        self.min_length = min_length
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+        self._keys: Dict[str, RouteMatch] = {}
+        self._tokens: Dict[str, Set[str]] = {}
+        self.rebuild(catalog)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = _PUNCT_RE.sub(" ", str(text).lower())
+        text = " ".join(text.split()).strip(" .:-")
+        # "арт. 637", "reference: 637 utrecht" -> "637", "637 utrecht"
+        previous = None
+        while previous != text:
+            previous = text
+            text = _PREFIX_RE.sub("", text).strip(" .:-")
+        return text
+
+    def _add(self, key: str, slug: str, route: str):
+        key = self.normalize(key)
+        if len(key) < self.min_length:
+            return
+        existing = self._keys.get(key)
+        # Неоднозначный ключ (разные товары) — не маршрутизируем
+        if existing and existing.slug != slug:
+            self._keys[key] = RouteMatch(slug="", route=route, key=key)
+            return
+        # Приоритет: артикул > название > slug
+        if existing is None:
+            self._keys[key] = RouteMatch(slug=slug, route=route, key=key)
+
+    def rebuild(self, catalog: Dict[str, Dict]):
+        self._keys = {}
+        self._tokens = {}
+        for slug, p in catalog.items():
+            words = f"{p.get('name') or ''} {p.get('article') or ''} {slug.replace('-', ' ')}"
+            self._tokens[slug] = set(self.normalize(words).split())
+            article = str(p.get('article') or '').strip()
+            if article:
+                self._add(article, slug, "article")
+                # Первое слово артикула часто и есть настоящий код (как в slug_map)
+                first_word = self.normalize(article).split(' ')[0]
+                if len(first_word) > 2 and any(ch.isdigit() for ch in first_word):
+                    self._add(first_word, slug, "article")
+        for slug, p in catalog.items():
+            if p.get('name'):
+                self._add(p['name'], slug, "name")
+        for slug in catalog:
+            self._add(slug, slug, "slug")
+            self._add(slug.replace('-', ' '), slug, "slug")
+
+    def match(self, query: str) -> Optional[RouteMatch]:
+        key = self.normalize(query)
+        if len(key) < self.min_length:
+            return None
+        found = self._keys.get(key)
+        if found and found.slug:
+            return found
+        
+        # "637 utrecht": код артикула + слова, которые все встречаются в названии/артикуле этого товара
+        words = key.split()
+        if len(words) < 2:
+            return None
+        for word in words:
+            code = self._keys.get(word)
+            if not code or not code.slug or code.route != "article":
+                continue
+            if set(words) <= self._tokens.get(code.slug, set()):
+                return RouteMatch(slug=code.slug, route="article", key=key)
+        return None
+
+    def record(self, route: str):
+        with self._lock:
+            self.counters[route] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = sum(self.counters.values())
+            fast = total - self.counters.get("llm", 0)
+            return {
+                "routes": dict(self.counters),
+                "total": total,
+                "fast_path_ratio": round(fast / total, 4) if total else 0.0,
+                "keys": len(self._keys)
+            }
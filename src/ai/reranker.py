@@ -0,0 +1,194 @@
+"""
+Локальный реранкер результатов векторного поиска (без LLM, только CPU).
+
+score = w_vec * (1 - distance)
+      + w_lex * лексическое пересечение запроса с полями товара (с бустами полей)
+      + w_con * совпадение ограничений запроса (цвет, материал, категория)
+      + штраф/бонус по цене и размерам
+Работает со строгим бюджетом времени: кандидаты, до которых не дошла очередь,
+сохраняют векторный порядок.
+"""
+
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from rich.console import Console
+
+from src.ai.filter_extractor import (
+    COLOR_TERMS, MATERIAL_TERMS, CATEGORY_TERMS, QueryFilters,
+    extract_constraints, match_terms, parse_price, parse_product_dimensions, tokenize
+)
+
+console = Console()
+
+# Поле товара -> буст для лексического совпадения
+FIELD_BOOSTS = {"name": 1.0, "brand": 0.8, "category": 0.7, "attributes": 0.5, "description": 0.2}
+
+_STOP_WORDS = {
+    "для", "под", "над", "или", "как", "что", "это", "мне", "нам", "все", "всё", "есть", "нужен", "нужна",
+    "нужно", "нужны", "хочу", "ищу", "найди", "покажи", "подбери", "порекомендуй", "какой", "какая", "какие",
+    "стиле", "стиль", "with", "the", "and", "for", "что-то", "можно", "пожалуйста",
+    "евро", "eur", "euro", "руб", "рублей", "тыс", "дороже", "дешевле",
+}
+
+
+class LocalReranker:
+    """Переранжирование кандидатов по совокупности локальных сигналов"""
+
+    def __init__(self, budget_ms: float = 15.0, w_vec: float = 1.0, w_lex: float = 0.35, w_con: float = 0.25):
+        self.budget_ms = budget_ms
+        self.w_vec = w_vec
+        self.w_lex = w_lex
+        self.w_con = w_con
+        # slug -> (id(details), признаки): признаки пересчитываются при замене объекта товара
+        self._features: Dict[str, Tuple[int, Dict]] = {}
+
+    def _product_features(self, slug: str, details: Dict) -> Dict:
+        cached = self._features.get(slug)
+        if cached and cached[0] == id(details):
+            return cached[1]
+
+        attrs = {**(details.get('parameters') or {}), **(details.get('attributes') or {})}
+        color = details.get('color') or {}
+        attr_text = " ".join(f"{k} {v}" for k, v in attrs.items() if k != "Цена" and v)
+        if isinstance(color, dict):
+            attr_text += " " + " ".join(str(v) for v in color.values() if isinstance(v, str))
+        attr_text += " " + str(details.get('texture') or "")
+
+        fields = {
+            "name": set(tokenize(f"{details.get('name') or ''} {details.get('title') or ''} {details.get('article') or ''}")),
+            "brand": set(tokenize(str(details.get('brand') or ""))),
+            "category": set(tokenize(str(details.get('category') or ""))),
+            "attributes": set(tokenize(attr_text)),
+            "description": set(tokenize(str(details.get('description') or "")[:1000])),
+        }
+        all_tokens = set().union(*fields.values())
+        features = {
+            "fields": fields,
+            "constraints": {
+                "color": match_terms(fields["name"] | fields["attributes"], COLOR_TERMS),
+                "material": match_terms(fields["name"] | fields["attributes"] | fields["description"], MATERIAL_TERMS),
+                "category": match_terms(fields["name"] | fields["category"], CATEGORY_TERMS),
+                "brand": {str(details['brand']).lower()} if details.get('brand') else set(),
+            },
+            "tokens": all_tokens,
+            "price": parse_price(details.get('price') or attrs.get('Цена')),
+            "dimensions": parse_product_dimensions(attrs),
+        }
+        self._features[slug] = (id(details), features)
+        return features
+
+    @staticmethod
+    def parse_query(query: str, filters: Optional[QueryFilters] = None) -> Dict:
+        """Признаки запроса; filters — результат FilterExtractor (если уже извлечены)"""
+        filters = filters or extract_constraints(query)
+        return {
+            "terms": [t for t in tokenize(query) if len(t) >= 3 and t not in _STOP_WORDS and not t.isdigit()],
+            "constraints": {
+                "color": filters.colors,
+                "material": filters.materials,
+                "category": filters.categories,
+                "brand": {b.lower() for b in filters.brands},
+            },
+            "price_min": filters.price_min,
+            "price_max": filters.price_max,
+            "dimensions": filters.dimensions,
+        }
+
+    def _lexical(self, terms: List[str], fields: Dict[str, Set[str]]) -> float:
+        if not terms:
+            return 0.0
+        total = 0.0
+        for term in terms:
+            # Основа слова: грубо отрезаем окончание у длинных слов
+            stem = term[:max(4, len(term) - 2)] if len(term) > 5 else term
+            best = 0.0
+            for field, boost in FIELD_BOOSTS.items():
+                if boost > best and any(t.startswith(stem) for t in fields[field]):
+                    best = boost
+            total += best
+        return total / len(terms)
+
+    @staticmethod
+    def _constraint_score(requested: Dict[str, Set[str]], product: Dict[str, Set[str]]) -> float:
+        """+1 за совпадение, -1 за противоречие (у товара другое значение), 0 если неизвестно; среднее по типам"""
+        scores = []
+        for name, values in requested.items():
+            if not values:
+                continue
+            have = product.get(name, set())
+            if have & values:
+                scores.append(1.0)
+            elif have:
+                scores.append(-1.0)
+            else:
+                scores.append(0.0)
+        return sum(scores) / len(scores) if scores else 0.0
+
+    @staticmethod
+    def _price_score(parsed: Dict, price: Optional[float]) -> float:
+        if price is None or (parsed["price_min"] is None and parsed["price_max"] is None):
+            return 0.0
+        if parsed["price_max"] is not None and price > parsed["price_max"]:
+            return -0.5
+        if parsed["price_min"] is not None and price < parsed["price_min"]:
+            return -0.5
+        return 0.1
+
+    @staticmethod
+    def _dimension_score(parsed: Dict, dims: Dict[str, float]) -> float:
+        """-0.5 если какой-то известный размер вне диапазона запроса, +0.1 если все известные в диапазоне"""
+        wanted = parsed.get("dimensions") or {}
+        checked = False
+        for axis, (low, high) in wanted.items():
+            value = dims.get(axis)
+            if value is None:
+                continue
+            checked = True
+            if (high is not None and value > high * 1.02) or (low is not None and value < low * 0.98):
+                return -0.5
+        return 0.1 if checked else 0.0
+
+    def score(self, parsed: Dict, product: Dict) -> float:
+        details = product.get('details') or {}
+        vector_score = 1.0 - float(product.get('distance', 1.0))
+        if not details:
+            return self.w_vec * vector_score
+        features = self._product_features(product.get('slug', ''), details)
+        return (
+            self.w_vec * vector_score
+            + self.w_lex * self._lexical(parsed["terms"], features["fields"])
+            + self.w_con * self._constraint_score(parsed["constraints"], features["constraints"])
+            + self._price_score(parsed, features["price"])
+            + self._dimension_score(parsed, features["dimensions"])
+        )
+
+    def rerank(self, query: str, products: List[Dict], top_n: int = 5, parsed: Optional[Dict] = None) -> List[Dict]:
+        if not products:
+            return []
+        started = time.perf_counter()
+        deadline = started + self.budget_ms / 1000.0
+        parsed = parsed or self.parse_query(query)
+
+        scored = []
+        rest = []
+        for i, product in enumerate(products):
+            if time.perf_counter() > deadline:
+                rest = products[i:]
+                break
+            scored.append((self.score(parsed, product), i, product))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+
+        result = []
+        for score, _, product in scored:
+            product['rerank_score'] = round(score, 4)
+            result.append(product)
+        # Не успели оценить — остаются в векторном порядке после оцененных
+        result.extend(rest)
+
+        elapsed = (time.perf_counter() - started) * 1000
+        if rest:
+            console.print(f"[yellow]Rerank budget exceeded ({elapsed:.1f} ms): scored {len(scored)}/{len(products)}[/yellow]")
+        else:
+            console.print(f"[dim]Rerank: {len(products)} candidates in {elapsed:.1f} ms[/dim]")
+        return result[:top_n]
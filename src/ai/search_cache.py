@@ -0,0 +1,102 @@
+"""
+LRU-кэш результатов векторного поиска.
+
+Ключ включает версию индекса, поэтому любой upsert/delete через BrickEmbeddings
+делает старые записи недостижимыми (они вытесняются по LRU).
+"""
+
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class SearchResultCache:
+    """Потокобезопасный LRU с учетом попаданий"""
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, where: Optional[Dict], n_results: int, version: Hashable) -> Hashable:
+        normalized = " ".join(query.lower().split())
+        where_key = json.dumps(where, sort_keys=True, ensure_ascii=False) if where else ""
+        return (normalized, where_key, n_results, version)
+
+    def get(self, key: Hashable) -> Optional[List[Dict]]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+        # Копии: вызывающий код дописывает в результаты свои поля (details и т.п.)
+        return [dict(r) for r in value]
+
+    def put(self, key: Hashable, value: List[Dict]):
+        with self._lock:
+            self._data[key] = [dict(r) for r in value]
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+class SearchTokenStore:
+    """
+    Ранжированные результаты поиска по токену (LRU + TTL).
+    Следующие страницы отдаются из памяти без повторного анализа изображения.
+    """
+
+    def __init__(self, maxsize: int = 500, ttl: float = 1800):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, results: List[Dict], **meta) -> str:
+        token = secrets.token_urlsafe(12)
+        now = time.time()
+        with self._lock:
+            self._data[token] = {"results": results, "created": now, **meta}
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(token)
+            if entry is None:
+                return None
+            if time.time() - entry["created"] > self.ttl:
+                del self._data[token]
+                return None
+            self._data.move_to_end(token)
+            return entry
+
+    def page(self, token: str, offset: int, limit: int) -> Optional[List[Dict]]:
+        entry = self.get(token)
+        if entry is None:
+            return None
+        return entry["results"][offset:offset + limit]
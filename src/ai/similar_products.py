@@ -0,0 +1,291 @@
+"""
+Граф "похожие товары": top-k соседей для каждого продукта по векторам из ChromaDB.
+
+Строится оффлайн (scripts/build_similar_products.py) батчевыми матричными
+умножениями по уже сохраненным векторам, без обращений к API эмбеддингов.
+При upsert/удалении продуктов граф обновляется инкрементально в памяти,
+а запись на диск откладывается (SIMILAR_PRODUCTS_SAVE_DELAY), чтобы серия
+правок давала одну запись. Перестроенный скриптом файл подхватывается
+работающим API по mtime.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from rich.console import Console
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config.settings import DATA_DIR, SIMILAR_PRODUCTS_K, SIMILAR_PRODUCTS_SAVE_DELAY
+
+console = Console()
+
+
+class SimilarProducts:
+    """Таблица slug -> [(slug, score)] с top-k косинусными соседями"""
+
+    def __init__(self, path: Optional[Path] = None, k: int = SIMILAR_PRODUCTS_K, save_delay: float = SIMILAR_PRODUCTS_SAVE_DELAY):
+        self.path = Path(path) if path else DATA_DIR / "processed" / "similar_products.json"
+        self.vectors_path = self.path.with_suffix(".npz")
+        self.k = k
+        self.save_delay = save_delay
+        self.neighbours: Dict[str, List[Tuple[str, float]]] = {}
+        self.built_at = 0.0
+        # Нормированная матрица векторов (нужна только для инкрементальных обновлений)
+        self._slugs: Optional[List[str]] = None
+        self._matrix: Optional[np.ndarray] = None
+        # (mtime_ns, size) файла, который сейчас в памяти; изменился — перечитываем
+        self._file_key = None
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+        self.load()
+        atexit.register(self.flush)
+
+    def _stat_key(self):
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        with self._lock:
+            key = self._stat_key()
+            if key is None:
+                return
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.k = data.get("k", self.k)
+                self.built_at = data.get("built_at", 0.0)
+                self.neighbours = {
+                    slug: [(s, score) for s, score in items]
+                    for slug, items in data.get("neighbours", {}).items()
+                }
+                self._file_key = key
+                # Матрица перечитается из нового .npz при следующем обновлении
+                self._slugs = None
+                self._matrix = None
+            except Exception as e:
+                console.print(f"[red]Error loading similar products {self.path}: {e}[/red]")
+
+    def _reload_if_changed(self):
+        """Подхватывает граф, перестроенный другим процессом (scripts/build_similar_products.py)"""
+        key = self._stat_key()
+        if key is None or key == self._file_key:
+            return
+        with self._lock:
+            if self._stat_key() == self._file_key:
+                return
+            if self._dirty:
+                console.print("[yellow]Similar products rebuilt on disk, dropping unsaved incremental updates[/yellow]")
+                self._dirty = False
+            self.load()
+
+    def _schedule_save(self):
+        """Отложенная запись: серия update/remove за save_delay сек дает одну запись"""
+        self._dirty = True
+        if self.save_delay <= 0:
+            self.flush()
+            return
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Записывает отложенные изменения на диск"""
+        with self._lock:
+            self._save_timer = None
+            if self._dirty:
+                self.save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "k": self.k,
+            "built_at": self.built_at,
+            "neighbours": {slug: [[s, round(score, 4)] for s, score in items] for slug, items in self.neighbours.items()}
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+        if self._matrix is not None:
+            tmp_vectors = self.vectors_path.with_suffix(".npz.tmp")
+            with open(tmp_vectors, 'wb') as f:
+                np.savez(f, slugs=np.array(self._slugs), matrix=self._matrix)
+            os.replace(tmp_vectors, self.vectors_path)
+        self._file_key = self._stat_key()
+        self._dirty = False
+
+    def _load_vectors(self) -> bool:
+        if self._matrix is not None:
+            return True
+        if not self.vectors_path.exists():
+            return False
+        data = np.load(self.vectors_path)
+        self._slugs = [str(s) for s in data["slugs"]]
+        self._matrix = data["matrix"].astype(np.float32)
+        return True
+
+    def get(self, slug: str) -> List[Tuple[str, float]]:
+        self._reload_if_changed()
+        return self.neighbours.get(slug, [])
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).astype(np.float32)
+
+    @staticmethod
+    def fetch_vectors(embeddings, slugs: Optional[List[str]] = None, page_size: int = 1000) -> Tuple[List[str], np.ndarray]:
+        """
+        Достает сохраненные векторы продуктов из коллекции.
+        В режиме fields вектор продукта — среднее нормированных векторов его полей.
+        """
+        rows: Dict[str, List[np.ndarray]] = {}
+
+        def collect(batch):
+            for _id, meta, vec in zip(batch['ids'], batch['metadatas'], batch['embeddings']):
+                if vec is None:
+                    continue
+                slug = (meta or {}).get('slug') or _id
+                rows.setdefault(slug, []).append(np.asarray(vec, dtype=np.float32))
+
+        if slugs is not None:
+            ids = embeddings._vector_ids(slugs)
+            for i in range(0, len(ids), page_size):
+                collect(embeddings.collection.get(ids=ids[i:i+page_size], include=["embeddings", "metadatas"]))
+        else:
+            offset = 0
+            while True:
+                batch = embeddings.collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+                if not batch['ids']:
+                    break
+                collect(batch)
+                offset += len(batch['ids'])
+
+        found = sorted(rows)
+        if not found:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        vectors = []
+        for slug in found:
+            parts = SimilarProducts._normalize(np.vstack(rows[slug]))
+            vectors.append(parts.mean(axis=0))
+        return found, SimilarProducts._normalize(np.vstack(vectors))
+
+    def _top_k(self, queries: np.ndarray, query_rows: List[Optional[int]], batch_size: int) -> List[List[Tuple[str, float]]]:
+        """top-k соседей для векторов queries по всей матрице (query_rows — индекс самого себя для исключения)"""
+        result = []
+        k = min(self.k, max(len(self._slugs) - 1, 0))
+        for start in range(0, len(queries), batch_size):
+            sims = queries[start:start+batch_size] @ self._matrix.T
+            for row, self_idx in enumerate(query_rows[start:start+batch_size]):
+                if self_idx is not None:
+                    sims[row, self_idx] = -np.inf
+            if k == 0:
+                result.extend([] for _ in range(len(sims)))
+                continue
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            for row in range(len(sims)):
+                idx = top[row][np.argsort(-sims[row, top[row]])]
+                result.append([(self._slugs[j], float(sims[row, j])) for j in idx])
+        return result
+
+    def build(self, embeddings, batch_size: int = 256):
+        """Полное построение графа по всем векторам коллекции"""
+        started = time.time()
+        self._slugs, self._matrix = self.fetch_vectors(embeddings)
+        console.print(f"[cyan]Векторов: {len(self._slugs)}, k={self.k}[/cyan]")
+
+        neighbours = self._top_k(self._matrix, list(range(len(self._slugs))), batch_size)
+        self.neighbours = dict(zip(self._slugs, neighbours))
+        self.built_at = time.time()
+        self.save()
+        console.print(f"[green]✓ Граф похожих товаров построен за {time.time() - started:.1f} сек: {self.path}[/green]")
+
+    def update(self, embeddings, slugs: List[str], batch_size: int = 256):
+        """
+        Инкрементальное обновление после upsert: пересчет соседей для slugs и
+        вставка slugs в списки остальных продуктов.
+        Если обновленный продукт выпал из чужого списка, список может стать короче k
+        до следующего полного build().
+        """
+        if not slugs:
+            return
+        self._reload_if_changed()
+        new_slugs, new_vectors = self.fetch_vectors(embeddings, slugs)
+        if not new_slugs:
+            return
+        with self._lock:
+            if self._load_vectors():
+                self._apply_update(new_slugs, new_vectors, batch_size)
+                self._schedule_save()
+
+    def _apply_update(self, new_slugs: List[str], new_vectors: np.ndarray, batch_size: int):
+        """Вставка новых векторов в матрицу и пересчет затронутых списков соседей (под self._lock)"""
+        index = {slug: i for i, slug in enumerate(self._slugs)}
+        appended = []
+        for slug, vec in zip(new_slugs, new_vectors):
+            if slug in index:
+                self._matrix[index[slug]] = vec
+            else:
+                index[slug] = len(self._slugs)
+                self._slugs.append(slug)
+                appended.append(vec)
+        if appended:
+            self._matrix = np.vstack([self._matrix, np.vstack(appended)])
+
+        # 1. Соседи самих обновленных продуктов
+        rows = [index[slug] for slug in new_slugs]
+        for slug, items in zip(new_slugs, self._top_k(new_vectors, rows, batch_size)):
+            self.neighbours[slug] = items
+
+        # 2. Обновленные продукты в списках остальных
+        updated = set(new_slugs)
+        sims = self._matrix @ new_vectors.T
+        # Из новых векторов каждому продукту достаточно его лучших k кандидатов
+        if len(new_slugs) > self.k:
+            candidates = np.argpartition(-sims, self.k - 1, axis=1)[:, :self.k]
+        else:
+            candidates = np.tile(np.arange(len(new_slugs)), (len(self._slugs), 1))
+        for i, slug in enumerate(self._slugs):
+            if slug in updated:
+                continue
+            items = [(s, score) for s, score in self.neighbours.get(slug, []) if s not in updated]
+            items.extend((new_slugs[j], float(sims[i, j])) for j in candidates[i])
+            items.sort(key=lambda x: -x[1])
+            self.neighbours[slug] = items[:self.k]
+
+    def remove(self, slugs: List[str]):
+        """Удаляет продукты из графа (и из списков соседей остальных)"""
+        removed = set(slugs)
+        if not removed:
+            return
+        self._reload_if_changed()
+        with self._lock:
+            for slug in removed:
+                self.neighbours.pop(slug, None)
+            for slug, items in self.neighbours.items():
+                if any(s in removed for s, _ in items):
+                    self.neighbours[slug] = [(s, score) for s, score in items if s not in removed]
+
+            if self._load_vectors():
+                keep = [i for i, slug in enumerate(self._slugs) if slug not in removed]
+                self._slugs = [self._slugs[i] for i in keep]
+                self._matrix = self._matrix[keep]
+            self._schedule_save()
@@ -0,0 +1,142 @@
+"""
+Индекс локальных текстур товаров (data/downloads/<slug>/textures/*.jpg).
+
+Карта slug -> лучшая текстура строится один раз при старте и обновляется
+лениво: не чаще refresh_interval пересматриваются только папки, у которых
+изменился mtime. Миниатюры текстур (JPEG, ограничение по стороне)
+кэшируются в памяти и на диске, так что reranking не сканирует папки
+и не перекодирует полноразмерные файлы; готовые части сообщения Gemini
+(base64) хранятся рядом с миниатюрой.
+"""
+
+import base64
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from rich.console import Console
+
+from src.ai.thumbnail_cache import ThumbnailCache
+
+console = Console()
+
+
+def pick_best_texture(images: Iterable[Path]) -> Optional[Path]:
+    """Приоритет: WF (кроме 50mm), потом _01_, потом имя"""
+    images = list(images)
+    if not images:
+        return None
+    return min(images, key=lambda p: (
+        0 if "WF" in p.name and "50mm" not in p.name else 1,
+        0 if "_01_" in p.name else 1,
+        p.name
+    ))
+
+
+class TextureIndex:
+    """slug -> лучшая текстура + кэш ее миниатюр"""
+
+    def __init__(self, root: Path, thumbnails: ThumbnailCache, refresh_interval: float = 60.0):
+        self.root = Path(root)
+        self.thumbnails = thumbnails
+        self.refresh_interval = refresh_interval
+        # slug -> (mtime папки textures, лучшая текстура или None)
+        self._best: Dict[str, Tuple[float, Optional[Path]]] = {}
+        # slug -> (ключ миниатюры, часть сообщения Gemini)
+        self._parts: Dict[str, Tuple[str, Dict]] = {}
+        self._root_mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def _scan_dir(self, textures_dir: Path) -> Tuple[float, Optional[Path]]:
+        return textures_dir.stat().st_mtime, pick_best_texture(textures_dir.glob("*.jpg"))
+
+    def refresh(self, force: bool = False):
+        """Пересканирует новые и измененные папки текстур"""
+        now = time.time()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if not force and now - self._checked_at < self.refresh_interval:
+                return
+            self._checked_at = now
+            if not self.root.exists():
+                self._best = {}
+                self._parts = {}
+                return
+            started = time.perf_counter()
+            root_mtime = self.root.stat().st_mtime
+            slugs = (
+                [p.name for p in self.root.iterdir() if p.is_dir()]
+                if force or root_mtime != self._root_mtime else list(self._best)
+            )
+            self._root_mtime = root_mtime
+            best = {}
+            rescanned = 0
+            for slug in slugs:
+                textures_dir = self.root / slug / "textures"
+                try:
+                    mtime = textures_dir.stat().st_mtime
+                except OSError:
+                    # Папки текстур пока нет — запоминаем товар, чтобы заметить ее появление
+                    best[slug] = (None, None)
+                    continue
+                cached = self._best.get(slug)
+                if cached and cached[0] == mtime:
+                    best[slug] = cached
+                else:
+                    best[slug] = self._scan_dir(textures_dir)
+                    rescanned += 1
+            # Части сообщений пересканированных и исчезнувших папок устарели
+            self._parts = {s: p for s, p in self._parts.items() if best.get(s) is self._best.get(s)}
+            self._best = best
+        if rescanned:
+            console.print(
+                f"[dim]Texture index: {len(best)} products, rescanned {rescanned} "
+                f"in {(time.perf_counter() - started) * 1000:.0f} ms[/dim]"
+            )
+
+    def best(self, slug: str) -> Optional[Path]:
+        self.refresh()
+        entry = self._best.get(slug)
+        return entry[1] if entry else None
+
+    def _thumbnail(self, slug: str) -> Optional[Tuple[str, bytes]]:
+        """(ключ кэша, JPEG-миниатюра) лучшей текстуры; ключ включает mtime файла"""
+        path = self.best(slug)
+        if path is None:
+            return None
+        try:
+            key = f"{path}:{path.stat().st_mtime_ns}"
+            data = self.thumbnails.get(key)
+            if data is None:
+                data = self.thumbnails.make_thumbnail(path.read_bytes())
+                self.thumbnails.put(key, data)
+            return key, data
+        except Exception as e:
+            console.print(f"[yellow]Texture thumbnail failed for {slug}: {e}[/yellow]")
+            return None
+
+    def thumbnail(self, slug: str) -> Optional[bytes]:
+        """JPEG-миниатюра лучшей текстуры"""
+        entry = self._thumbnail(slug)
+        return entry[1] if entry else None
+
+    def part(self, slug: str) -> Optional[Dict]:
+        """Часть сообщения Gemini с миниатюрой текстуры (base64 кодируется один раз на миниатюру)"""
+        entry = self._thumbnail(slug)
+        if entry is None:
+            return None
+        key, data = entry
+        cached = self._parts.get(slug)
+        if cached and cached[0] == key:
+            return cached[1]
+        part = {"mime_type": "image/jpeg", "data": base64.b64encode(data).decode()}
+        with self._lock:
+            self._parts[slug] = (key, part)
+        return part
+
+    def __len__(self) -> int:
+        return len(self._best)
@@ -0,0 +1,123 @@
+"""
+Кэш миниатюр изображений товаров для контекста консультанта.
+
+В памяти хранятся JPEG-байты миниатюр (лимит в байтах, LRU), опционально
+дублируются на диск, чтобы после рестарта не скачивать их заново.
+"""
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+import PIL.Image
+
+
+class ThumbnailCache:
+    """LRU url -> JPEG-миниатюра с ограничением по суммарному размеру"""
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[Path] = None, size: int = 512, quality: int = 85):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.size = size
+        self.quality = quality
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.jpg"
+
+    def make_thumbnail(self, content: bytes) -> bytes:
+        """Декодирует исходное изображение, уменьшает и кодирует в JPEG"""
+        img = PIL.Image.open(io.BytesIO(content))
+        img.thumbnail((self.size, self.size))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=self.quality)
+        return out.getvalue()
+
+    def _remember(self, key: str, data: bytes):
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            if len(data) > self.max_bytes:
+                return
+            self._data[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def get(self, url: str) -> Optional[bytes]:
+        key = self._key(url)
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return data
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if path.exists():
+                try:
+                    data = path.read_bytes()
+                    self._remember(key, data)
+                    with self._lock:
+                        self.disk_hits += 1
+                    return data
+                except OSError:
+                    pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, url: str, data: bytes):
+        key = self._key(url)
+        self._remember(key, data)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(".tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error writing thumbnail {path}: {e}")
+
+    def get_image(self, url: str) -> Optional[PIL.Image.Image]:
+        data = self.get(url)
+        return self.to_image(data) if data else None
+
+    @staticmethod
+    def to_image(data: bytes) -> PIL.Image.Image:
+        img = PIL.Image.open(io.BytesIO(data))
+        img.load()
+        return img
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses
+            }
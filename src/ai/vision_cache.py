@@ -0,0 +1,125 @@
+"""
+Кэш результатов Gemini-анализа изображений для поиска по фото.
+
+Ключ — sha256 нормализованного JPEG (точное совпадение) и dHash
+(почти одинаковые повторные загрузки: пересжатие, другой размер).
+Хранится в SQLite, вытеснение по возрасту и по числу записей.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.ai.image_preprocess import PreparedImage, hamming
+
+
+class VisionAnalysisCache:
+    """sha256/dHash -> распарсенный JSON анализа (вместе с search_query)"""
+
+    def __init__(self, db_path: Path, max_entries: int = 5000, max_age: float = 30 * 86400, max_distance: int = 4):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS vision_analysis (
+                sha256 TEXT PRIMARY KEY,
+                dhash TEXT NOT NULL,
+                analysis TEXT NOT NULL,
+                search_query TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_vision_last_used ON vision_analysis(last_used)")
+        self._conn.commit()
+        # dHash всех записей в памяти: поиск ближайшего без чтения таблицы
+        self._hashes: Dict[str, int] = {
+            sha: int(h, 16) for sha, h in self._conn.execute("SELECT sha256, dhash FROM vision_analysis")
+        }
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _nearest(self, value: int) -> Optional[str]:
+        best, best_distance = None, self.max_distance + 1
+        for sha, h in self._hashes.items():
+            distance = hamming(value, h)
+            if distance < best_distance:
+                best, best_distance = sha, distance
+        return best
+
+    def get(self, image: PreparedImage) -> Optional[Dict]:
+        now = time.time()
+        # Хэши считаются до блокировки (декодирование JPEG)
+        digest = image.sha256
+        value = image.dhash if self.max_distance > 0 else None
+        with self._lock:
+            sha = digest if digest in self._hashes else None
+            exact = sha is not None
+            if sha is None and value is not None:
+                sha = self._nearest(value)
+            row = None
+            if sha is not None:
+                row = self._conn.execute(
+                    "SELECT analysis, created_at FROM vision_analysis WHERE sha256 = ?", (sha,)
+                ).fetchone()
+            if not row or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE vision_analysis SET last_used = ? WHERE sha256 = ?", (now, sha))
+            if exact:
+                self.exact_hits += 1
+            else:
+                self.near_hits += 1
+        return json.loads(row[0])
+
+    def put(self, image: PreparedImage, analysis: Dict):
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    """INSERT OR REPLACE INTO vision_analysis (sha256, dhash, analysis, search_query, created_at, last_used)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (image.sha256, f"{image.dhash:016x}", json.dumps(analysis, ensure_ascii=False),
+                     analysis.get("search_query"), now, now)
+                )
+            self._hashes[image.sha256] = image.dhash
+            self._evict(now)
+
+    def _evict(self, now: float):
+        with self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM vision_analysis WHERE created_at < ?", (now - self.max_age,)
+            ).rowcount
+            deleted += self._conn.execute(
+                """DELETE FROM vision_analysis WHERE sha256 IN (
+                       SELECT sha256 FROM vision_analysis ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entries,)
+            ).rowcount
+        if deleted:
+            kept = {sha for (sha,) in self._conn.execute("SELECT sha256 FROM vision_analysis")}
+            self._hashes = {sha: h for sha, h in self._hashes.items() if sha in kept}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.exact_hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._hashes),
+                "max_entries": self.max_entries,
+                "max_age_days": round(self.max_age / 86400, 2),
+                "max_distance": self.max_distance,
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.exact_hits + self.near_hits) / total, 4) if total else 0.0
+            }
@@ -0,0 +1,222 @@
+"""
+Локальный визуальный индекс товаров для поиска по фото (только CPU).
+
+Для главного изображения и текстур каждого товара считаются компактные
+дескрипторы:
+- 3D-гистограмма цвета в пространстве Lab (4x6x6, Hellinger-нормировка);
+- перцептивный хэш (pHash, 64 бита по DCT 32x32);
+- простая статистика текстуры (яркость, контраст, градиенты, энтропия).
+Индекс строится оффлайн (scripts/build_visual_index.py) и хранится в одном
+.npz; поиск — матричные операции по всем строкам сразу.
+"""
+
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import PIL.Image
+from rich.console import Console
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config.settings import DATA_DIR
+
+console = Console()
+
+HIST_BINS = (4, 6, 6)
+# Диапазоны L, a, b для гистограммы (a/b за пределами ±64 у мебели почти не встречаются)
+HIST_RANGE = ((0.0, 100.0), (-64.0, 64.0), (-64.0, 64.0))
+PHASH_BITS = 64
+
+# Веса компонент итоговой похожести
+W_HIST = 0.6
+W_PHASH = 0.25
+W_TEXTURE = 0.15
+
+_RGB_TO_XYZ = np.array([
+    [0.4124, 0.3576, 0.1805],
+    [0.2126, 0.7152, 0.0722],
+    [0.0193, 0.1192, 0.9505],
+], dtype=np.float32)
+_D65 = np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """sRGB (0..255, последний размер 3) -> CIE Lab (D65)"""
+    c = rgb.astype(np.float32) / 255.0
+    c = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = (c @ _RGB_TO_XYZ.T) / _D65
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16.0 / 116.0)
+    lab = np.empty_like(f)
+    lab[..., 0] = 116.0 * f[..., 1] - 16.0
+    lab[..., 1] = 500.0 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200.0 * (f[..., 1] - f[..., 2])
+    return lab
+
+
+def lab_histogram(img: PIL.Image.Image) -> np.ndarray:
+    """Гистограмма Lab (sqrt от долей + L2-норма: скалярное произведение = коэффициент Бхаттачарьи)"""
+    small = np.asarray(img.convert("RGB").resize((64, 64), PIL.Image.BILINEAR))
+    lab = rgb_to_lab(small).reshape(-1, 3)
+    for axis, (low, high) in enumerate(HIST_RANGE):
+        lab[:, axis] = np.clip(lab[:, axis], low, high - 1e-3)
+    hist, _ = np.histogramdd(lab, bins=HIST_BINS, range=HIST_RANGE)
+    hist = np.sqrt(hist.ravel() / max(hist.sum(), 1.0))
+    return (hist / (np.linalg.norm(hist) or 1.0)).astype(np.float32)
+
+
+def phash_bits(img: PIL.Image.Image) -> np.ndarray:
+    """pHash: знак низкочастотных DCT-коэффициентов относительно медианы (64 бита)"""
+    gray = np.asarray(img.convert("L").resize((32, 32), PIL.Image.LANCZOS), dtype=np.float32)
+    dct = _DCT32 @ gray @ _DCT32.T
+    low = dct[:8, :8].ravel()
+    return (low > np.median(low[1:])).astype(np.uint8)
+
+
+def texture_stats(img: PIL.Image.Image) -> np.ndarray:
+    """Яркость, контраст, средний/разброс градиента, доля краев, энтропия яркости"""
+    gray = np.asarray(img.convert("L").resize((128, 128), PIL.Image.BILINEAR), dtype=np.float32) / 255.0
+    gx = np.diff(gray, axis=1)[:-1, :]
+    gy = np.diff(gray, axis=0)[:, :-1]
+    magnitude = np.sqrt(gx * gx + gy * gy)
+    counts, _ = np.histogram(gray, bins=32, range=(0.0, 1.0))
+    p = counts[counts > 0] / counts.sum()
+    entropy = float(-(p * np.log2(p)).sum()) / 5.0
+    return np.array([
+        gray.mean(), gray.std(), magnitude.mean(), magnitude.std(), (magnitude > 0.1).mean(), entropy
+    ], dtype=np.float32)
+
+
+def describe(img: PIL.Image.Image) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(гистограмма Lab, биты pHash, статистика текстуры)"""
+    return lab_histogram(img), phash_bits(img), texture_stats(img)
+
+
+class VisualIndex:
+    """Матрицы дескрипторов: по строке на изображение (главное или текстура) товара"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else DATA_DIR / "processed" / "visual_index.npz"
+        self.slugs: List[str] = []
+        self.kinds: List[str] = []
+        self.hist = np.zeros((0, int(np.prod(HIST_BINS))), dtype=np.float32)
+        self.phash = np.zeros((0, PHASH_BITS), dtype=np.uint8)
+        self.texture = np.zeros((0, 6), dtype=np.float32)
+        self.texture_mean = np.zeros(6, dtype=np.float32)
+        self.texture_std = np.ones(6, dtype=np.float32)
+        self.built_at = 0.0
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.slugs)
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            data = np.load(self.path)
+            self.slugs = [str(s) for s in data["slugs"]]
+            self.kinds = [str(k) for k in data["kinds"]]
+            self.hist = data["hist"].astype(np.float32)
+            self.phash = data["phash"].astype(np.uint8)
+            self.texture = data["texture"].astype(np.float32)
+            self.texture_mean = data["texture_mean"].astype(np.float32)
+            self.texture_std = data["texture_std"].astype(np.float32)
+            self.built_at = float(data["built_at"])
+            console.print(f"[dim]Visual index loaded: {len(self.slugs)} images[/dim]")
+        except Exception as e:
+            console.print(f"[red]Error loading visual index {self.path}: {e}[/red]")
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                slugs=np.array(self.slugs), kinds=np.array(self.kinds),
+                hist=self.hist, phash=self.phash, texture=self.texture,
+                texture_mean=self.texture_mean, texture_std=self.texture_std,
+                built_at=np.array(self.built_at)
+            )
+        tmp_path.replace(self.path)
+
+    def build(self, items: Iterable[Tuple[str, str, Callable[[], Optional[bytes]]]], workers: int = 8):
+        """
+        Строит индекс заново по (slug, kind, загрузчик байтов изображения).
+        Загрузка и расчет дескрипторов идут параллельно в пуле потоков.
+        """
+        started = time.time()
+
+        def safe_describe(item):
+            slug, kind, load = item
+            try:
+                content = load()
+                if not content:
+                    return None
+                img = PIL.Image.open(io.BytesIO(content))
+                img.load()
+                return slug, kind, describe(img)
+            except Exception as e:
+                console.print(f"[yellow]Skip {slug} ({kind}): {e}[/yellow]")
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rows = [r for r in executor.map(safe_describe, items) if r]
+
+        self.slugs = [r[0] for r in rows]
+        self.kinds = [r[1] for r in rows]
+        if rows:
+            self.hist = np.vstack([r[2][0] for r in rows])
+            self.phash = np.vstack([r[2][1] for r in rows])
+            self.texture = np.vstack([r[2][2] for r in rows])
+            self.texture_mean = self.texture.mean(axis=0)
+            self.texture_std = self.texture.std(axis=0)
+            self.texture_std[self.texture_std == 0] = 1.0
+        self.built_at = time.time()
+        self.save()
+        console.print(
+            f"[green]✓ Визуальный индекс: {len(rows)} изображений, {len(set(self.slugs))} товаров "
+            f"за {time.time() - started:.1f} сек: {self.path}[/green]"
+        )
+
+    def scores(self, img: PIL.Image.Image) -> np.ndarray:
+        """Похожесть запроса на каждую строку индекса (0..1)"""
+        hist, bits, texture = describe(img)
+        hist_sim = self.hist @ hist
+        phash_sim = 1.0 - (self.phash != bits).sum(axis=1) / PHASH_BITS
+        diff = (self.texture - texture) / self.texture_std
+        texture_sim = np.exp(-np.linalg.norm(diff, axis=1) / np.sqrt(diff.shape[1]))
+        return W_HIST * hist_sim + W_PHASH * phash_sim + W_TEXTURE * texture_sim
+
+    def search(self, img: PIL.Image.Image, n_results: int = 10) -> List[Dict]:
+        """Ближайшие товары: лучший балл среди изображений товара"""
+        if not self.slugs:
+            return []
+        started = time.perf_counter()
+        scores = self.scores(img)
+        best: Dict[str, Tuple[float, str]] = {}
+        for i in np.argsort(-scores):
+            slug = self.slugs[i]
+            if slug not in best:
+                best[slug] = (float(scores[i]), self.kinds[i])
+                if len(best) >= n_results:
+                    break
+        console.print(f"[dim]Visual search: {len(self.slugs)} images in {(time.perf_counter() - started) * 1000:.1f} ms[/dim]")
+        return [
+            {"slug": slug, "visual_score": round(score, 4), "visual_match": kind}
+            for slug, (score, kind) in best.items()
+        ]
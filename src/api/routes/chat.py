@@ -1,9 +1,13 @@
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
+import json
 from src.ai.consultant import Consultant
-from config.settings import DATA_DIR, PROJECT_ROOT
+from src.ai.image_preprocess import PreparedImage, prepare_base64_image
+from config.settings import PROJECT_ROOT
 from src.api.auth.jwt import get_current_user, require_auth
 
 router = APIRouter()
@@ -19,6 +23,34 @@ class ChatResponse(BaseModel):
     answer: str
     products: Optional[List[dict]] = []
 
+def _prepare_request_image(image: Optional[str]) -> Optional[PreparedImage]:
+    """Декодирует base64-изображение из запроса в памяти (без временных файлов).
+    Принимается только base64 или data URL — никаких путей на сервере."""
+    if not image:
+        return None
+    return prepare_base64_image(image)
+
+def _flatten_products(relevant_products: Optional[List[dict]]) -> List[dict]:
+    """Flatten product structure for frontend"""
+    flattened_products = []
+    for r in relevant_products or []:
+        # If it's already a flat dict, use it directly
+        if 'details' not in r:
+             flattened_products.append(r)
+             continue
+             
+        details = r.get('details', {})
+        flat_product = {
+            **details,
+            "slug": r.get('slug'),
+            "distance": r.get('distance'),
+            # "vision_confidence": r.get('vision_confidence'),
+        }
+        if 'details' in flat_product:
+            del flat_product['details']
+        flattened_products.append(flat_product)
+    return flattened_products
+
 @router.post("/", response_model=ChatResponse)
 async def chat(request: ChatRequest, user: Optional[dict] = Depends(get_current_user)):
     """
@@ -29,90 +61,97 @@ async def chat(request: ChatRequest, user: Optional[dict] = Depends(get_current_
         user_id = user.get("id") if user else "anonymous"
         
         # Handle image if provided
-        image_path = None
-        if request.image:
-            import base64
-            import uuid
-            import os
-            
-            # Create tmp dir if doesn't exist
-            tmp_dir = DATA_DIR / "tmp"
-            tmp_dir.mkdir(exist_ok=True)
-            
-            # Decode image
-            image_data = request.image
-            if "base64," in image_data:
-                image_data = image_data.split("base64,")[1]
-            
-            # Save to temporary file
-            image_path = tmp_dir / f"{uuid.uuid4()}.jpg"
-            with open(image_path, "wb") as f:
-                f.write(base64.b64decode(image_data))
-            
-            image_path = str(image_path)
+        try:
+            image = await run_in_threadpool(_prepare_request_image, request.image)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
 
-        consultant_result = consultant.answer(
+        consultant_result = await consultant.answer_async(
             request.query, 
-            image_path=image_path, 
+            image=image, 
             user_id=user_id,
             sources=request.sources
         )
         response_text = consultant_result.get("answer", "")
         
-        # Clean up temp image
-        if image_path and os.path.exists(image_path):
-            try:
-                # os.remove(image_path)
-                pass 
-            except Exception:
-                pass
-        
-        # Get relevant products for context to display them
         # Get relevant products for context to display them
-        relevant_products = consultant_result.get("products")
         # Fallback removed: only show products explicitly recommended by AI logic
-        
-        # Flatten product structure for frontend
-        flattened_products = []
-        for r in relevant_products:
-            # If it's already a flat dict, use it directly
-            if 'details' not in r:
-                 flattened_products.append(r)
-                 continue
-                 
-            details = r.get('details', {})
-            flat_product = {
-                **details,
-                "slug": r.get('slug'),
-                "distance": r.get('distance'),
-                # "vision_confidence": r.get('vision_confidence'),
-            }
-            if 'details' in flat_product:
-                del flat_product['details']
-            flattened_products.append(flat_product)
-        
         return {
             "answer": response_text,
-            "products": flattened_products
+            "products": _flatten_products(consultant_result.get("products"))
         }
             
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post("/stream")
+async def chat_stream(request: ChatRequest, user: Optional[dict] = Depends(get_current_user)):
+    """
+    Streaming chat (server-sent events):
+    products -> delta* -> final (или error)
+    """
+    user_id = user.get("id") if user else "anonymous"
+    try:
+        image = await run_in_threadpool(_prepare_request_image, request.image)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+    def event_stream():
+        try:
+            for event, data in consultant.answer_stream(
+                request.query,
+                image=image,
+                user_id=user_id,
+                sources=request.sources
+            ):
+                if event == "products":
+                    yield _sse("products", {"products": _flatten_products(data["products"])})
+                elif event == "final":
+                    products = _flatten_products(data["products"])
+                    yield _sse("final", {
+                        "answer": data["answer"],
+                        "products": products,
+                        "recommended_slugs": [p.get("slug") for p in products if p.get("slug")]
+                    })
+                else:
+                    yield _sse(event, data)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield _sse("error", {"detail": str(e)})
+
+    # Синхронный генератор Starlette гоняет в threadpool, event loop не блокируется
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/history/", response_model=List[dict])
-async def get_history(user: Optional[dict] = Depends(get_current_user)):
+async def get_history(
+    limit: int = Query(50, ge=1, le=200),
+    before_id: Optional[int] = Query(None, description="Load messages older than this message id"),
+    user: Optional[dict] = Depends(get_current_user)
+):
     """
     Get chat history for the authenticated user.
+    Paginated: pass the smallest returned id as before_id to load older messages.
     """
     user_id = user.get("id") if user else "anonymous"
-    raw_history = consultant.storage.get_history(user_id, limit=50)
+    raw_history = await run_in_threadpool(consultant.storage.get_history, user_id, limit=limit, before_id=before_id)
     
     # Format for frontend: role, content, products (enriched from slugs)
     formatted = []
     for item in raw_history:
         msg = {
+            "id": item["id"],
             "role": "user" if item["role"] == "user" else "assistant",
             "content": item["parts"][0] if item["parts"] else ""
         }
@@ -136,3 +175,27 @@ async def get_history(user: Optional[dict] = Depends(get_current_user)):
         formatted.append(msg)
     return formatted
 
+
+@router.get("/router-stats/")
+async def get_router_stats(user: dict = Depends(require_auth)):
+    """Доля запросов, обслуженных быстрым путем (артикул/название) без векторного поиска и LLM"""
+    return consultant.router.stats()
+
+@router.get("/session-stats/")
+async def get_session_stats(user: dict = Depends(require_auth)):
+    """Переиспользование живых чат-сессий"""
+    if consultant.sessions is None:
+        return {"enabled": False}
+    return {"enabled": True, **consultant.sessions.stats()}
+
+@router.get("/filter-stats/")
+async def get_filter_stats(user: dict = Depends(require_auth)):
+    """Частота срабатывания локального извлечения фильтров и среднее время"""
+    return consultant.filter_extractor.stats()
+
+@router.get("/answer-cache-stats/")
+async def get_answer_cache_stats(user: dict = Depends(require_auth)):
+    """Метрики семантического кэша ответов (если включен ANSWER_CACHE_ENABLED)"""
+    if consultant.answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **consultant.answer_cache.stats()}
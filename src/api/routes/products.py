@@ -7,12 +7,13 @@ import json
 import os
 from config.settings import DATA_DIR, PRODUCTS_JSON_PATH, HTTPX_VERIFY_SSL
 from src.ai.embeddings import BrickEmbeddings
+from src.ai.similar_products import SimilarProducts
 from pydantic import BaseModel
 from slugify import slugify
 import ipaddress
 import socket
 from urllib.parse import urlparse
-from src.api.auth.jwt import get_current_user
+from src.api.auth.jwt import get_current_user, require_auth
 from src.api.services.catalog_sync import sync_woocommerce_catalog, get_sync_status
 
 router = APIRouter()
@@ -216,6 +217,16 @@ catalog_dict = {p['slug']: p for p in catalog_data if p.get('slug')}
 # Initialize embeddings for search
 embeddings = BrickEmbeddings()
 
+# Precomputed "similar products" graph (built by scripts/build_similar_products.py)
+similar_products = SimilarProducts()
+
+def _refresh_similar(slugs: List[str]):
+    """Incrementally update the similar-products graph after an upsert (runs as a background task)."""
+    try:
+        similar_products.update(embeddings, slugs)
+    except Exception as e:
+        print(f"Failed to update similar products for {slugs}: {e}")
+
 @router.get("/sources/", response_model=List[dict])
 async def get_sources(user: Optional[dict] = Depends(get_current_user)):
     """List all available product sources (shared + user's custom)"""
@@ -244,6 +255,7 @@ async def get_sources(user: Optional[dict] = Depends(get_current_user)):
 
 @router.post("/import/", response_model=ImportStatus)
 async def import_catalog(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     name: str = Form(...),
     user: dict = Depends(get_current_user)
@@ -283,8 +295,10 @@ async def import_catalog(
         catalog_data = get_catalog()
         catalog_dict = {p['slug']: p for p in catalog_data if p.get('slug')}
         
-        # 2. Re-index embeddings
-        embeddings.index_catalog(products_list=catalog_data, force_reindex=False)
+        # 2. Re-sync only this source's partition
+        source_products = [p for p in catalog_data if p.get('source') == source_id]
+        embeddings.sync_products(source_products, source=source_id)
+        background_tasks.add_task(_refresh_similar, [p['slug'] for p in source_products])
         
         return ImportStatus(status="success", message=f"Каталог '{name}' успешно импортирован", source_id=source_id)
         
@@ -328,8 +342,10 @@ async def delete_source(source_id: str, user: dict = Depends(get_current_user)):
         catalog_data = get_catalog()
         catalog_dict = {p['slug']: p for p in catalog_data if p.get('slug')}
         
-        # 2. Re-index embeddings to remove deleted items
-        embeddings.index_catalog(products_list=catalog_data, force_reindex=False)
+        # 2. Drop this source's partition from embeddings
+        source_slugs = list(embeddings.partitions.ids_for(source_id))
+        embeddings.delete_by_source(source_id)
+        similar_products.remove(source_slugs)
         
         return ImportStatus(status="success", message=f"Источник '{source_id}' успешно удален", source_id=source_id)
     except Exception as e:
@@ -389,7 +405,9 @@ async def rename_source(source_id: str, request: RenameSourceRequest, user: dict
         catalog_data = get_catalog()
         catalog_dict = {p['slug']: p for p in catalog_data if p.get('slug')}
         
-        embeddings.index_catalog(products_list=catalog_data, force_reindex=False)
+        # 2. Move the partition to the new source id (metadata only, no re-embedding)
+        if new_id != source_id:
+            embeddings.rename_source(source_id, new_id)
         
         return ImportStatus(status="success", message=f"Источник переименован в '{request.name}'", source_id=new_id)
     except Exception as e:
@@ -400,7 +418,7 @@ class UpdatePriceRequest(BaseModel):
     currency: str = "EUR"
 
 @router.put("/{slug}/price")
-async def update_price(slug: str, request: UpdatePriceRequest, user: dict = Depends(get_current_user)):
+async def update_price(slug: str, request: UpdatePriceRequest, background_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
     """Update price for a specific product"""
     if not user or not user.get("id"):
         raise HTTPException(status_code=401, detail="Authentication required")
@@ -468,6 +486,7 @@ async def update_price(slug: str, request: UpdatePriceRequest, user: dict = Depe
             
         # Re-index specific item
         embeddings.index_product(product)
+        background_tasks.add_task(_refresh_similar, [slug])
         
         return {"status": "success", "message": "Price updated", "product": product}
         
@@ -482,7 +501,7 @@ class UpdateTitleRequest(BaseModel):
 
 
 @router.put("/{slug}/title")
-async def update_title(slug: str, request: UpdateTitleRequest, user: dict = Depends(get_current_user)):
+async def update_title(slug: str, request: UpdateTitleRequest, background_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
     """Update title for a specific product"""
     if not user or not user.get("id"):
         raise HTTPException(status_code=401, detail="Authentication required")
@@ -548,6 +567,7 @@ async def update_title(slug: str, request: UpdateTitleRequest, user: dict = Depe
             
         # Re-index specific item
         embeddings.index_product(product)
+        background_tasks.add_task(_refresh_similar, [slug])
         
         return {"status": "success", "message": "Title updated", "title": new_title}
         
@@ -623,6 +643,7 @@ async def delete_product(slug: str, user: dict = Depends(get_current_user)):
             
         # Delete from embeddings
         embeddings.delete_product(slug)
+        similar_products.remove([slug])
         
         return {"status": "success", "message": "Product deleted"}
         
@@ -908,6 +929,37 @@ async def get_categories(source: str = 'catalog', brand: Optional[str] = None):
         res.append({"id": c, "name": c})
     return res
 
+@router.get("/{slug}/similar", response_model=List[dict])
+async def get_similar_products(
+    slug: str,
+    limit: int = Query(10, ge=1, le=50),
+    source: Optional[str] = None,
+    brand: Optional[str] = None
+):
+    """
+    "More like this": neighbours from the precomputed graph, no remote calls.
+    """
+    neighbours = similar_products.get(slug)
+    if not neighbours and slug not in catalog_dict:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    allowed_sources = set(source.split(',')) if source and source != 'all' else None
+    brand_lower = brand.lower() if brand and brand != 'all' else None
+    
+    results = []
+    for neighbour_slug, score in neighbours:
+        product = catalog_dict.get(neighbour_slug)
+        if not product:
+            continue
+        if allowed_sources and product.get('source', 'catalog') not in allowed_sources:
+            continue
+        if brand_lower and (product.get('brand') or '').lower() != brand_lower:
+            continue
+        results.append({**product, "similarity": score})
+        if len(results) >= limit:
+            break
+    return results
+
 @router.get("/{slug}/", response_model=dict)
 async def get_product(slug: str):
     product = catalog_dict.get(slug)
@@ -944,6 +996,13 @@ async def sync_woocommerce_status(user: dict = Depends(get_current_user)):
     """
     return get_sync_status()
 
+@router.get("/search-cache/stats")
+async def search_cache_stats(user: dict = Depends(require_auth)):
+    """
+    Hit ratio and entry count of the vector search result cache (for tuning SEARCH_CACHE_SIZE).
+    """
+    return embeddings.cache_stats()
+
 @router.get("/proxy-image")
 async def proxy_image(url: str = Query(..., description="The URL of the external image")):
     """
@@ -1,58 +1,169 @@
-
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Response, Depends
+from fastapi.responses import StreamingResponse
+from typing import Dict, List
+import asyncio
+import json
+from starlette.concurrency import run_in_threadpool
 from src.ai.image_search import ImageSearch
-import shutil
-import tempfile
-from pathlib import Path
+from src.ai.image_preprocess import prepare_image
+from src.ai.search_cache import SearchTokenStore
+from src.api.auth.jwt import require_auth
+from config.settings import IMAGE_SEARCH_TOKEN_TTL, IMAGE_SEARCH_TOKEN_MAX, IMAGE_BATCH_MAX_FILES
 
 router = APIRouter()
 searcher = ImageSearch()
+# Ранжированный пул кандидатов по токену: следующие страницы без повторного анализа
+search_tokens = SearchTokenStore(maxsize=IMAGE_SEARCH_TOKEN_MAX, ttl=IMAGE_SEARCH_TOKEN_TTL)
+
+
+def _clean_results(results: List[dict]) -> List[dict]:
+    """Clean up results to be JSON serializable and flattened for frontend"""
+    cleaned_results = []
+    for r in results:
+        product_data = r.get("product", {})
+
+        # Merge product data into top level
+        cleaned_r = {
+            **product_data,
+            "slug": r.get("slug"),
+            "distance": r.get("distance"),
+            # Keep analysis for frontend to display match info
+            "analysis": r.get("analysis"),
+            "vision_confidence": r.get("vision_confidence"),
+            "visual_score": r.get("visual_score")
+        }
+
+        # Remove internal objects that might not be serializable or duplicate
+        if "details" in cleaned_r:
+            del cleaned_r["details"]
+        if "product" in cleaned_r:
+            del cleaned_r["product"]
+
+        cleaned_results.append(cleaned_r)
+    return cleaned_results
+
 
 @router.post("/", response_model=List[dict])
-async def search_by_image(file: UploadFile = File(...)):
+async def search_by_image(
+    response: Response,
+    file: UploadFile = File(...),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(30, ge=1, le=200)
+):
     """
     Search for products by uploading an image.
+    Returns the first page; X-Search-Token and X-Total-Count headers allow
+    fetching further pages via GET /api/search/{token}.
     """
     try:
-        # Save uploaded file to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = Path(tmp.name)
-        
+        # Decode and downscale the upload once, in memory (no temp file)
         try:
-            # Perform search
-            results = searcher.search_by_image(tmp_path, n_results=30)
-            
-            # Clean up results to be JSON serializable and flattened for frontend
-            cleaned_results = []
-            for r in results:
-                product_data = r.get("product", {})
-                
-                # Merge product data into top level
-                cleaned_r = {
-                    **product_data,
-                    "slug": r.get("slug"),
-                    "distance": r.get("distance"),
-                    # Keep analysis for frontend to display match info
-                    "analysis": r.get("analysis"),
-                    "vision_confidence": r.get("vision_confidence")
-                }
-                
-                # Remove internal objects that might not be serializable or duplicate
-                if "details" in cleaned_r:
-                    del cleaned_r["details"]
-                if "product" in cleaned_r:
-                    del cleaned_r["product"]
-                
-                cleaned_results.append(cleaned_r)
-                
-            return cleaned_results
-            
-        finally:
-            # Clean up temp file
-            if tmp_path.exists():
-                tmp_path.unlink()
-                
+            image = await run_in_threadpool(prepare_image, await file.read())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+        # Perform search over the whole candidate pool
+        results = _clean_results(await run_in_threadpool(searcher.search_by_image, image, n_results=None))
+
+        token = search_tokens.put(results, image_sha256=image.sha256)
+        response.headers["X-Search-Token"] = token
+        response.headers["X-Total-Count"] = str(len(results))
+        return results[offset:offset + limit]
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _merge_results(per_image: List[Dict], limit: int) -> List[dict]:
+    """Deduplicate products across images, ranked by summed similarity (1 - distance)"""
+    merged: Dict[str, dict] = {}
+    for item in per_image:
+        for product in item["products"]:
+            slug = product.get("slug")
+            if not slug:
+                continue
+            score = 1 - product["distance"] if product.get("distance") is not None else 0.0
+            entry = merged.get(slug)
+            if entry is None:
+                entry = merged[slug] = {**product, "aggregate_score": 0.0, "matched_images": []}
+            entry["aggregate_score"] += score
+            entry["matched_images"].append(item["index"])
+    ranked = sorted(merged.values(), key=lambda p: -p["aggregate_score"])
+    for p in ranked:
+        p["aggregate_score"] = round(p["aggregate_score"], 4)
+    return ranked[:limit]
+
+
+@router.post("/batch")
+async def search_batch(
+    files: List[UploadFile] = File(...),
+    limit: int = Query(10, ge=1, le=50, description="Results per image"),
+    merged_limit: int = Query(50, ge=1, le=200)
+):
+    """
+    Search by several images at once (server-sent events):
+    image (one per photo, as soon as it is done) -> merged -> done.
+    Pipelines run concurrently; Gemini calls share a global concurrency cap.
+    """
+    if len(files) > IMAGE_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many images (max {IMAGE_BATCH_MAX_FILES})")
+    uploads = [(f.filename, await f.read()) for f in files]
+
+    async def run_one(index: int, filename: str, content: bytes) -> Dict:
+        try:
+            image = await run_in_threadpool(prepare_image, content)
+            results = await run_in_threadpool(searcher.search_by_image, image, n_results=limit)
+            return {"index": index, "filename": filename, "products": _clean_results(results)}
+        except Exception as e:
+            return {"index": index, "filename": filename, "products": [], "error": str(e)}
+
+    async def event_stream():
+        tasks = [asyncio.create_task(run_one(i, name, content)) for i, (name, content) in enumerate(uploads)]
+        per_image = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                per_image.append(item)
+                yield _sse("image", item)
+            yield _sse("merged", {"products": _merge_results(per_image, merged_limit)})
+            yield _sse("done", {"images": len(per_image), "failed": sum(1 for i in per_image if i.get("error"))})
+        finally:
+            # Client disconnected: drop pipelines that have not finished
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/analysis-cache-stats/")
+async def get_analysis_cache_stats(user: dict = Depends(require_auth)):
+    """Hit rate of the vision analysis cache"""
+    if searcher.analysis_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **searcher.analysis_cache.stats()}
+
+
+@router.get("/{token}", response_model=List[dict])
+async def get_search_page(
+    token: str,
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(30, ge=1, le=200)
+):
+    """Another page of a previous image search (no new vision analysis)"""
+    entry = search_tokens.get(token)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Search token expired or not found")
+    response.headers["X-Search-Token"] = token
+    response.headers["X-Total-Count"] = str(len(entry["results"]))
+    return entry["results"][offset:offset + limit]
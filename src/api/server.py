@@ -28,6 +28,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Пагинация поиска по фото
+    expose_headers=["X-Search-Token", "X-Total-Count"],
 )
 
 # Include routers
@@ -1,22 +1,18 @@
 import requests
-import json
 import logging
 import time
 from requests.auth import HTTPBasicAuth
-from pathlib import Path
 from typing import List, Dict, Any
 
 # Configuration
 from config.settings import WC_CONSUMER_KEY, WC_CONSUMER_SECRET, WC_BASE_URL
-from src.api.services.woocommerce import normalize_wc_product
+from src.api.services.woocommerce import WC_CATALOG_PATH, write_wc_catalog
 
 logger = logging.getLogger(__name__)
 
-# Use absolute path relative to project root if possible, or reliable relative path
-# Assuming this file is in src/api/services, data is in ../../../data
-# Better to use a constant from settings or strictly defined path
-DATA_DIR = Path("data/processed")
-OUTPUT_FILE = DATA_DIR / "wc_catalog.json"
+# Canonical catalog shared with scripts/sync_wc_data.py (absolute path from settings,
+# independent of the working directory)
+OUTPUT_FILE = WC_CATALOG_PATH
 
 # ... imports
 
@@ -114,23 +110,9 @@ def save_catalog(products: List[Dict[str, Any]]):
     _sync_status.status = "saving"
     _sync_status.message = "Сохранение и нормализация..."
     
-    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
-    
-    normalized = []
-    error_count = 0
-    
-    for p in products:
-        try:
-            norm = normalize_wc_product(p)
-            normalized.append(norm)
-        except Exception as e:
-            logger.error(f"Error normalizing product {p.get('id')}: {e}")
-            error_count += 1
-            
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(normalized, f, ensure_ascii=False, indent=2)
+    saved, error_count = write_wc_catalog(products, path=OUTPUT_FILE)
         
-    logger.info(f"Saved {len(normalized)} products to {OUTPUT_FILE}. Errors: {error_count}")
+    logger.info(f"Saved {saved} products to {OUTPUT_FILE}. Errors: {error_count}")
 
 def sync_woocommerce_catalog():
     """
@@ -1,15 +1,26 @@
 import requests
 from requests.auth import HTTPBasicAuth
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 import time
 import json
 import hashlib
+import logging
+import threading
 from pathlib import Path
 import os
 
 from config.settings import WC_CONSUMER_KEY, WC_CONSUMER_SECRET, WC_BASE_URL, DATA_DIR
 
+logger = logging.getLogger(__name__)
+
 BASE_URL = WC_BASE_URL
+DEFAULT_BRAND = "De-co-de"
+
+# Canonical synced catalog: normalized products + raw filter fields under "_wc".
+# Written by catalog_sync.save_catalog and scripts/sync_wc_data.py.
+WC_CATALOG_PATH = DATA_DIR / "processed" / "wc_catalog.json"
+# Old raw dump of scripts/sync_wc_data.py (no longer read)
+LEGACY_FULL_CACHE_PATH = DATA_DIR / "wc_full_cache.json"
 
 # Disk-based cache configuration
 CACHE_DIR = DATA_DIR / "cache" / "woocommerce"
@@ -61,10 +72,10 @@ def normalize_wc_product(wc_product: dict) -> dict:
     images = [img['src'] for img in wc_product.get('images', [])]
     
     # Extract brand (check taxonomy 'brands' first, then attributes)
-    brand = "De-co-de"
+    brand = DEFAULT_BRAND
     wc_brands = wc_product.get('brands', [])
     if wc_brands and isinstance(wc_brands, list) and len(wc_brands) > 0:
-        brand = wc_brands[0].get('name', "De-co-de")
+        brand = wc_brands[0].get('name') or DEFAULT_BRAND
     else:
         # Check attributes for brand-like fields
         found_brand = False
@@ -140,6 +151,77 @@ def normalize_wc_product(wc_product: dict) -> dict:
         "stock_status": wc_product.get('stock_status', 'instock')
     }
 
+def _price_value(price: str) -> float:
+    try:
+        return float(str(price).replace(' EUR', '').strip() or 0)
+    except ValueError:
+        return 0.0
+
+def build_wc_catalog_entry(wc_product: dict, brands_map: Optional[Dict[int, str]] = None) -> dict:
+    """Normalized product plus the raw fields the catalog filters need (under "_wc")."""
+    brands = [
+        {"id": b.get('id'), "name": b.get('name') or (brands_map or {}).get(b.get('id'), '')}
+        for b in wc_product.get('brands') or [] if isinstance(b, dict)
+    ]
+    product = normalize_wc_product({**wc_product, "brands": brands})
+    product["_wc"] = {
+        "id": wc_product.get('id'),
+        "sku": wc_product.get('sku') or '',
+        "categories": [
+            {"id": c.get('id'), "slug": c.get('slug'), "name": c.get('name', '')}
+            for c in wc_product.get('categories', [])
+        ],
+        "brands": brands,
+        "price": _price_value(product["parameters"]["Цена"])
+    }
+    return product
+
+def write_wc_catalog(wc_products: List[dict], brands_map: Optional[Dict[int, str]] = None, path: Path = WC_CATALOG_PATH) -> Tuple[int, int]:
+    """Normalize raw WooCommerce products once and atomically write the canonical catalog.
+    Returns (saved, errors)."""
+    catalog = []
+    errors = 0
+    for p in wc_products:
+        try:
+            catalog.append(build_wc_catalog_entry(p, brands_map))
+        except Exception as e:
+            logger.error(f"Error normalizing product {p.get('id')}: {e}")
+            errors += 1
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(path)
+    return len(catalog), errors
+
+_catalog_lock = threading.Lock()
+_catalog_memo = {"key": None, "products": []}
+
+def load_wc_catalog() -> List[dict]:
+    """Canonical catalog, re-read only when the file changes (mtime/size)."""
+    try:
+        stat = WC_CATALOG_PATH.stat()
+    except OSError:
+        if LEGACY_FULL_CACHE_PATH.exists() and _catalog_memo["key"] != "legacy":
+            _catalog_memo["key"] = "legacy"
+            print(f"{LEGACY_FULL_CACHE_PATH} is no longer used, re-run scripts/sync_wc_data.py")
+        return []
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _catalog_lock:
+        if _catalog_memo["key"] != key:
+            try:
+                with open(WC_CATALOG_PATH, 'r', encoding='utf-8') as f:
+                    _catalog_memo["products"] = json.load(f)
+                _catalog_memo["key"] = key
+            except Exception as e:
+                print(f"Error reading WC catalog: {e}")
+                return []
+        return _catalog_memo["products"]
+
+def _public(product: dict) -> dict:
+    return {k: v for k, v in product.items() if k != '_wc'}
+
 def get_brand_id_by_name(name: str) -> Optional[int]:
     """Resolve brand name to WooCommerce taxonomy ID."""
     brands = fetch_wc_brands()
@@ -174,37 +256,15 @@ def fetch_wc_products(page: int = 1, limit: int = 20, query: Optional[str] = Non
         "page": page,
         "status": "publish"
     }
-    # Try to load from FULL CACHE first
-    full_cache_path = DATA_DIR / "wc_full_cache.json"
-    normalized_cache_path = DATA_DIR / "processed" / "wc_catalog.json"
-    
-    all_items = []
-    is_normalized = False
-    
-    if full_cache_path.exists():
-        try:
-            with open(full_cache_path, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-                all_items = cache_data.get('products', [])
-                is_normalized = False
-        except Exception as e:
-            print(f"Error reading local WC raw cache: {e}")
-    
-    # Fallback to normalized catalog if raw cache is missing
-    if not all_items and normalized_cache_path.exists():
-        try:
-            with open(normalized_cache_path, 'r', encoding='utf-8') as f:
-                all_items = json.load(f)
-                is_normalized = True
-        except Exception as e:
-            print(f"Error reading normalized WC catalog: {e}")
+    # Local synced catalog first: already normalized, filtered in Python
+    all_items = load_wc_catalog()
 
     if all_items:
         try:
             # Filter in Python
             filtered_items = []
             
-            # Resolve Brand ID if needed for raw items
+            # Resolve Brand ID if needed
             target_brand_id = None
             if brand and brand != 'all':
                 if brand.isdigit():
@@ -216,62 +276,49 @@ def fetch_wc_products(page: int = 1, limit: int = 20, query: Optional[str] = Non
             
             brand_query_lower = brand.lower() if brand and brand != 'all' else None
 
+            # If category is a numeric ID, resolve it to a name once
+            category_name_for_matching = None
+            if category and category != 'all':
+                category_name_for_matching = category.lower()
+                if category.isdigit():
+                    for wc_cat in fetch_wc_categories():  # Uses cache
+                        if str(wc_cat.get('id')) == category:
+                            category_name_for_matching = wc_cat.get('name', '').lower()
+                            break
+
+            q_str = query.lower() if query else None
+
             # Filtering Loop
             for p in all_items:
+                wc = p.get('_wc', {})
+
                 # 1. Search Query
-                if query:
-                    q_str = query.lower()
-                    if q_str not in p.get('name', '').lower() and q_str not in p.get('sku', '').lower():
+                if q_str:
+                    if q_str not in (p.get('name') or '').lower() and q_str not in wc.get('sku', '').lower():
                         continue
                 
-                # 2. Category (Basic check, might need strict ID check depending on data)
-                if category and category != 'all':
-                    # Support normalized data that has 'category' as a string field
-                    p_category_str = p.get('category', '').lower()
-                    category_lower = category.lower()
-                    
-                    # If category is a numeric ID, try to resolve it to a name
-                    category_name_for_matching = category_lower
-                    if category.isdigit():
-                        # Lookup category name from WC categories cache
-                        wc_cats = fetch_wc_categories()  # Uses cache
-                        for wc_cat in wc_cats:
-                            if str(wc_cat.get('id')) == category:
-                                category_name_for_matching = wc_cat.get('name', '').lower()
-                                break
-                    
+                # 2. Category
+                if category_name_for_matching is not None:
                     # First try to match against the normalized 'category' string
-                    if p_category_str and category_name_for_matching in p_category_str:
-                        pass  # Match found, continue processing
-                    else:
-                        # Check if category ID, Slug, or Name matches in categories array
-                        # p['categories'] is list of dicts {id, name, slug}
-                        cats = p.get('categories', [])
-                        match = False
-                        for c in cats:
-                            if (str(c.get('id')) == category or 
-                                c.get('slug') == category or
-                                c.get('name', '').lower() == category_name_for_matching):
-                                match = True
-                                break
-                        if not match:
+                    p_category_str = (p.get('category') or '').lower()
+                    if not (p_category_str and category_name_for_matching in p_category_str):
+                        # Check if category ID, Slug, or Name matches in raw categories
+                        if not any(
+                            str(c.get('id')) == category or
+                            c.get('slug') == category or
+                            (c.get('name') or '').lower() == category_name_for_matching
+                            for c in wc.get('categories', [])
+                        ):
                             continue
 
                 # 3. Brand
-                if brand and brand != 'all':
-                    # Support both raw WooCommerce 'brands' field and normalized 'brand' field
-                    p_brands = p.get('brands', [])
-                    p_brand_name = p.get('brand', '') # from normalized data
-                    
-                    found_brand = False
-                    if target_brand_id and any(b.get('id') == target_brand_id for b in p_brands):
-                         found_brand = True
-                    elif brand_query_lower and p_brand_name.lower() == brand_query_lower:
-                         found_brand = True
-                    # Also check if brand name matches in brands list
-                    elif brand_query_lower and any(b.get('name', '').lower() == brand_query_lower for b in p_brands):
-                         found_brand = True
-                         
+                if brand_query_lower:
+                    p_brands = wc.get('brands', [])
+                    found_brand = (
+                        (target_brand_id and any(b.get('id') == target_brand_id for b in p_brands)) or
+                        (p.get('brand') or '').lower() == brand_query_lower or
+                        any((b.get('name') or '').lower() == brand_query_lower for b in p_brands)
+                    )
                     if not found_brand:
                         continue
                 
@@ -281,17 +328,14 @@ def fetch_wc_products(page: int = 1, limit: int = 20, query: Optional[str] = Non
                      if p_status != stock_status:
                          continue
 
-                if is_normalized:
-                    filtered_items.append(p)
-                else:
-                    filtered_items.append(normalize_wc_product(p))
+                filtered_items.append(p)
             
-            # Sorting
+            # Sorting (price parsed at sync time)
             if sort:
                 if sort == 'price_asc':
-                    filtered_items.sort(key=lambda x: float(x.get('parameters', {}).get('Цена', '0').replace(' EUR', '') or 0))
+                    filtered_items.sort(key=lambda x: x.get('_wc', {}).get('price', 0.0))
                 elif sort == 'price_desc':
-                    filtered_items.sort(key=lambda x: float(x.get('parameters', {}).get('Цена', '0').replace(' EUR', '') or 0), reverse=True)
+                    filtered_items.sort(key=lambda x: x.get('_wc', {}).get('price', 0.0), reverse=True)
                 elif sort == 'date_desc':
                     pass # Assuming already sorted by date or complex logic needed
             
@@ -299,12 +343,12 @@ def fetch_wc_products(page: int = 1, limit: int = 20, query: Optional[str] = Non
             total_items = len(filtered_items)
             start = (page - 1) * limit
             end = start + limit
-            page_slice = filtered_items[start:end]
+            page_slice = [_public(p) for p in filtered_items[start:end]]
             
             return page_slice, total_items
 
         except Exception as e:
-            print(f"Error reading local WC cache: {e}. Falling back to API.")
+            print(f"Error reading local WC catalog: {e}. Falling back to API.")
 
     # FALLBACK TO REMOTE API (Old Logic)
     
@@ -460,33 +504,22 @@ def fetch_all_wc_products() -> List[dict]:
     return all_products
 
 def get_active_wc_brands() -> List[dict]:
-    """Get brands that actually exist in the cached products."""
-    full_cache_path = DATA_DIR / "wc_full_cache.json"
-    if full_cache_path.exists():
-        try:
-            with open(full_cache_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                products = data.get('products', [])
-            
-            active_brands = set()
-            for p in products:
-                # Check 'brands' list
-                for b in p.get('brands', []):
-                    if b.get('name'):
-                        active_brands.add(b['name'])
-                
-                # Also check attributes if brands are missing there
-                if not p.get('brands') and p.get('attributes'):
-                     for a in p['attributes']:
-                         if 'brand' in a.get('name', '').lower():
-                             for opt in a.get('options', []):
-                                 active_brands.add(opt)
-
-            return [{"id": b, "name": b} for b in sorted(list(active_brands))]
-        except Exception as e:
-            print(f"Error loading active brands from cache: {e}")
+    """Get brands that actually exist in the synced catalog."""
+    products = load_wc_catalog()
+    if products:
+        active_brands = set()
+        for p in products:
+            wc_brands = p.get('_wc', {}).get('brands', [])
+            for b in wc_brands:
+                if b.get('name'):
+                    active_brands.add(b['name'])
+            # Brand taken from attributes/meta when the taxonomy is empty
+            if not wc_brands and p.get('brand') and p['brand'] != DEFAULT_BRAND:
+                active_brands.add(p['brand'])
+
+        return [{"id": b, "name": b} for b in sorted(active_brands)]
             
-    # Fallback to fetching all definitions if cache missing
+    # Fallback to fetching all definitions if catalog missing
     return fetch_wc_brands()
 
 def fetch_wc_brands() -> List[dict]:
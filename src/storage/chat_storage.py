@@ -1,20 +1,51 @@
-
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Optional
+from queue import Queue, Empty
+from typing import List, Dict, Optional, Tuple
 import time
 import json
 
 class ChatStorage:
-    """Simple SQLite storage for chat history"""
-    
-    def __init__(self, db_path: Path):
+    """SQLite storage for chat history (WAL, pooled connections)"""
+
+    def __init__(self, db_path: Path, pool_size: int = 4):
         self.db_path = db_path
+        self.pool_size = pool_size
+        self._pool: "Queue[sqlite3.Connection]" = Queue()
+        self._created = 0
+        self._pool_lock = threading.Lock()
         self._init_db()
-        
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Берет соединение из пула (создает новое, пока пул не заполнен)"""
+        try:
+            conn = self._pool.get_nowait()
+        except Empty:
+            with self._pool_lock:
+                can_create = self._created < self.pool_size
+                if can_create:
+                    self._created += 1
+            conn = self._connect() if can_create else self._pool.get()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
     def _init_db(self):
         """Initialize database schema"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS messages (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -30,41 +61,118 @@ class ChatStorage:
             columns = [row[1] for row in cursor.fetchall()]
             if 'product_slugs' not in columns:
                 conn.execute("ALTER TABLE messages ADD COLUMN product_slugs TEXT")
-            conn.commit()
+            if 'token_count' not in columns:
+                conn.execute("ALTER TABLE messages ADD COLUMN token_count INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_user_ts ON messages(user_id, timestamp, id)")
             
+            # Running summary of older turns (history compaction)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversation_summaries (
+                    user_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    last_message_id INTEGER NOT NULL,
+                    token_count INTEGER,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+
     def add_message(self, user_id: str, role: str, content: str, product_slugs: Optional[List[str]] = None):
         """Add a message to history"""
-        slugs_json = json.dumps(product_slugs) if product_slugs else None
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                "INSERT INTO messages (user_id, role, content, timestamp, product_slugs) VALUES (?, ?, ?, ?, ?)",
-                (str(user_id), role, content, time.time(), slugs_json)
-            )
-            conn.commit()
-            
-    def get_history(self, user_id: str, limit: int = 10) -> List[Dict]:
-        """Get recent chat history for a user"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "SELECT role, content, product_slugs FROM messages WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?",
-                (str(user_id), limit)
-            )
-            rows = cursor.fetchall()
-            
+        self.add_turn(user_id, [(role, content, product_slugs)])
+
+    def add_turn(self, user_id: str, messages: List[Tuple]) -> Optional[int]:
+        """
+        Add several messages in one transaction.
+        Each message is (role, content, product_slugs) or (role, content, product_slugs, token_count).
+        Returns the id of the last inserted message.
+        """
+        now = time.time()
+        rows = []
+        for message in messages:
+            role, content, product_slugs = message[:3]
+            token_count = message[3] if len(message) > 3 else None
+            rows.append((str(user_id), role, content, now, json.dumps(product_slugs) if product_slugs else None, token_count))
+        last_id = None
+        with self._connection() as conn:
+            with conn:
+                for row in rows:
+                    last_id = conn.execute(
+                        "INSERT INTO messages (user_id, role, content, timestamp, product_slugs, token_count) VALUES (?, ?, ?, ?, ?, ?)",
+                        row
+                    ).lastrowid
+        return last_id
+
+    def history_version(self, user_id: str) -> Tuple[Optional[int], Optional[int]]:
+        """(id of the last message, last summarized message id) — changes whenever the history does"""
+        with self._connection() as conn:
+            row = conn.execute(
+                """SELECT (SELECT MAX(id) FROM messages WHERE user_id = ?),
+                          (SELECT last_message_id FROM conversation_summaries WHERE user_id = ?)""",
+                (str(user_id), str(user_id))
+            ).fetchone()
+        return row[0], row[1]
+
+    def get_history(self, user_id: str, limit: int = 10, before_id: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        """
+        Get recent chat history for a user.
+        before_id — keyset pagination: only messages older than this message.
+        after_id — only messages newer than this message (e.g. not yet summarized).
+        """
+        query = "SELECT id, role, content, product_slugs, token_count FROM messages WHERE user_id = ?"
+        params: list = [str(user_id)]
+        if before_id is not None:
+            query += " AND (timestamp, id) < (SELECT timestamp, id FROM messages WHERE id = ?)"
+            params.append(before_id)
+        if after_id is not None:
+            query += " AND id > ?"
+            params.append(after_id)
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+
         # Return in chronological order (oldest first)
         history = []
         for row in rows[::-1]:
-            item = {"role": row[0], "parts": [row[1]]}
-            if row[2]:
+            item = {"id": row[0], "role": row[1], "parts": [row[2]], "token_count": row[4]}
+            if row[3]:
                 try:
-                    item["product_slugs"] = json.loads(row[2])
+                    item["product_slugs"] = json.loads(row[3])
                 except:
                     pass
             history.append(item)
         return history
 
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        """Running summary of the older part of the conversation"""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT summary, last_message_id, token_count, updated_at FROM conversation_summaries WHERE user_id = ?",
+                (str(user_id),)
+            ).fetchone()
+        if not row:
+            return None
+        return {"summary": row[0], "last_message_id": row[1], "token_count": row[2], "updated_at": row[3]}
+
+    def save_summary(self, user_id: str, summary: str, last_message_id: int, token_count: Optional[int] = None):
+        with self._connection() as conn:
+            with conn:
+                conn.execute(
+                    """INSERT INTO conversation_summaries (user_id, summary, last_message_id, token_count, updated_at)
+                       VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT(user_id) DO UPDATE SET
+                           summary = excluded.summary,
+                           last_message_id = excluded.last_message_id,
+                           token_count = excluded.token_count,
+                           updated_at = excluded.updated_at""",
+                    (str(user_id), summary, last_message_id, token_count, time.time())
+                )
+
     def clear_history(self, user_id: str):
         """Clear history for a user"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM messages WHERE user_id = ?", (str(user_id),))
-            conn.commit()
+        with self._connection() as conn:
+            with conn:
+                conn.execute("DELETE FROM messages WHERE user_id = ?", (str(user_id),))
+                conn.execute("DELETE FROM conversation_summaries WHERE user_id = ?", (str(user_id),))
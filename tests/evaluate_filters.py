@@ -0,0 +1,88 @@
+"""
+Скрипт для проверки извлечения категорий каталога и ценового диапазона из запроса (FilterExtractor)
+
+Работает офлайн на небольшом синтетическом каталоге: единственное и
+множественное число, прилагательные в разных формах, похожие категории.
+"""
+import sys
+from pathlib import Path
+
+CATALOG_CATEGORIES = [
+    "Обеденные столы", "Журнальные столики", "Диваны", "Кресла", "Стулья",
+    "Подвесные светильники", "Настольные лампы",
+]
+
+TEST_CASES = [
+    {"id": 1, "query": "обеденный стол из дуба", "expected": ["Обеденные столы"], "description": "Единственное число"},
+    {"id": 2, "query": "обеденные столы до 3000 евро", "expected": ["Обеденные столы"], "description": "Как в каталоге"},
+    {"id": 3, "query": "зеленый бархатный диван", "expected": ["Диваны"], "description": "Единственное число"},
+    {"id": 4, "query": "кожаное кресло", "expected": ["Кресла"], "description": "Средний род"},
+    {"id": 5, "query": "черный металлический стул", "expected": ["Стулья"], "description": "Стул -> стулья"},
+    {"id": 6, "query": "подвесной светильник для кухни", "expected": ["Подвесные светильники"], "description": "Прилагательное + существительное"},
+    {"id": 7, "query": "мраморный журнальный столик", "expected": ["Журнальные столики"], "description": "Не путать со столами"},
+    {"id": 8, "query": "настольная лампа", "expected": ["Настольные лампы"], "description": "Женский род"},
+    {"id": 9, "query": "диван и два кресла", "expected": ["Диваны", "Кресла"], "description": "Несколько категорий"},
+]
+
+# (min, max) цены: число без валюты считается ценой, только если похоже на цену
+PRICE_CASES = [
+    {"id": 1, "query": "обеденные столы до 3000 евро", "expected": (None, 3000.0), "description": "Валюта"},
+    {"id": 2, "query": "диван не дороже 2 тыс", "expected": (None, 2000.0), "description": "Тысячи"},
+    {"id": 3, "query": "кресло от 500", "expected": (500.0, None), "description": "Без валюты, но похоже на цену"},
+    {"id": 4, "query": "лампа до 90 €", "expected": (None, 90.0), "description": "Малая сумма с валютой"},
+    {"id": 5, "query": "диван до 3 мест", "expected": (None, None), "description": "Количество мест"},
+    {"id": 6, "query": "стулья до 2 штук", "expected": (None, None), "description": "Количество штук"},
+    {"id": 7, "query": "от 4 человек стол", "expected": (None, None), "description": "Количество человек"},
+    {"id": 8, "query": "до 5 лет гарантия", "expected": (None, None), "description": "Срок"},
+    {"id": 9, "query": "стол шириной до 200 см", "expected": (None, None), "description": "Размер"},
+    {"id": 10, "query": "до 3 кресел", "expected": (None, None), "description": "Малое число без валюты"},
+]
+
+
+def run_evaluation() -> bool:
+    project_root = Path(__file__).parent.parent
+    sys.path.insert(0, str(project_root))
+
+    from rich.console import Console
+    from rich.table import Table
+    from src.ai.filter_extractor import FilterExtractor, parse_price_constraint
+
+    console = Console()
+    catalog = {f"p{i}": {"slug": f"p{i}", "category": c} for i, c in enumerate(CATALOG_CATEGORIES)}
+    extractor = FilterExtractor(catalog)
+
+    table = Table(title="Категории каталога из запроса")
+    table.add_column("Запрос")
+    table.add_column("Ожидается")
+    table.add_column("Найдено")
+    table.add_column("OK", justify="center")
+
+    passed = 0
+    for test in TEST_CASES:
+        found = extractor.extract(test["query"]).catalog_categories
+        ok = sorted(found) == sorted(test["expected"])
+        passed += ok
+        table.add_row(test["query"], ", ".join(test["expected"]), ", ".join(found) or "-", "✓" if ok else "✗")
+
+    console.print(table)
+
+    price_table = Table(title="Ценовой диапазон из запроса")
+    price_table.add_column("Запрос")
+    price_table.add_column("Ожидается")
+    price_table.add_column("Найдено")
+    price_table.add_column("OK", justify="center")
+
+    for test in PRICE_CASES:
+        found = parse_price_constraint(test["query"])
+        ok = found == test["expected"]
+        passed += ok
+        price_table.add_row(test["query"], str(test["expected"]), str(found), "✓" if ok else "✗")
+
+    console.print(price_table)
+    total = len(TEST_CASES) + len(PRICE_CASES)
+    console.print(f"\nПройдено: {passed}/{total}")
+    return passed == total
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_evaluation() else 1)
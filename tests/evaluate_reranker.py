@@ -0,0 +1,124 @@
+"""
+Скрипт для оценки локального реранкера против прежнего обрезания top-5
+
+Для каждого запроса берутся 20 кандидатов векторного поиска (как в Consultant._retrieve)
+и сравниваются два top-5:
+- baseline: первые 5 по векторной дистанции
+- rerank: LocalReranker
+Метрики: доля товаров, удовлетворяющих ограничениям запроса (цвет/материал/категория/цена),
+precision@5 по разметке (если передан --labels) и время реранка.
+
+Разметка — JSON вида {"запрос": ["slug1", "slug2", ...]}.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+TEST_CASES = [
+    {"id": 1, "query": "белый диван в стиле минимализм", "description": "Цвет + категория"},
+    {"id": 2, "query": "подвесной светильник для кухни", "description": "Категория"},
+    {"id": 3, "query": "кожаное кресло коричневого цвета", "description": "Материал + цвет + категория"},
+    {"id": 4, "query": "обеденный стол из дуба до 3000 евро", "description": "Материал + категория + цена"},
+    {"id": 5, "query": "черный металлический стул", "description": "Цвет + материал + категория"},
+    {"id": 6, "query": "мраморный журнальный столик", "description": "Материал + категория"},
+    {"id": 7, "query": "зеленый бархатный диван", "description": "Цвет + материал + категория"},
+]
+
+
+def constraint_rate(reranker, parsed, products):
+    """Доля товаров без противоречий ограничениям запроса"""
+    if not products:
+        return 0.0
+    ok = 0
+    for p in products:
+        details = p.get('details') or {}
+        features = reranker._product_features(p['slug'], details)
+        con = reranker._constraint_score(parsed["constraints"], features["constraints"])
+        price = reranker._price_score(parsed, features["price"])
+        if con >= 0 and price >= 0:
+            ok += 1
+    return ok / len(products)
+
+
+def precision_at_5(products, relevant):
+    if not relevant:
+        return None
+    return sum(1 for p in products[:5] if p['slug'] in relevant) / 5
+
+
+def run_evaluation(labels_path=None):
+    project_root = Path(__file__).parent.parent
+    sys.path.insert(0, str(project_root))
+
+    from rich.console import Console
+    from rich.table import Table
+    from src.ai.consultant import Consultant
+
+    console = Console()
+    console.print("[bold blue]Оценка локального реранкера...[/bold blue]\n")
+
+    labels = {}
+    if labels_path:
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            labels = {q: set(slugs) for q, slugs in json.load(f).items()}
+
+    consultant = Consultant()
+    reranker = consultant.reranker
+
+    queries = [t["query"] for t in TEST_CASES] + [q for q in labels if q not in {t["query"] for t in TEST_CASES}]
+
+    table = Table(title="baseline top-5 vs LocalReranker")
+    table.add_column("Запрос")
+    table.add_column("Огранич. base", justify="right")
+    table.add_column("Огранич. rerank", justify="right")
+    table.add_column("P@5 base", justify="right")
+    table.add_column("P@5 rerank", justify="right")
+    table.add_column("Время, мс", justify="right")
+
+    totals = {"base": 0.0, "rerank": 0.0, "ms": 0.0}
+    for query in queries:
+        candidates = consultant.embeddings.search(query, n_results=20)
+        for c in candidates:
+            details = consultant._get_product_details(c['slug'])
+            if details:
+                c['details'] = details
+
+        parsed = reranker.parse_query(query)
+        baseline = candidates[:5]
+
+        start = time.perf_counter()
+        reranked = reranker.rerank(query, [dict(c) for c in candidates], top_n=5, parsed=parsed)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        base_rate = constraint_rate(reranker, parsed, baseline)
+        rerank_rate = constraint_rate(reranker, parsed, reranked)
+        base_p = precision_at_5(baseline, labels.get(query))
+        rerank_p = precision_at_5(reranked, labels.get(query))
+
+        totals["base"] += base_rate
+        totals["rerank"] += rerank_rate
+        totals["ms"] += elapsed
+
+        table.add_row(
+            query,
+            f"{base_rate:.2f}", f"{rerank_rate:.2f}",
+            "-" if base_p is None else f"{base_p:.2f}",
+            "-" if rerank_p is None else f"{rerank_p:.2f}",
+            f"{elapsed:.1f}"
+        )
+
+    console.print(table)
+    n = len(queries)
+    console.print(
+        f"\nСреднее соответствие ограничениям: baseline {totals['base'] / n:.2f}, "
+        f"rerank {totals['rerank'] / n:.2f}; среднее время реранка {totals['ms'] / n:.1f} мс"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", default=None, help="JSON с разметкой {запрос: [релевантные slug]}")
+    args = parser.parse_args()
+    run_evaluation(args.labels)
@@ -0,0 +1,57 @@
+"""
+Коллекция векторов изображений с локальным детерминированным эмбеддером:
+проиндексированное главное изображение товара находит свой же товар первым.
+"""
+
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+PIL_Image = pytest.importorskip("PIL.Image")
+pytest.importorskip("chromadb")
+pytest.importorskip("dotenv")
+
+
+def _image_bytes(pattern: str, size: int = 256) -> bytes:
+    y, x = np.mgrid[0:size, 0:size]
+    pixels = np.zeros((size, size, 3), dtype=np.uint8)
+    if pattern == "red_gradient":
+        pixels[..., 0] = 255
+        pixels[..., 1] = (x * 255 // size).astype(np.uint8)
+    elif pattern == "blue_checker":
+        pixels[..., 2] = np.where(((x // 32) + (y // 32)) % 2 == 0, 255, 40)
+    elif pattern == "green_stripes":
+        pixels[..., 1] = np.where((y // 8) % 2 == 0, 220, 60)
+    elif pattern == "gray_noise":
+        rng = np.random.default_rng(0)
+        pixels[:] = rng.integers(80, 180, size=(size, size, 1), dtype=np.uint8)
+    out = io.BytesIO()
+    PIL_Image.fromarray(pixels).save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def test_local_image_index_returns_own_product_first(tmp_path):
+    from src.ai.image_embeddings import ProductImageEmbeddings
+    from src.ai.image_preprocess import prepare_image
+    from src.ai.thumbnail_cache import ThumbnailCache
+
+    patterns = ["red_gradient", "blue_checker", "green_stripes", "gray_noise"]
+    images = {f"product-{p}": _image_bytes(p) for p in patterns}
+
+    # Миниатюры заранее в кэше: индексация без сети
+    thumbnails = ThumbnailCache(8 * 1024 * 1024)
+    products = []
+    for slug, content in images.items():
+        url = f"https://example.com/{slug}.jpg"
+        thumbnails.put(url, thumbnails.make_thumbnail(content))
+        products.append({"slug": slug, "name": slug, "main_image": url, "source": "test"})
+    products.append({"slug": "no-image", "name": "no image", "source": "test"})
+
+    index = ProductImageEmbeddings("local", persist_directory=str(tmp_path / "embeddings"), thumbnails=thumbnails)
+    index.index_catalog(products_list=products, checkpoint_path=tmp_path / "checkpoint.json")
+    assert index.collection.count() == len(images)
+
+    for slug, content in images.items():
+        results = index.search_image(prepare_image(content), n_results=len(images))
+        assert results[0]["slug"] == slug
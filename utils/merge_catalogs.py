@@ -23,7 +23,8 @@ def merge_catalogs():
     # 2. Load WooCommerce catalog
     if wc_json.exists():
         with open(wc_json, 'r', encoding='utf-8') as f:
-            wc_products = json.load(f)
+            # Raw WooCommerce filter fields (_wc) are only needed by the shop listing
+            wc_products = [{k: v for k, v in p.items() if k != '_wc'} for p in json.load(f)]
             full_catalog.extend(wc_products)
             print(f"Loaded {len(wc_products)} products from wc_catalog.json")
             